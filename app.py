@@ -11,6 +11,9 @@ from routes.main import main_bp
 from routes.conditions import conditions_bp
 from routes.search import search_bp
 from routes.admin import admin_bp
+from routes.metrics import metrics_bp
+from utils.query_profile import init_query_profiler
+from utils.metrics import init_metrics
 import json
 
 # Configure logging
@@ -23,7 +26,7 @@ app.config['DEBUG'] = True  # Enable debug mode
 
 # Configure uploads
 app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB per request; recordings upload in chunks
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Configure database
@@ -65,6 +68,12 @@ except Exception as e:
     logger.error(f"Database initialization failed: {str(e)}")
     raise
 
+# Per-request query counts and DB time, slow-query logging
+init_query_profiler(app)
+
+# Prometheus metrics, served at /metrics
+init_metrics(app)
+
 # Initialize Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -90,6 +99,7 @@ app.register_blueprint(patients_bp)
 app.register_blueprint(conditions_bp)
 app.register_blueprint(search_bp)
 app.register_blueprint(admin_bp)
+app.register_blueprint(metrics_bp)
 
 if __name__ == '__main__':
     with app.app_context():
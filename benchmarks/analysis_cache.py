@@ -0,0 +1,37 @@
+"""Show repeated transcript analyses being served from the analysis cache.
+
+Run from the repository root:
+
+    python -m benchmarks.analysis_cache
+"""
+import time
+from benchmarks.common import make_app
+from utils.fake_llm import FakeLLMClient
+from utils.llm import set_client
+from utils.analysis_cache import cache_stats
+from utils.ai_analysis import analyze_meat_criteria, extract_conditions, extract_prapare_data
+
+LATENCY = 0.5  # seconds per fake LLM call
+TRANSCRIPT = "Patient reports improved sleep and reduced cravings on buprenorphine."
+# Same content with different whitespace normalizes to the same key
+RETRY_TRANSCRIPT = "  Patient reports improved sleep and\nreduced cravings on buprenorphine. "
+
+def analyze_all(text, force_refresh=False):
+    analyze_meat_criteria(text, force_refresh=force_refresh)
+    extract_conditions(text, force_refresh=force_refresh)
+    extract_prapare_data(text, force_refresh=force_refresh)
+
+def main():
+    set_client(FakeLLMClient(latency=LATENCY))
+    app = make_app()
+    with app.app_context():
+        for label, text, force in (('first upload', TRANSCRIPT, False),
+                                   ('retry upload', RETRY_TRANSCRIPT, False),
+                                   ('forced re-analysis', TRANSCRIPT, True)):
+            start = time.perf_counter()
+            analyze_all(text, force_refresh=force)
+            print(f"{label:>20}: {(time.perf_counter() - start) * 1000:8.1f} ms")
+        print(cache_stats())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Admin audit log viewer: OFFSET pages with ILIKE and COUNT(*) vs keyset
+pages over composite indexes.
+
+Run from the repository root:
+
+    python -m benchmarks.audit_log_pages [--rows 1000000] [--months 24]
+
+Fills audit_log like benchmarks/audit_partitions.py (20 users), then times
+one page of each case with the old query (order_by(timestamp desc), ILIKE
+across action/resource_type/details, paginate() with its COUNT) and with
+utils/audit_search.py over the same dates, and shows the SQLite plan of
+each new query.
+"""
+import time
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import or_, text
+from benchmarks.common import make_app, create_user, time_call
+from benchmarks.audit_partitions import populate
+from models import db, AuditLog
+from utils.audit_search import AUDIT_ORDER, AuditFilters, filtered_audit_logs, search_audit_logs
+from utils.pagination import encode_cursor, keyset_filter, decode_cursor
+
+def old_page(page, query=''):
+    # What admin.audit_logs did
+    logs_query = AuditLog.query.order_by(AuditLog.timestamp.desc())
+    if query:
+        logs_query = logs_query.filter(or_(AuditLog.action.ilike(f'%{query}%'),
+                                           AuditLog.resource_type.ilike(f'%{query}%'),
+                                           AuditLog.details.ilike(f'%{query}%')))
+    logs = logs_query.paginate(page=page, per_page=50, error_out=False)
+    return [log.user.username for log in logs.items], logs.total
+
+def new_page(filters, cursor=None):
+    page = search_audit_logs(filters, cursor)
+    return [log.user.username for log in page], page.total_label
+
+def plan(filters, cursor):
+    matches = filtered_audit_logs(filters, AuditLog.query.filter(
+        keyset_filter(AUDIT_ORDER, decode_cursor(cursor), descending=True)) if cursor else None)
+    statement = matches.order_by(*(column.desc() for column in AUDIT_ORDER)).limit(51).statement.compile(
+        dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    steps = [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}'))]
+    return '; '.join(steps)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--months', type=int, default=24)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        user_ids = [create_user(f'clinician{number}').id for number in range(20)]
+        start = time.perf_counter()
+        populate(args.rows, args.months, user_ids)
+        print(f"Inserted {args.rows:,} rows over {args.months} months in {time.perf_counter() - start:.1f}s\n")
+
+        now = datetime.utcnow()
+        window = dict(since=now - timedelta(days=31 * args.months), until=now + timedelta(days=1),
+                      username='', action='', resource_type='', resource_id=None, text='')
+        everything = AuditFilters(**window)
+        deep_row = filtered_audit_logs(everything).order_by(
+            *(column.desc() for column in AUDIT_ORDER)).offset(100000 - 1).first()
+        deep_cursor = encode_cursor([deep_row.timestamp, deep_row.id])
+        resource_id = AuditLog.query.filter(AuditLog.resource_type == 'patient',
+                                            AuditLog.resource_id.isnot(None)).first().resource_id
+
+        cases = [
+            ('first page', lambda: old_page(1), everything, None),
+            ('page 2,001', lambda: old_page(2001), everything, deep_cursor),
+            ('user', lambda: old_page(1, 'clinician7'), everything._replace(username='clinician7'), None),
+            ('action', lambda: old_page(1, 'code_search'), everything._replace(action='code_search'), None),
+            ('resource', lambda: old_page(1, f'{resource_id}'),
+             everything._replace(resource_type='patient', resource_id=resource_id), None),
+            ('details text', lambda: old_page(1, 'Ohio 4242'), everything._replace(text='Ohio 4242'), None),
+        ]
+        print(f"{'case':>14} {'old ms':>8} {'new ms':>8}  new plan")
+        for label, old, filters, cursor in cases:
+            old_ms, _ = time_call(old, repeat=3)
+            new_ms, _ = time_call(lambda: new_page(filters, cursor), repeat=20)
+            print(f"{label:>14} {old_ms:>8.1f} {new_ms:>8.2f}  {plan(filters, cursor)}")
+        # The old "user" case could only match usernames inside details, so it found nothing
+        print(f"\nold user search rows: {len(old_page(1, 'clinician7')[0])}, "
+              f"new: {len(new_page(everything._replace(username='clinician7'))[0])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Per-request cost of auditing: synchronous commit vs the spooled batch writer.
+
+Run from the repository root:
+
+    python -m benchmarks.audit_overhead [--requests 2000] [--database-url URL]
+
+Times an audited search-style route against the same route unaudited, with
+the old decorator (add the AuditLog row and commit inside the request) and
+with utils/audit.py, spool appends only and with AUDIT_SPOOL_FSYNC. Then
+checks every event reached audit_log, and that events from a process killed
+before its first flush are replayed from the spool.
+"""
+import os
+import json
+import time
+import argparse
+import statistics
+import tempfile
+from functools import wraps
+from flask import Blueprint, request
+from flask_login import login_required, current_user
+from benchmarks.common import make_app, create_user, logged_in_client
+from models import db, AuditLog
+from utils import audit
+from utils.audit import audit_log, flush_audit_log
+
+bench_bp = Blueprint('audit_bench', __name__)
+
+def sync_audit_log(action, resource_type):
+    # What audit_log did for a search: one row added and committed per request
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            after_value = {'action': 'Perform search', 'query': str(request.args.get('q', '')),
+                           'type': str(request.args.get('type', 'all'))}
+            result = f(*args, **kwargs)
+            db.session.add(AuditLog(user_id=current_user.id, action=action, resource_type=resource_type,
+                                    resource_id=kwargs.get('id'), details=str(request.args),
+                                    after_value=json.dumps(after_value), ip_address=request.remote_addr,
+                                    user_agent=request.user_agent.string))
+            db.session.commit()
+            return result
+        return decorated_function
+    return decorator
+
+@bench_bp.route('/plain')
+@login_required
+def plain():
+    return 'ok'
+
+@bench_bp.route('/sync')
+@login_required
+@sync_audit_log(action='search', resource_type='global')
+def sync():
+    return 'ok'
+
+@bench_bp.route('/spooled')
+@login_required
+@audit_log(action='search', resource_type='global')
+def spooled():
+    return 'ok'
+
+def latencies(client, path, count):
+    samples = []
+    for number in range(count):
+        start = time.perf_counter()
+        client.get(path, query_string={'q': f'patient.state:Ohio {number}'})
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return samples
+
+def crash_before_flush(app, user_id, count):
+    """Audit count requests in a child that dies before its writer flushes"""
+    pid = os.fork()
+    if pid == 0:
+        audit.AUDIT_FLUSH_INTERVAL = 3600
+        with app.app_context():
+            db.engine.dispose(close=False)
+        client = logged_in_client(app, user_id)
+        for number in range(count):
+            client.get('/spooled', query_string={'q': f'crash {number}'})
+        os._exit(1)
+    os.waitpid(pid, 0)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    audit.AUDIT_SPOOL_DIR = tempfile.mkdtemp(prefix='bh-audit-spool-')
+    app = make_app(bench_bp, database_uri=args.database_url)
+    with app.app_context():
+        user_id = create_user().id
+    client = logged_in_client(app, user_id)
+    for path in ('/plain', '/sync', '/spooled'):
+        latencies(client, path, 50)  # warm up, and start the writer thread
+
+    print(f"{'case':>16} {'mean us':>9} {'p50 us':>8} {'p99 us':>8} {'overhead us':>12}")
+    baseline = None
+    for label, path, fsync in (('unaudited', '/plain', False), ('sync commit', '/sync', False),
+                               ('spooled', '/spooled', False), ('spooled + fsync', '/spooled', True)):
+        audit.AUDIT_SPOOL_FSYNC = fsync
+        samples = sorted(latencies(client, path, args.requests))
+        mean = statistics.fmean(samples)
+        baseline = mean if baseline is None else baseline
+        print(f"{label:>16} {mean:>9.0f} {samples[len(samples) // 2]:>8.0f} "
+              f"{samples[int(len(samples) * 0.99)]:>8.0f} {mean - baseline:>12.0f}")
+
+    start = time.perf_counter()
+    flush_audit_log()
+    flushed = time.perf_counter() - start
+    with app.app_context():
+        rows = AuditLog.query.count()
+    synchronous, spooled_events = args.requests + 50, 2 * args.requests + 50
+    print(f"\nFinal flush {flushed * 1000:.0f} ms; {rows - synchronous} of {spooled_events} "
+          f"spooled events in audit_log")
+
+    crash_before_flush(app, user_id, 200)
+    with app.app_context():
+        recovered = audit._writer().recover()
+        print(f"Killed a process holding 200 unflushed events: {recovered} recovered, "
+              f"{AuditLog.query.filter(AuditLog.details.like('%crash%')).count()} in audit_log")
+
+if __name__ == '__main__':
+    main()
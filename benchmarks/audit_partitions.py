@@ -0,0 +1,95 @@
+"""Audit log retention: the admin page over the whole table vs a date window,
+and archiving old months to gzipped JSONL.
+
+Run from the repository root:
+
+    python -m benchmarks.audit_partitions [--rows 1000000] [--months 24]
+
+Fills audit_log with rows spread evenly over the last --months months, then
+times the admin audit log page before (unbounded: every row sorted and
+counted) and after (the default window), and archive_old_months() with the
+default online window. The database is a plain table here (SQLite); on a
+partitioned PostgreSQL table the window also limits which partitions are
+scanned at all.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from benchmarks.common import make_app, create_user, logged_in_client, time_call
+from models import db, AuditLog
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.conditions import conditions_bp
+from routes.documents import documents_bp
+from routes.main import main_bp
+from routes.patients import patients_bp
+from routes.search import search_bp
+from utils.audit_partitions import AUDIT_ONLINE_MONTHS, archive_old_months, read_archive
+
+ACTIONS = [('search', 'global'), ('code_search', 'icd10'), ('patient_search', 'patient'),
+           ('edit', 'patient'), ('create', 'condition'), ('view', 'patient_conditions')]
+
+def populate(count, months, user_ids, batch_size=20000):
+    rng = random.Random(5)
+    now = datetime.utcnow()
+    span = timedelta(days=30.44 * months).total_seconds()
+    for start in range(0, count, batch_size):
+        rows = []
+        for number in range(start, min(start + batch_size, count)):
+            action, resource_type = rng.choice(ACTIONS)
+            rows.append({
+                'timestamp': now - timedelta(seconds=span * number / count),
+                'user_id': rng.choice(user_ids), 'action': action, 'resource_type': resource_type,
+                'resource_id': rng.randrange(1, 50000) if action != 'search' else None,
+                'details': f"ImmutableMultiDict([('q', 'patient.state:Ohio {number}')])",
+                'after_value': '{"action": "Perform search", "query": "patient.state:Ohio", "type": "all"}',
+                'ip_address': '10.0.0.12', 'user_agent': 'Mozilla/5.0 (X11; Linux x86_64) Firefox/131.0',
+            })
+        db.session.execute(AuditLog.__table__.insert(), rows)
+        db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--months', type=int, default=24)
+    args = parser.parse_args()
+
+    # The page links to the rest of the app, so every blueprint is needed to render it
+    app = make_app(admin_bp, auth_bp, conditions_bp, documents_bp, main_bp, patients_bp, search_bp)
+    app.add_template_filter(lambda value: json.loads(value), 'from_json')
+    with app.app_context():
+        user_id = create_user('bench_admin', role='admin').id
+        start = time.perf_counter()
+        populate(args.rows, args.months, [user_id])
+        print(f"Inserted {args.rows:,} rows over {args.months} months in {time.perf_counter() - start:.1f}s\n")
+
+        client = logged_in_client(app, user_id)
+        oldest = (datetime.utcnow() - timedelta(days=31 * args.months)).date().isoformat()
+        print(f"{'admin page':>22} {'median ms':>10} {'best ms':>8}")
+        for label, params in (('all rows', {'start': oldest}), ('default window', {}),
+                              ('window + search', {'q': 'code_search'})):
+            median, best = time_call(lambda: client.get('/admin/audit-logs', query_string=params), repeat=5)
+            print(f"{label:>22} {median:>10.0f} {best:>8.0f}")
+
+        directory = tempfile.mkdtemp(prefix='bh-audit-archive-')
+        start = time.perf_counter()
+        archived = archive_old_months(engine=db.engine, directory=directory)
+        seconds = time.perf_counter() - start
+        rows = sum(stats.rows for stats in archived)
+        size = sum(os.path.getsize(stats.path) for stats in archived if stats.path)
+        print(f"\nArchived {rows:,} rows from {sum(1 for s in archived if s.rows)} months "
+              f"(keeping {AUDIT_ONLINE_MONTHS}) in {seconds:.1f}s, {rows / seconds:,.0f} rows/s")
+        print(f"{size / 1024 / 1024:.1f} MB of gzipped JSONL, {size / max(rows, 1):.0f} bytes per row; "
+              f"{AuditLog.query.count():,} rows left in audit_log")
+        if archived and archived[0].path:
+            restored = sum(1 for _ in read_archive(archived[0].path))
+            print(f"{archived[0].path}: {restored:,} rows read back")
+        median, best = time_call(lambda: client.get('/admin/audit-logs', query_string={'start': oldest}), repeat=5)
+        print(f"\nAll rows page after archiving: {median:.0f} ms median")
+
+if __name__ == '__main__':
+    main()
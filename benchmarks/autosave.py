@@ -0,0 +1,85 @@
+"""Cost of saving the document editor: full-form POST vs field-level PATCH.
+
+Run from the repository root:
+
+    python -m benchmarks.autosave [--saves 200] [--note-kb 20]
+
+Replays an editing session (a few words typed between saves) against a
+document with a long note, once as the old editor did it, posting every field
+on each save, and once as autosave does, sending only the changed field with
+the version it was based on. Reports request bytes, statements and time per
+save, with the full-text index on, for edits to the note (which the index
+covers) and to a MEAT field (which it does not). Then checks that a stale
+save gets a 409 instead of overwriting.
+"""
+import json
+import random
+import argparse
+from urllib.parse import urlencode
+from benchmarks.common import make_app, create_user, logged_in_client, time_call
+from benchmarks.fulltext_search import COMMON_WORDS, synthetic_text
+from models import db, Document
+from routes.documents import documents_bp
+from utils import fulltext
+from utils.document_edits import EDITABLE_FIELDS
+from utils.query_count import count_queries
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--saves', type=int, default=200)
+    parser.add_argument('--note-kb', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(23)
+    app = make_app(documents_bp)
+    with app.app_context():
+        fulltext.ensure_fulltext_index()
+        user_id = create_user().id
+        words = args.note_kb * 1024 // 7
+        document = Document(title='Follow-up visit', user_id=user_id,
+                            content=synthetic_text(rng, words), transcription=synthetic_text(rng, words),
+                            meat_monitoring=synthetic_text(rng, 300), meat_assessment=synthetic_text(rng, 300),
+                            meat_evaluation=synthetic_text(rng, 300), meat_treatment=synthetic_text(rng, 300))
+        db.session.add(document)
+        db.session.commit()
+        document_id = document.id
+        engine = db.engine
+        values = {field: getattr(document, field) for field in EDITABLE_FIELDS}
+
+    client = logged_in_client(app, user_id)
+    url = f'/documents/{document_id}'
+    state = {'version': 1}
+
+    def post_form(field):
+        values[field] += ' ' + rng.choice(COMMON_WORDS)
+        body = urlencode({**values, 'version': state['version']})
+        client.post(f'{url}/edit', data=body, content_type='application/x-www-form-urlencoded')
+        state['version'] += 1
+        return len(body)
+
+    def patch(field):
+        values[field] += ' ' + rng.choice(COMMON_WORDS)
+        body = json.dumps({'version': state['version'], 'changes': {field: values[field]}})
+        response = client.patch(url, data=body, content_type='application/json')
+        state['version'] = response.get_json()['version']
+        return len(body)
+
+    print(f"{'save':<12} {'field':<16} {'bytes/save':>11} {'statements':>11} {'median ms':>10} {'min ms':>8}")
+    for name, save in (('form POST', post_form), ('PATCH', patch)):
+        for field in ('content', 'meat_assessment'):
+            sizes = []
+            with count_queries(engine) as statements:
+                sizes.append(save(field))
+            median, fastest = time_call(lambda: sizes.append(save(field)), repeat=args.saves)
+            print(f"{name:<12} {field:<16} {sum(sizes) / len(sizes):>11,.0f} {len(statements):>11} "
+                  f"{median:>10.2f} {fastest:>8.2f}")
+
+    stale = client.patch(url, data=json.dumps({'version': 1, 'changes': {'content': 'stale'}}),
+                         content_type='application/json')
+    with app.app_context():
+        kept = db.session.get(Document, document_id).content == values['content']
+    print(f"\nStale save: HTTP {stale.status_code}, server at version {stale.get_json()['version']}, "
+          f"note {'kept' if kept else 'OVERWRITTEN'}")
+
+if __name__ == '__main__':
+    main()
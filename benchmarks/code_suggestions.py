@@ -0,0 +1,116 @@
+"""Code suggestions over an ICD-10-CM sized code set: database ILIKE plus a
+linear scan vs the prebuilt code index.
+
+Run from the repository root:
+
+    python -m benchmarks.code_suggestions [--codes 72000]
+
+The code set is synthetic but shaped like ICD-10-CM (3-7 character codes
+under ~1,900 categories, long multi-word descriptions). "scan" is what
+/api/code-suggestions did before: ICD10Code.search_codes, then every code
+checked against the typed text and sorted. "cached" is a hit in the
+cache shared between workers; "cold" is a worker's first request, before
+and after another worker has cached it.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from sqlalchemy import or_
+from benchmarks.common import make_app, time_call
+from models import db, ICD10Code
+from utils import code_index
+from utils.code_index import CodeIndex, CodeEntry, cached_suggest_codes, code_indexes, suggest_codes
+
+INPUTS = ['F', 'F41', 'F41.1', 'S72.32', 'frac', 'anxiety', 'type 2 dia', 'displaced fracture femur', 'zzz']
+CONDITIONS = ['fracture', 'dislocation', 'sprain', 'contusion', 'laceration', 'burn', 'neoplasm',
+              'infection', 'ulcer', 'anxiety disorder', 'depressive disorder', 'diabetes mellitus',
+              'hypertension', 'asthma', 'opioid dependence', 'alcohol abuse', 'arthritis', 'hernia']
+MODIFIERS = ['Displaced', 'Nondisplaced', 'Acute', 'Chronic', 'Recurrent', 'Unspecified', 'Other',
+             'Malignant', 'Benign', 'Generalized', 'Severe', 'Mild', 'Moderate']
+SITES = ['femur', 'tibia', 'humerus', 'radius', 'shoulder', 'knee', 'ankle', 'wrist', 'lung',
+         'kidney', 'liver', 'skin', 'eye', 'ear', 'colon', 'stomach', 'heart', 'brain']
+DETAILS = ['right', 'left', 'unspecified side', 'bilateral']
+ENCOUNTERS = ['initial encounter', 'subsequent encounter', 'sequela',
+              'initial encounter for closed fracture', 'with routine healing']
+
+def generate(count, seed=13):
+    rng = random.Random(seed)
+    letters = 'ABCDEFGHIJKLMNOPQRSTVWXYZ'
+    codes = {}
+    categories = [f'{letter}{number:02d}' for letter in letters for number in range(76)]
+    while len(codes) < count:
+        category = rng.choice(categories)
+        code = category + ('.' + ''.join(rng.choice('0123456789XA') for _ in range(rng.randrange(1, 5)))
+                           if rng.random() > 0.03 else '')
+        description = (f"{rng.choice(MODIFIERS)} {rng.choice(CONDITIONS)} of {rng.choice(SITES)}, "
+                       f"{rng.choice(DETAILS)}, {rng.choice(ENCOUNTERS)}")
+        codes[code] = (description, category)
+    return codes
+
+def scan_suggestions(prefix, codes):
+    # The previous get_code_suggestions, with the full code set in place of the static sample
+    prefix_lower = prefix.lower()
+    suggestions = [{'code': code.code, 'description': code.description} for code in
+                   ICD10Code.query.filter(or_(ICD10Code.code.ilike(f'{prefix}%'),
+                                              ICD10Code.description.ilike(f'%{prefix}%'))).limit(10)]
+    seen = {suggestion['code'] for suggestion in suggestions}
+    for code, (desc, _) in codes.items():
+        if code not in seen and (
+                code.lower().startswith(prefix_lower) or desc.lower().find(prefix_lower) != -1 or
+                (len(prefix) >= 3 and any(term.lower().startswith(prefix_lower) for term in desc.split()))):
+            suggestions.append({'code': code, 'description': desc})
+            seen.add(code)
+
+    def sort_key(suggestion):
+        code, desc = suggestion['code'].lower(), suggestion['description'].lower()
+        if code == prefix_lower:
+            return (0, len(code), code)
+        if code.startswith(prefix_lower):
+            return (1, len(code), code)
+        if desc.startswith(prefix_lower):
+            return (2, len(desc), code)
+        return (4, len(desc), code)
+    suggestions.sort(key=sort_key)
+    return suggestions[:10]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--codes', type=int, default=72000)
+    args = parser.parse_args()
+
+    codes = generate(args.codes)
+    entries = [CodeEntry(code, description, 'ICD-10', category)
+               for code, (description, category) in codes.items()]
+    built, _ = time_call(lambda: CodeIndex(entries), repeat=3)
+    tracemalloc.start()
+    index = CodeIndex(entries)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"Built index for {len(index)} codes in {built / 1000:.2f}s, {size / 1024 / 1024:.0f} MB\n")
+
+    app = make_app()
+    with app.app_context():
+        db.session.execute(ICD10Code.__table__.insert(), [
+            {'code': code, 'description': description, 'category': category}
+            for code, (description, category) in codes.items()])
+        db.session.commit()
+        for label in ('cold', 'cold, cached'):
+            code_index._indexes.clear()
+            start = time.perf_counter()
+            cached_suggest_codes('anxiety disorder')
+            print(f"{label:>12} first request {(time.perf_counter() - start) * 1000:.1f} ms")
+        code_indexes()
+
+        print(f"\n{'case':>6} {'median us':>11} {'best us':>9}  top suggestion / input")
+        for text in INPUTS:
+            for label, func in (('scan', lambda: scan_suggestions(text, codes)),
+                                ('index', lambda: suggest_codes(text)),
+                                ('cached', lambda: cached_suggest_codes(text))):
+                results = func()
+                median, best = time_call(func, repeat=5 if label == 'scan' else 200)
+                top = f"{results[0]['code']} {results[0]['description'][:40]}" if results else '-'
+                print(f"{label:>6} {median * 1000:>11.1f} {best * 1000:>9.1f}  {top} / {text!r}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import os
+import time
+import tempfile
+import statistics
+from flask import Flask
+from flask_login import LoginManager
+from models import db, User
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def make_app(*blueprints, database_uri=None):
+    """Build an isolated app on a throwaway SQLite database for benchmarking"""
+    workdir = tempfile.mkdtemp(prefix='bh-bench-')
+    app = Flask('app', root_path=ROOT)
+    app.config['SECRET_KEY'] = 'benchmark'
+    app.config['TESTING'] = True
+    app.config['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    db.init_app(app)
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return db.session.get(User, int(user_id))
+
+    for blueprint in blueprints:
+        app.register_blueprint(blueprint)
+
+    with app.app_context():
+        db.create_all()
+    return app
+
+def create_user(username='bench_user', role='user'):
+    user = User(username=username, role=role)
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def logged_in_client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+def time_call(func, repeat=5):
+    """Return (median, min) wall time in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), min(samples)
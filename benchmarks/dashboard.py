@@ -0,0 +1,129 @@
+"""Dashboard statistics: three COUNTs through func.date() vs one conditional
+aggregate, and the dashboard page with its per-user cache cold and warm.
+
+Run from the repository root:
+
+    python -m benchmarks.dashboard [--assessments 500000] [--users 200]
+
+Fills assessment_result with rows spread over two years and --users
+assessors, prints the statistics plans (EXPLAIN QUERY PLAN) and times them
+without the (assessor_id, assessment_date, status) index and with it,
+then counts and times the statements /dashboard sends with the assessment
+panel cache empty and filled, and checks that saving an assessment updates
+the panel at once.
+"""
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+from benchmarks.common import make_app, create_user, logged_in_client, time_call
+from benchmarks.query_budget import from_json
+from models import db, AssessmentResult, AssessmentTool, Patient
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.conditions import conditions_bp
+from routes.documents import documents_bp
+from routes.main import main_bp
+from routes.patients import patients_bp
+from routes.search import search_bp
+from utils import dashboard
+from utils.query_count import count_queries
+
+def populate(count, user_ids, patients=2000, batch_size=20000):
+    rng = random.Random(25)
+    db.session.execute(Patient.__table__.insert(), [{
+        'identifier': f'P{number:07d}', 'family_name': f'Family{number}', 'given_name': 'Given', 'active': True,
+    } for number in range(patients)])
+    tool_ids = []
+    for name in ('PHQ-9', 'GAD-7', 'COWS', 'CIWA-Ar', 'PRAPARE'):
+        tool = AssessmentTool(name=name, tool_type=name, active=True)
+        db.session.add(tool)
+        db.session.flush()
+        tool_ids.append(tool.id)
+    now = datetime.utcnow()
+    for start in range(0, count, batch_size):
+        db.session.execute(AssessmentResult.__table__.insert(), [{
+            'patient_id': rng.randrange(1, patients + 1),
+            'tool_id': rng.choice(tool_ids),
+            'assessor_id': rng.choice(user_ids),
+            'assessment_date': now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60)),
+            'status': rng.choice(['completed', 'completed', 'completed', 'draft']),
+            'entry_mode': 'manual',
+            'total_score': rng.randrange(28),
+        } for _ in range(start, min(start + batch_size, count))])
+        db.session.commit()
+
+def three_counts(user_id, since):
+    """As the dashboard counted before"""
+    query = AssessmentResult.query
+    return (query.filter_by(assessor_id=user_id).count(),
+            query.filter(AssessmentResult.assessor_id == user_id,
+                         func.date(AssessmentResult.assessment_date) >= since.date()).count(),
+            query.filter_by(assessor_id=user_id, status='draft').count())
+
+def explain(statement, params):
+    return '; '.join(row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}'), params))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--assessments', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_app(admin_bp, auth_bp, conditions_bp, documents_bp, main_bp, patients_bp, search_bp)
+    app.add_template_filter(from_json, 'from_json')
+    with app.app_context():
+        user_ids = [create_user(f'clinician{number}').id for number in range(args.users)]
+        start = time.perf_counter()
+        populate(args.assessments, user_ids)
+        print(f"Inserted {args.assessments} assessments for {args.users} assessors "
+              f"in {time.perf_counter() - start:.1f}s\n")
+
+        user_id = user_ids[0]
+        since = dashboard.month_start()
+        assert tuple(dashboard.assessment_stats(user_id, since)) == three_counts(user_id, since)
+        params = {'user_id': user_id, 'since': since.date().isoformat()}
+        rng = random.Random(3)
+
+        # Before: the old queries with the old indexes
+        index = next(index for index in AssessmentResult.__table__.indexes
+                     if index.name == 'idx_assessment_result_assessor_date')
+        index.drop(db.engine)
+        db.session.execute(text('ANALYZE'))
+        print("Before: " + explain("SELECT count(*) FROM assessment_result WHERE assessor_id = :user_id "
+                                   "AND date(assessment_date) >= :since", params))
+        before, _ = time_call(lambda: three_counts(rng.choice(user_ids), since), repeat=args.repeat)
+
+        index.create(db.engine)
+        db.session.execute(text('ANALYZE'))
+        print("After:  " + explain(
+            "SELECT count(id), count(CASE WHEN assessment_date >= :since THEN 1 END), "
+            "count(CASE WHEN status = 'draft' THEN 1 END) FROM assessment_result WHERE assessor_id = :user_id",
+            params))
+        after, _ = time_call(lambda: dashboard.assessment_stats(rng.choice(user_ids), since), repeat=args.repeat)
+        print(f"\nStatistics: three COUNTs {before:.2f} ms, one aggregate {after:.2f} ms (median)\n")
+        engine = db.engine
+
+    client = logged_in_client(app, user_id)
+    print(f"{'dashboard':<12} {'statements':>10} {'median ms':>10}")
+    for label in ('cold', 'warm'):
+        def request():
+            if label == 'cold':
+                dashboard.invalidate_dashboard([(str(engine.url), None)])
+            client.get('/dashboard')
+        with count_queries(engine) as statements:
+            request()
+        median, _ = time_call(request, repeat=args.repeat)
+        print(f"{label:<12} {len(statements):>10} {median:>10.2f}")
+
+    with app.app_context():
+        total = dashboard.assessment_panel(user_id).stats.total
+        db.session.add(AssessmentResult(patient_id=1, tool_id=1, assessor_id=user_id, status='draft'))
+        db.session.commit()
+        updated = dashboard.assessment_panel(user_id).stats.total
+    print(f"\nAfter saving an assessment the cached total went from {total} to {updated}")
+
+if __name__ == '__main__':
+    main()
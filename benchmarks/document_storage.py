@@ -0,0 +1,138 @@
+"""Document list and dashboard cost with the text inline vs in document_body.
+
+Run from the repository root:
+
+    python -m benchmarks.document_storage [--documents 100000] [--transcript-kb 8] [--users 50]
+
+Fills document + document_body and, for comparison, document_inline, a copy
+of the table as it was before the split, with the same long transcripts.
+Times the list page's query (all of a user's documents, newest first) and the
+dashboard's (the five newest) against both layouts, with the tracemalloc peak
+of the fetched rows: inline, a document row is the whole note, as the ORM used
+to load it. Then times the real /documents and /dashboard pages.
+"""
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, bindparam, select, text
+from benchmarks.common import make_app, create_user, logged_in_client, time_call
+from benchmarks.fulltext_search import synthetic_text
+from benchmarks.query_budget import from_json
+from models import db, Document, DocumentBody
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.conditions import conditions_bp
+from routes.documents import documents_bp
+from routes.main import main_bp
+from routes.patients import patients_bp
+from routes.search import search_bp
+
+BODY_COLUMNS = ['content', 'transcription', 'meat_monitoring', 'meat_assessment', 'meat_evaluation', 'meat_treatment']
+
+# The document table before document_body, column for column
+inline = Table(
+    'document_inline', MetaData(),
+    Column('id', Integer, primary_key=True),
+    Column('title', String(200), nullable=False),
+    Column('content', Text),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('user_id', Integer, nullable=False),
+    Column('audio_file', String(500)),
+    Column('transcription', Text),
+    Column('meat_monitoring', Text),
+    Column('meat_assessment', Text),
+    Column('meat_evaluation', Text),
+    Column('meat_treatment', Text),
+    Column('patient_id', Integer),
+    Column('version', Integer, nullable=False),
+)
+
+def populate(count, user_ids, transcript_kb, batch_size=2000):
+    rng = random.Random(24)
+    # A pool of notes keeps generation from dominating; each row still stores its own copy
+    transcripts = [synthetic_text(rng, transcript_kb * 1024 // 7) for _ in range(64)]
+    notes = [synthetic_text(rng, 150) for _ in range(64)]
+    meat = [synthetic_text(rng, 40) for _ in range(64)]
+    now = datetime.utcnow()
+    for start in range(0, count, batch_size):
+        headers, bodies = [], []
+        for document_id in range(start + 1, min(start + batch_size, count) + 1):
+            updated = now - timedelta(minutes=count - document_id)
+            headers.append({'id': document_id, 'title': f'Session note {document_id}', 'created_at': updated,
+                            'updated_at': updated, 'user_id': rng.choice(user_ids), 'version': 1})
+            bodies.append({'document_id': document_id, 'content': rng.choice(notes),
+                           'transcription': rng.choice(transcripts),
+                           **{name: rng.choice(meat) for name in BODY_COLUMNS[2:]}})
+        db.session.execute(Document.__table__.insert(), headers)
+        db.session.execute(DocumentBody.__table__.insert(), bodies)
+        db.session.execute(inline.insert(), [{**header, **{name: body[name] for name in BODY_COLUMNS}}
+                                             for header, body in zip(headers, bodies)])
+        db.session.commit()
+
+def page_count(name):
+    try:
+        return db.session.execute(text('SELECT count(*) FROM dbstat WHERE name = :name'), {'name': name}).scalar()
+    except Exception:
+        return None  # SQLite built without dbstat
+
+def measure(statement, user_ids, repeat):
+    rng = random.Random(7)
+    median, _ = time_call(lambda: db.session.execute(statement, {'user_id': rng.choice(user_ids)}).all(),
+                          repeat=repeat)
+    tracemalloc.start()
+    rows = db.session.execute(statement, {'user_id': user_ids[0]}).all()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return median, peak, len(rows)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=100000)
+    parser.add_argument('--transcript-kb', type=int, default=8)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    app = make_app(admin_bp, auth_bp, conditions_bp, documents_bp, main_bp, patients_bp, search_bp)
+    app.add_template_filter(from_json, 'from_json')
+    with app.app_context():
+        inline.create(db.engine)
+        user_ids = [create_user(f'clinician{number}').id for number in range(args.users)]
+        start = time.perf_counter()
+        populate(args.documents, user_ids, args.transcript_kb)
+        print(f"Inserted {args.documents} documents with {args.transcript_kb} KB transcripts into both layouts "
+              f"in {time.perf_counter() - start:.1f}s")
+        pages = {name: page_count(name) for name in ('document', 'document_body', 'document_inline')}
+        if all(pages.values()):
+            print(f"Pages: document {pages['document']:,}, document_body {pages['document_body']:,}, "
+                  f"document_inline {pages['document_inline']:,}")
+        db.session.execute(text('ANALYZE'))
+
+        user_filter = bindparam('user_id')
+        queries = {
+            'list (inline)': select(inline).where(inline.c.user_id == user_filter)
+                .order_by(inline.c.updated_at.desc(), inline.c.id.desc()),
+            'list (split)': select(Document.__table__).where(Document.user_id == user_filter)
+                .order_by(Document.updated_at.desc(), Document.id.desc()),
+            'dashboard (inline)': select(inline).where(inline.c.user_id == user_filter)
+                .order_by(inline.c.updated_at.desc()).limit(5),
+            'dashboard (split)': select(Document.__table__).where(Document.user_id == user_filter)
+                .order_by(Document.updated_at.desc()).limit(5),
+        }
+        print(f"\n{'query':<20} {'median ms':>10} {'peak KB':>10} {'rows':>6}")
+        for label, statement in queries.items():
+            median, peak, rows = measure(statement, user_ids, args.repeat)
+            print(f"{label:<20} {median:>10.1f} {peak / 1024:>10,.0f} {rows:>6}")
+
+    client = logged_in_client(app, user_ids[0])
+    print(f"\n{'page':<20} {'median ms':>10}")
+    for url in ('/documents', '/dashboard'):
+        client.get(url)
+        median, _ = time_call(lambda: client.get(url), repeat=args.repeat)
+        print(f"{url:<20} {median:>10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""HTQL document search latency with substring scans vs the full-text index.
+
+Run from the repository root:
+
+    python -m benchmarks.fulltext_search [--documents 100000] [--database-url URL]
+
+Generates synthetic clinical notes, then times search_documents() for the same
+queries with FULLTEXT_SEARCH off (ILIKE '%v%', the old behaviour) and on
+(FTS5 on SQLite, tsvector/GIN on PostgreSQL when --database-url points there).
+"""
+import argparse
+import random
+import time
+from benchmarks.common import make_app, create_user, time_call
+from models import db, Document, DocumentBody
+from utils import fulltext
+from utils.search import search_documents
+
+COMMON_WORDS = (
+    'patient reports denies feels sleep mood appetite energy stable improved worse '
+    'week today follow visit plan continue medication dose counseling session goals '
+    'family work stress support reviewed discussed noted states history current'
+).split()
+CLINICAL_TERMS = (
+    'anxiety depression insomnia cravings withdrawal buprenorphine naltrexone sertraline '
+    'panic relapse abstinence nausea tremor agitation hypertension diabetes asthma '
+    'suicidal ideation trauma nightmares irritability'
+).split()
+PHRASES = ['chest pain', 'shortness of breath', 'opioid use disorder', 'panic attacks']
+
+QUERIES = [
+    'document.content:"chest pain"',
+    'document.transcription:nightmares',
+    'document.text:naltrexone',
+    'document.content:withdraw*',
+    'document.text:"opioid use disorder" AND document.transcription:relapse',
+]
+
+def synthetic_text(rng, words):
+    parts = []
+    for _ in range(words):
+        roll = rng.random()
+        # Each clinical term lands in a few percent of notes, like a real chart
+        if roll < 0.001:
+            parts.append(rng.choice(PHRASES))
+        elif roll < 0.005:
+            parts.append(rng.choice(CLINICAL_TERMS))
+        else:
+            parts.append(rng.choice(COMMON_WORDS))
+    return ' '.join(parts).capitalize() + '.'
+
+def populate(count, user_id, batch_size=5000):
+    rng = random.Random(42)
+    for start in range(0, count, batch_size):
+        ids = range(start + 1, min(start + batch_size, count) + 1)
+        db.session.execute(Document.__table__.insert(), [
+            {'id': document_id, 'title': f'Progress note {document_id - 1}', 'user_id': user_id}
+            for document_id in ids])
+        db.session.execute(DocumentBody.__table__.insert(), [{
+            'document_id': document_id,
+            'content': synthetic_text(rng, 60),
+            'transcription': synthetic_text(rng, 120),
+        } for document_id in ids])
+        db.session.commit()
+
+def run_queries(label):
+    for query in QUERIES:
+        count = len(search_documents(query))
+        median, best = time_call(lambda: search_documents(query), repeat=3)
+        print(f"{label:>10} {median:>10.1f} {best:>10.1f} {count:>8}  {query}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=100000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app = make_app(database_uri=args.database_url)
+    with app.app_context():
+        user = create_user()
+        start = time.perf_counter()
+        populate(args.documents, user.id)
+        print(f"Inserted {args.documents} documents in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        fulltext.ensure_fulltext_index()
+        print(f"Built full-text index in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'mode':>10} {'median ms':>10} {'best ms':>10} {'matches':>8}  query")
+        fulltext.FULLTEXT_SEARCH_ENABLED = False
+        run_queries('ilike')
+        fulltext.FULLTEXT_SEARCH_ENABLED = True
+        run_queries('fulltext')
+
+if __name__ == '__main__':
+    main()
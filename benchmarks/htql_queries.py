@@ -0,0 +1,95 @@
+"""HTQL parse cost with and without the compiled-query cache, and planned vs
+always-joined patient searches.
+
+Run from the repository root:
+
+    python -m benchmarks.htql_queries [--patients 100000]
+
+The old search_patients outer joined condition and added DISTINCT for every
+query; the planner only joins the tables a query's fields live in.
+"""
+import argparse
+import random
+import time
+from benchmarks.common import make_app, time_call
+from models import db, Patient, Condition
+from utils.htql import _compile, compile_query
+from utils.search import flat_condition, plan_query
+
+DASHBOARD_QUERIES = [
+    'patient.state:Ohio',
+    'patient.city:Spring AND NOT patient.gender:female',
+    '(condition.code:F32 OR condition.code:F41) AND condition.status:active',
+    'document.text:"opioid use disorder" AND (patient.state:Ohio OR patient.state:Texas)',
+]
+PLAN_QUERIES = [
+    'patient.state:Ohio',
+    'patient.gender:male AND patient.city:Spring',
+    'condition.code:F32 AND patient.state:Ohio',
+]
+CODES = ['F32.9', 'F41.1', 'F11.20', 'I10', 'E11.9', 'J45.909']
+STATES = ['Ohio', 'Texas', 'Florida', 'Oregon', 'Maine']
+
+def populate(count, batch_size=10000):
+    rng = random.Random(3)
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        db.session.execute(Patient.__table__.insert(), [{
+            'identifier': f'P{start + i:07d}',
+            'family_name': f'Family{rng.randrange(5000)}',
+            'given_name': f'Given{rng.randrange(500)}',
+            'gender': rng.choice(['male', 'female']),
+            'city': rng.choice(['Springfield', 'Portland', 'Dayton', 'Austin']),
+            'state': rng.choice(STATES),
+            'active': True,
+        } for i in range(size)])
+        db.session.execute(Condition.__table__.insert(), [{
+            'patient_id': start + i + 1,
+            'clinical_status': 'active',
+            'code': rng.choice(CODES),
+            'severity': 'moderate',
+        } for i in range(size) for _ in range(rng.randrange(4))])
+        db.session.commit()
+
+def always_joined(query):
+    # The shape search_patients used before the planner
+    compiled = compile_query(query)
+    return Patient.query.join(Condition, Patient.id == Condition.patient_id, isouter=True).filter(
+        flat_condition(compiled.ast)).distinct()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patients', type=int, default=100000)
+    args = parser.parse_args()
+
+    def parse_cold():
+        for query in DASHBOARD_QUERIES:
+            _compile.cache_clear()
+            compile_query(query)
+
+    def parse_cached():
+        for query in DASHBOARD_QUERIES:
+            compile_query(query)
+
+    print(f"{'case':>14} {'median us/query':>16}")
+    for label, func in (('parse', parse_cold), ('cached', parse_cached)):
+        parse_cached()
+        median, _ = time_call(lambda: [func() for _ in range(200)])
+        print(f"{label:>14} {median * 1000 / 200 / len(DASHBOARD_QUERIES):>16.1f}")
+
+    app = make_app()
+    with app.app_context():
+        start = time.perf_counter()
+        populate(args.patients)
+        print(f"\nInserted {args.patients} patients in {time.perf_counter() - start:.1f}s\n")
+        print(f"{'case':>14} {'median ms':>10} {'best ms':>10} {'rows':>8}  query")
+        for query in PLAN_QUERIES:
+            for label, build in (('always joined', always_joined),
+                                 ('planned', lambda q: plan_query('patient', compile_query(q)))):
+                # Ids only, so row loading does not hide the join cost
+                count = len(build(query).with_entities(Patient.id).all())
+                median, best = time_call(lambda: build(query).with_entities(Patient.id).all(), repeat=3)
+                print(f"{label:>14} {median:>10.1f} {best:>10.1f} {count:>8}  {query}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""ICD-10-CM import: ORM row-by-row vs staged bulk load and diff.
+
+Run from the repository root:
+
+    python -m benchmarks.icd10_import [--codes 72000] [--database-url URL]
+
+Writes a CMS order-format file of synthetic codes (see
+benchmarks/code_suggestions.py), then times the old import (delete the
+table, add every code through the session), a full load, a re-import of the
+same file and a yearly update (1% of descriptions changed, 300 codes added,
+200 removed, --prune).
+"""
+import os
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from benchmarks.common import make_app
+from benchmarks.code_suggestions import generate
+from models import db, ICD10Code
+from utils.icd10_import import import_icd10_file, open_icd10_file, parse_icd10_lines
+
+def write_order_file(path, codes):
+    with open(path, 'w') as out:
+        for number, (code, (description, _)) in enumerate(sorted(codes.items()), 1):
+            out.write(f"{number:05d} {code.replace('.', ''):<7} {int('.' in code)} "
+                      f"{description[:60]:<60} {description}\n")
+
+def yearly_update(codes, seed=7):
+    rng = random.Random(seed)
+    updated = dict(codes)
+    for code in rng.sample(sorted(codes), 200):
+        del updated[code]
+    for code in rng.sample(sorted(updated), len(codes) // 100):
+        description, category = updated[code]
+        updated[code] = (description + ', revised', category)
+    for number in range(300):
+        updated[f'U{number // 100:02d}.{number % 100:02d}'] = ('Emergency use code', f'U{number // 100:02d}')
+    return updated
+
+def orm_import(path):
+    # What import_icd10_codes.py did, fed from the same file
+    start = time.perf_counter()
+    ICD10Code.query.delete()
+    with open_icd10_file(path) as lines:
+        for row in parse_icd10_lines(lines):
+            db.session.add(ICD10Code(code=row.code, description=row.description, category=row.category))
+    db.session.commit()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--codes', type=int, default=72000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bh-icd10-')
+    base, update = os.path.join(workdir, 'order.txt'), os.path.join(workdir, 'order_update.txt')
+    codes = generate(args.codes)
+    write_order_file(base, codes)
+    write_order_file(update, yearly_update(codes))
+
+    tracemalloc.start()
+    with open_icd10_file(base) as lines:
+        rows = sum(1 for _ in parse_icd10_lines(lines))
+    parse_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"Parsed {rows} lines ({os.path.getsize(base) / 1024 / 1024:.1f} MB) "
+          f"with a {parse_peak / 1024:.0f} KB peak\n")
+
+    app = make_app(database_uri=args.database_url)
+    with app.app_context():
+        seconds = orm_import(base)
+        print(f"{'case':>14} {'seconds':>8} {'rows/s':>9} {'new':>7} {'changed':>8} {'deleted':>8}")
+        print(f"{'orm':>14} {seconds:>8.2f} {rows / seconds:>9,.0f} {rows:>7} {'':>8} {'':>8}")
+        db.session.remove()
+        for label, path, options in (('replace', base, {'replace': True}),
+                                     ('same file', base, {}),
+                                     ('yearly update', update, {'prune': True})):
+            stats = import_icd10_file(path, **options)
+            print(f"{label:>14} {stats.seconds:>8.2f} {stats.rows / stats.seconds:>9,.0f} "
+                  f"{stats.inserted:>7} {stats.updated:>8} {stats.deleted:>8}")
+        print(f"\n{ICD10Code.query.count()} codes in icd10_code")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Compare serial and concurrent LLM analysis of one transcript, offline.
+
+Run from the repository root:
+
+    python -m benchmarks.llm_fanout
+
+Uses utils.fake_llm.FakeLLMClient, which sleeps for a fixed latency per call,
+so the numbers reflect request orchestration rather than network variance.
+"""
+import time
+from utils.fake_llm import FakeLLMClient
+from utils.llm import set_client, run_concurrently
+from utils.ai_analysis import analyze_meat_criteria, extract_conditions, extract_prapare_data
+
+LATENCY = 0.5  # seconds per fake LLM call
+TRANSCRIPT = "Patient reports improved sleep and reduced cravings on buprenorphine."
+
+ANALYSES = {
+    'meat_analysis': lambda: analyze_meat_criteria(TRANSCRIPT),
+    'conditions': lambda: extract_conditions(TRANSCRIPT),
+    'prapare': lambda: extract_prapare_data(TRANSCRIPT),
+}
+
+def serial():
+    return {name: func() for name, func in ANALYSES.items()}
+
+def concurrent():
+    results, errors = run_concurrently(ANALYSES)
+    assert not errors, errors
+    return results
+
+def main():
+    set_client(FakeLLMClient(latency=LATENCY))
+    print(f"{len(ANALYSES)} analyses, {LATENCY * 1000:.0f} ms fake latency per call")
+    for label, func in (('serial', serial), ('concurrent', concurrent)):
+        start = time.perf_counter()
+        results = func()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label:>12}: {elapsed:8.1f} ms ({len(results)} results)")
+
+    # Partial results: one call exceeds the fan-out timeout
+    set_client(FakeLLMClient(latency=LATENCY))
+    slow = dict(ANALYSES, slow=lambda: time.sleep(LATENCY * 4) or {})
+    start = time.perf_counter()
+    results, errors = run_concurrently(slow, timeout=LATENCY * 2)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{'timeout':>12}: {elapsed:8.1f} ms ({len(results)} results, failed: {sorted(errors)})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Prometheus metrics: per-request cost, and totals across processes.
+
+Run from the repository root:
+
+    python -m benchmarks.metrics [--processes 3] [--calls 20] [--requests 200]
+
+Points PROMETHEUS_MULTIPROC_DIR at a fresh directory, has --processes
+separate processes each make --calls chat completions (offline client) and
+transcribe a short WAV, then reads /metrics from the web app and checks
+the totals add up across processes. Also times the patient chart page on
+apps without and with init_metrics().
+"""
+import os
+import io
+import re
+import wave
+import tempfile
+# Set before prometheus_client creates any metric; spawned children inherit it
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', tempfile.mkdtemp(prefix='bh-metrics-'))
+os.environ.setdefault('METRICS_TOKEN', 'benchmark')
+import argparse
+import multiprocessing
+from benchmarks.common import make_app, create_user, logged_in_client, time_call
+from benchmarks.query_budget import from_json, grow, seed
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.conditions import conditions_bp
+from routes.documents import documents_bp
+from routes.main import main_bp
+from routes.metrics import metrics_bp
+from routes.patients import patients_bp
+from routes.search import search_bp
+from utils.metrics import init_metrics
+
+PROMPTS = ('analyze_meat_criteria', 'extract_conditions', 'extract_prapare_data')
+
+def silent_wav(seconds):
+    audio = io.BytesIO()
+    with wave.open(audio, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b'\0\0' * int(16000 * seconds))
+    return audio.getvalue()
+
+def work(calls):
+    # A separate process, like worker.py or a transcription pool child
+    from utils.fake_llm import FakeLLMClient
+    from utils.llm import chat_completion, set_client
+    from utils.transcription import transcribe_audio
+    set_client(FakeLLMClient(latency=0.01))
+    for number in range(calls):
+        chat_completion([{'role': 'user', 'content': 'note'}], prompt=PROMPTS[number % len(PROMPTS)])
+    transcribe_audio(silent_wav(2.0), backend='openai')
+
+def sample(text, name, **labels):
+    total = 0.0
+    for line in text.splitlines():
+        if (line.startswith(name + '{') or line.startswith(name + ' ')) and all(f'{key}="{value}"' in line for key, value in labels.items()):
+            total += float(line.rsplit(' ', 1)[1])
+    return total
+
+def build(instrumented):
+    app = make_app(admin_bp, auth_bp, conditions_bp, documents_bp, main_bp, metrics_bp, patients_bp, search_bp)
+    app.add_template_filter(from_json, 'from_json')
+    if instrumented:
+        init_metrics(app)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=3)
+    parser.add_argument('--calls', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=work, args=(args.calls,)) for _ in range(args.processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    timings = {}
+    for instrumented in (False, True):
+        app = build(instrumented)
+        with app.app_context():
+            user_id = create_user('bench_admin', role='admin').id
+            ids = seed(user_id)
+            grow(ids['patient'], user_id, 50)
+            client = logged_in_client(app, user_id)
+            url = f"/patients/{ids['patient']}"
+            client.get(url)
+            timings[instrumented] = time_call(lambda: client.get(url), repeat=args.requests)[0]
+            if instrumented:
+                text = client.get('/metrics', headers={
+                    'Authorization': f"Bearer {os.environ['METRICS_TOKEN']}"}).get_data(as_text=True)
+
+    expected = args.processes * args.calls
+    calls = sample(text, 'llm_request_duration_seconds_count')
+    print(f"LLM calls in /metrics: {calls:.0f} (expected {expected} from {args.processes} processes)")
+    for prompt in PROMPTS:
+        print(f"  {prompt:<24} {sample(text, 'llm_request_duration_seconds_count', prompt=prompt):.0f} calls")
+    transcribed = sample(text, 'transcription_seconds_per_audio_second_count')
+    print(f"Transcriptions with a known length: {transcribed:.0f} (expected {args.processes})")
+    chart = sample(text, 'http_request_duration_seconds_count', endpoint='patients.view_patient')
+    print(f"Chart page requests: {chart:.0f}; pool checkouts: {sample(text, 'db_pool_checkouts_total'):.0f}")
+    print(f"{len(re.findall(r'^# TYPE', text, re.M))} metric families, {len(text):,} bytes")
+    off, on = timings[False], timings[True]
+    print(f"\nChart page median: {off:.2f} ms without metrics, {on:.2f} ms with ({on - off:+.2f} ms)")
+    if calls != expected or transcribed != args.processes:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
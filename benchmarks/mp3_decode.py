@@ -0,0 +1,77 @@
+"""Wall time and disk writes for preparing MP3 uploads for recognition.
+
+Run from the repository root (needs ffmpeg on PATH):
+
+    python -m benchmarks.mp3_decode
+
+"transcode" reproduces the old extract_text_from_audio, which exported a full
+WAV next to the MP3 with pydub before windowing it. "stream" pipes ffmpeg PCM
+straight into the windower with the artifact cache off, "stream+cache" is the
+default first decode, which also keeps a 16 kHz mono copy, and "cached" is a
+repeat read of that copy, as on a retry or re-analysis. Recognition itself is
+not included; it costs the same in every case.
+"""
+import glob
+import os
+import resource
+import shutil
+import tempfile
+import time
+from benchmarks.common import ROOT
+from utils import audio_chunks
+from utils.audio_chunks import iter_audio_windows
+
+def bytes_written():
+    # ru_oublock counts 512-byte blocks; children covers ffmpeg
+    return 512 * sum(resource.getrusage(who).ru_oublock
+                     for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+def measure(func):
+    before = bytes_written()
+    start = time.perf_counter()
+    windows = func()
+    os.sync()
+    return time.perf_counter() - start, bytes_written() - before, windows
+
+def transcode(path, workdir):
+    from pydub import AudioSegment
+    wav_path = os.path.join(workdir, os.path.basename(path).rsplit('.', 1)[0] + '.wav')
+    # Same decode as AudioSegment.from_mp3; naming the codec skips the ffprobe probe
+    AudioSegment.from_file(path, format='mp3', codec='mp3').export(wav_path, format='wav')
+    return len(list(iter_audio_windows(wav_path)))
+
+def stream(path):
+    return len(list(iter_audio_windows(path)))
+
+def main():
+    samples = sorted(glob.glob(os.path.join(ROOT, 'uploads', '*.mp3')))
+    if not samples:
+        print('No MP3 samples in uploads/')
+        return
+
+    print(f"{'sample':>20} {'case':>13} {'seconds':>8} {'MB written':>11} {'windows':>8}")
+    for sample in samples:
+        workdir = tempfile.mkdtemp(prefix='bh-mp3-')
+        # Work on a copy so the old path's WAV does not land in uploads/
+        path = shutil.copy(sample, workdir)
+        audio_chunks.AUDIO_CACHE_DIR = os.path.join(workdir, 'cache')
+        cache_size = audio_chunks.AUDIO_CACHE_MAX_BYTES
+        try:
+            audio_chunks.AUDIO_CACHE_MAX_BYTES = 0
+            cases = [('transcode', lambda: transcode(path, workdir)),
+                     ('stream', lambda: stream(path))]
+            results = [(name, measure(func)) for name, func in cases]
+
+            audio_chunks.AUDIO_CACHE_MAX_BYTES = cache_size
+            results.append(('stream+cache', measure(lambda: stream(path))))
+            results.append(('cached', measure(lambda: stream(path))))
+        finally:
+            audio_chunks.AUDIO_CACHE_MAX_BYTES = cache_size
+            shutil.rmtree(workdir)
+
+        for name, (seconds, written, windows) in results:
+            print(f"{os.path.basename(sample)[:20]:>20} {name:>13} {seconds:>8.2f} "
+                  f"{written / 1024 / 1024:>11.1f} {windows:>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Patient name / city search latency with ILIKE scans vs trigram indexes.
+
+Run from the repository root:
+
+    python -m benchmarks.patient_search [--patients 1000000] [--database-url URL]
+
+Generates synthetic patients, then times the old ILIKE '%v%' filters against
+patient_field_match() and the search_patient_names() typeahead. On SQLite
+the new paths use the in-process n-gram index (its build time is reported);
+with --database-url pointing at PostgreSQL they use pg_trgm GIN indexes.
+"""
+import argparse
+import random
+import time
+from sqlalchemy import or_
+from benchmarks.common import make_app, time_call
+from models import db, Patient
+from utils import patient_search
+from utils.patient_search import patient_field_match, search_patient_names
+
+ONSETS = 'b br c ch d f g h j k l m n p r s sh st t th v w z'.split()
+VOWELS = 'a e i o u ai ea ie ou'.split()
+CODAS = ['', 'n', 'r', 'l', 's', 'th', 'ck', 'ng', 'rd', 'lt', 'son', 'ley', 'man', 'ton']
+STATES = ['California', 'Texas', 'Florida', 'New York', 'Pennsylvania', 'Illinois', 'Ohio',
+          'Georgia', 'North Carolina', 'Michigan', 'Massachusetts', 'Washington']
+
+# Typeahead-style queries: partial words, a typo, and a two-word name
+NAME_QUERIES = ['smi', 'smith', 'jon smi', 'tarson', 'ma']
+FIELD_QUERIES = [('name', 'smith'), ('name', 'ckley'), ('city', 'brook'), ('state', 'caro')]
+
+def make_name(rng, syllables):
+    return ''.join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS)
+                   for _ in range(syllables)).capitalize()
+
+def zipf_weights(count, offset):
+    # Roughly the US shape: the most common surname is about 1% of people
+    total, weights = 0, []
+    for rank in range(count):
+        total += 1 / (rank + offset)
+        weights.append(total)
+    return weights
+
+def populate(count, batch_size=20000):
+    rng = random.Random(9)
+    family = ['Smith', 'Johnson', 'Carson'] + [make_name(rng, rng.choice((1, 2, 2, 3))) for _ in range(60000)]
+    given = ['John', 'Maria', 'Jon', 'Mark'] + [make_name(rng, rng.choice((1, 2))) for _ in range(4000)]
+    cities = [make_name(rng, 2) + rng.choice(['', 'brook', 'ville', ' City', 'ton'])
+              for _ in range(3000)]
+    family_weights = zipf_weights(len(family), 10)
+    given_weights = zipf_weights(len(given), 5)
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        family_names = rng.choices(family, cum_weights=family_weights, k=size)
+        given_names = rng.choices(given, cum_weights=given_weights, k=size)
+        rows = [{
+            'identifier': f'P{start + i:07d}',
+            'family_name': family_names[i],
+            'given_name': given_names[i],
+            'city': rng.choice(cities),
+            'state': rng.choice(STATES),
+            'active': True,
+        } for i in range(size)]
+        db.session.execute(Patient.__table__.insert(), rows)
+        db.session.commit()
+
+def old_name_search(query, limit):
+    return Patient.query.filter(or_(
+        Patient.family_name.ilike(f'%{query}%'),
+        Patient.given_name.ilike(f'%{query}%')
+    )).order_by(Patient.family_name).limit(limit).all()
+
+def report(label, query, func):
+    count = len(func())
+    median, best = time_call(func)
+    print(f"{label:>16} {median:>10.1f} {best:>10.1f} {count:>8}  {query}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patients', type=int, default=1000000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app = make_app(database_uri=args.database_url)
+    with app.app_context():
+        start = time.perf_counter()
+        populate(args.patients)
+        print(f"Inserted {args.patients} patients in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        patient_search.ensure_trigram_indexes()
+        if patient_search.trigram_backend() == 'memory':
+            patient_search.patient_index()
+        print(f"Built trigram index ({patient_search.trigram_backend()}) "
+              f"in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'case':>16} {'median ms':>10} {'best ms':>10} {'rows':>8}  query")
+        for query in NAME_QUERIES:
+            report('ilike typeahead', query, lambda: old_name_search(query, 10))
+            report('similarity', query, lambda: search_patient_names(query))
+        for field, value in FIELD_QUERIES:
+            columns = [getattr(Patient, c) for c in patient_search.FIELD_COLUMNS[field]]
+            report('ilike filter', f'{field}:{value}',
+                   lambda: Patient.query.filter(or_(*(c.ilike(f'%{value}%') for c in columns))).limit(50).all())
+            report('trigram filter', f'{field}:{value}',
+                   lambda: Patient.query.filter(patient_field_match(field, value)).limit(50).all())
+
+if __name__ == '__main__':
+    main()
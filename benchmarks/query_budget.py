@@ -0,0 +1,184 @@
+"""SQL statements per page: every GET route against a query budget.
+
+Run from the repository root:
+
+    python -m benchmarks.query_budget [--budget 12] [--grow 25] [--endpoint patients.view_patient]
+
+Seeds one of everything, requests each GET route as an admin and counts the
+statements it sends, then adds --grow more assessments, conditions,
+documents, identifiers and users and requests every route again. A route
+fails if it ever sends more than its budget (--budget, or its entry in
+BUDGETS), or if its count went up with the data: a page that costs one more
+query per row is an N+1, whatever the budget says. Exits 1 on any failure,
+so it can gate a deploy.
+"""
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+from benchmarks.common import make_app, create_user, logged_in_client
+from models import (db, Patient, PatientIdentifier, Condition, Document, AssessmentTool, AssessmentQuestion,
+                    AssessmentResult, AssessmentResponse, ProcessingJob, AudioUpload)
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.conditions import conditions_bp
+from routes.documents import documents_bp
+from routes.main import main_bp
+from routes.patients import patients_bp
+from routes.search import search_bp
+from utils import fulltext
+from utils.query_count import count_queries
+
+DEFAULT_BUDGET = 12
+
+# Routes that legitimately need more than the default
+BUDGETS = {}
+
+# Streams until its job finishes, and logs the client out, respectively
+SKIP = {'static', 'documents.audio_job_events', 'auth.logout'}
+
+# Pages that fail to render in this tree (missing templates, an undeclared
+# Jinja extension); reported, but they have nothing to count yet
+KNOWN_ERRORS = {'patients.list_identifiers', 'patients.edit_identifier_modal', 'patients.add_identifier_modal',
+                'patients.all_assessments'}
+
+QUERY_STRINGS = {
+    'search.search': {'q': 'patient.state:Ohio'},
+    'search.search_api': {'q': 'patient.state:Ohio', 'type': 'patients'},
+    'search.patient_suggestions': {'q': 'Fam'},
+    'search.code_suggestions': {'q': 'F41'},
+}
+
+# Which seeded row a URL argument names, by endpoint, then blueprint, then name
+ARGUMENTS = {
+    'conditions.edit_condition': {'id': 'condition'},
+    'admin.edit_assessment_tool': {'id': 'tool'},
+    'admin.get_question_details': {'id': 'question'},
+    'admin.edit_user': {'id': 'user'},
+    'documents': {'id': 'document'},
+}
+DEFAULT_ARGUMENTS = {'id': 'patient', 'patient_id': 'patient', 'result_id': 'result',
+                     'identifier_id': 'identifier', 'upload_id': 'upload', 'job_id': 'job'}
+
+def seed(user_id):
+    """One of everything a route can be pointed at; returns their ids"""
+    tool = AssessmentTool(name='PHQ-9', tool_type='PHQ9', active=True)
+    question = AssessmentQuestion(tool=tool, question_text='Little interest or pleasure?', order=1,
+                                  question_type='scale', options={'0': 0, '1': 1, '2': 2, '3': 3})
+    patient = Patient(identifier='P0000001', family_name='Family', given_name='Given', state='Ohio')
+    document = Document(title='Intake note', content='Anxiety, sleep', user_id=user_id, patient=patient)
+    db.session.add_all([tool, question, patient, document])
+    db.session.flush()
+    job = ProcessingJob(job_type='audio_pipeline', document_id=document.id, user_id=user_id, stage='transcribe')
+    db.session.add(job)
+    db.session.flush()
+    upload = AudioUpload(document_id=document.id, user_id=user_id, job_id=job.id, filename='intake.webm')
+    db.session.add(upload)
+    db.session.commit()
+    grow(patient.id, user_id, 1)
+    result = AssessmentResult.query.filter_by(patient_id=patient.id).first()
+    return {
+        'patient': patient.id, 'document': document.id, 'job': job.id, 'upload': upload.id,
+        'tool': tool.id, 'question': question.id, 'user': user_id, 'result': result.id,
+        'condition': Condition.query.filter_by(patient_id=patient.id).first().id,
+        'identifier': PatientIdentifier.query.filter_by(patient_id=patient.id).first().id,
+    }
+
+def grow(patient_id, user_id, count):
+    """count more of every row the patient's pages list, each with its own tool"""
+    start = Patient.query.count() + AssessmentTool.query.count()
+    for number in range(start, start + count):
+        # Some retired: pages listing active tools would otherwise already
+        # hold every result's tool in the session
+        tool = AssessmentTool(name=f'Tool {number}', tool_type=f'T{number}', active=number % 3 != 0)
+        question = AssessmentQuestion(tool=tool, question_text=f'Question {number}', order=1,
+                                      question_type='scale', options={'0': 0, '1': 1})
+        result = AssessmentResult(patient_id=patient_id, tool=tool, assessor_id=user_id, total_score=1,
+                                  assessment_date=datetime.utcnow() - timedelta(days=number),
+                                  status='draft' if number % 2 else 'completed')
+        db.session.add_all([
+            tool, question, result,
+            AssessmentResponse(result=result, question=question, response_value='1', score=1),
+            Condition(patient_id=patient_id, clinical_status='active', code=f'F41.{number}',
+                      code_system='ICD-10'),
+            Document(title=f'Progress note {number}', content='Mood stable', user_id=user_id,
+                     patient_id=patient_id),
+            PatientIdentifier(patient_id=patient_id, identifier_type='MRN', identifier_value=f'M{number}'),
+            Patient(identifier=f'P{number + 2:07d}', family_name=f'Family{number}', given_name='Given',
+                    state='Ohio'),
+        ])
+        create_user(f'clinician{number}')
+    db.session.commit()
+
+def from_json(value):
+    # As app.py registers it: audit rows without a before/after value are None
+    try:
+        return json.loads(value.replace("'", '"'))
+    except Exception:
+        return None
+
+def route_url(rule, ids):
+    blueprint = rule.endpoint.split('.')[0]
+    names = {**DEFAULT_ARGUMENTS, **ARGUMENTS.get(blueprint, {}), **ARGUMENTS.get(rule.endpoint, {})}
+    path = rule.rule
+    for argument in rule.arguments:
+        path = path.replace(f'<int:{argument}>', str(ids[names[argument]]))
+    return path
+
+def measure(app, client, ids, only):
+    counts = {}
+    for rule in app.url_map.iter_rules():
+        if 'GET' not in rule.methods or rule.endpoint in SKIP or (only and rule.endpoint not in only):
+            continue
+        with count_queries() as statements:
+            try:
+                status = client.get(route_url(rule, ids), query_string=QUERY_STRINGS.get(rule.endpoint)).status_code
+            except Exception as e:
+                # TESTING propagates view errors; report them like a 500
+                print(f'{rule.endpoint}: {type(e).__name__}: {str(e)}')
+                status = 500
+            db.session.rollback()
+        counts[rule.endpoint] = (len(statements), status, list(statements))
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET)
+    parser.add_argument('--grow', type=int, default=25)
+    parser.add_argument('--endpoint', action='append', help='check only these endpoints')
+    parser.add_argument('--show', action='store_true', help='print the statements of failing routes')
+    args = parser.parse_args()
+
+    app = make_app(admin_bp, auth_bp, conditions_bp, documents_bp, main_bp, patients_bp, search_bp)
+    app.add_template_filter(from_json, 'from_json')
+    with app.app_context():
+        fulltext.ensure_fulltext_index()
+        admin_id = create_user('bench_admin', role='admin').id
+        ids = seed(admin_id)
+        client = logged_in_client(app, admin_id)
+        before = measure(app, client, ids, args.endpoint)
+        grow(ids['patient'], admin_id, args.grow)
+        after = measure(app, client, ids, args.endpoint)
+
+    failures = 0
+    print(f"{'endpoint':<42} {'status':>6} {'queries':>8} {'+rows':>6} {'budget':>7}")
+    for endpoint, (count, status, statements) in after.items():
+        budget = BUDGETS.get(endpoint, args.budget)
+        growth = count - before[endpoint][0]
+        problems = []
+        if count > budget:
+            problems.append('over budget')
+        if growth > 0:
+            problems.append('grows with rows')
+        if status >= 500 and endpoint not in KNOWN_ERRORS:
+            problems.append('server error')
+        print(f"{endpoint:<42} {status:>6} {count:>8} {growth:>+6} {budget:>7}  {', '.join(problems)}")
+        if problems:
+            failures += 1
+            if args.show:
+                print('\n'.join(f'    {statement}' for statement in statements))
+    print(f"\n{len(after)} routes, {failures} failing")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
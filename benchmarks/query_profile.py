@@ -0,0 +1,70 @@
+"""Cost of the per-request SQL profiler, and a check that its counts are right.
+
+Run from the repository root:
+
+    python -m benchmarks.query_profile [--assessments 50] [--requests 200]
+
+Times the patient chart page on two identical apps, one without and one
+with init_query_profiler(), then compares each response's X-Query-Count
+with the statements utils/query_count.py saw, and prints the per-endpoint
+totals as the admin page and the JSON dump report them.
+"""
+import json
+import argparse
+from benchmarks.common import make_app, create_user, logged_in_client, time_call
+from benchmarks.query_budget import from_json, grow, seed
+from routes.admin import admin_bp
+from routes.auth import auth_bp
+from routes.conditions import conditions_bp
+from routes.documents import documents_bp
+from routes.main import main_bp
+from routes.patients import patients_bp
+from routes.search import search_bp
+from utils import query_profile
+from utils.query_count import count_queries
+
+def build(profiled):
+    app = make_app(admin_bp, auth_bp, conditions_bp, documents_bp, main_bp, patients_bp, search_bp)
+    app.add_template_filter(from_json, 'from_json')
+    if profiled:
+        query_profile.init_query_profiler(app)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--assessments', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    results = {}
+    for profiled in (False, True):
+        app = build(profiled)
+        with app.app_context():
+            user_id = create_user('bench_admin', role='admin').id
+            ids = seed(user_id)
+            grow(ids['patient'], user_id, args.assessments)
+            client = logged_in_client(app, user_id)
+            urls = [f"/patients/{ids['patient']}", f"/patients/{ids['patient']}/assessments", '/dashboard']
+            client.get(urls[0])
+            results[profiled] = time_call(lambda: client.get(urls[0]), repeat=args.requests)
+
+            if profiled:
+                print(f"{'url':<28} {'X-Query-Count':>14} {'counted':>8} {'X-DB-Time-Ms':>13}")
+                for url in urls:
+                    with count_queries() as statements:
+                        response = client.get(url)
+                    print(f"{url:<28} {response.headers['X-Query-Count']:>14} {len(statements):>8} "
+                          f"{response.headers['X-DB-Time-Ms']:>13}")
+                print()
+                for stats in query_profile.endpoint_stats():
+                    print(f"{stats.endpoint:<28} {stats.requests:>5} requests, {stats.queries / stats.requests:.1f} "
+                          f"queries and {stats.db_ms / stats.requests:.2f} DB ms each; slowest "
+                          f"{stats.slowest[0].ms:.2f} ms: {stats.slowest[0].statement[:60]}...")
+                dumped = json.loads(query_profile.stats_json())
+                print(f"JSON dump: {len(dumped['endpoints'])} endpoints\n")
+
+    off, on = results[False][0], results[True][0]
+    print(f"Chart page median: {off:.2f} ms unprofiled, {on:.2f} ms profiled ({on - off:+.2f} ms)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""HTQL searches over patients with many conditions and documents: outer
+joins + DISTINCT vs EXISTS semi-joins.
+
+Run from the repository root:
+
+    python -m benchmarks.search_fanout [--patients 20000] [--conditions 40] [--documents 10]
+
+"joined" is the shape the planner produced before, outer joining every
+referenced child table and de-duplicating the fan-out; "rows in" is how many
+joined rows that shape fed into DISTINCT. "exists" is the current plan.
+"""
+import argparse
+import random
+import time
+from sqlalchemy import func
+from benchmarks.common import make_app, create_user, time_call
+from models import db, Patient, Document, Condition
+from utils.htql import compile_query
+from utils.search import flat_condition, plan_query
+
+QUERIES = [
+    ('patient', 'condition.status:active'),
+    ('patient', 'condition.code:F32 AND patient.state:Ohio'),
+    ('patient', 'document.title:intake'),
+    ('patient', 'condition.code:F11 OR document.title:intake'),
+    ('document', 'condition.code:F41 AND patient.state:Ohio'),
+]
+CODES = ['F32.9', 'F41.1', 'F11.20', 'F43.10', 'I10', 'E11.9', 'J45.909', 'G47.00']
+
+def populate(count, user_id, conditions=40, documents=10, batch_size=2000):
+    rng = random.Random(5)
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        db.session.execute(Patient.__table__.insert(), [{
+            'identifier': f'P{start + i:07d}',
+            'family_name': f'Family{rng.randrange(5000)}',
+            'given_name': f'Given{rng.randrange(500)}',
+            'state': rng.choice(['Ohio', 'Texas', 'Oregon', 'Maine']),
+            'active': True,
+        } for i in range(size)])
+        db.session.execute(Condition.__table__.insert(), [{
+            'patient_id': start + i + 1,
+            'clinical_status': rng.choice(['active', 'active', 'resolved']),
+            'code': rng.choice(CODES),
+            'severity': rng.choice(['mild', 'moderate', 'severe']),
+        } for i in range(size) for _ in range(rng.randrange(conditions // 2, conditions * 3 // 2 + 1))])
+        db.session.execute(Document.__table__.insert(), [{
+            'title': rng.choice(['Progress note', 'Intake assessment', 'Medication review']),
+            'user_id': user_id,
+            'patient_id': start + i + 1,
+        } for i in range(size) for _ in range(rng.randrange(documents * 2 + 1))])
+        db.session.commit()
+
+def joined(entity, query):
+    compiled = compile_query(query)
+    if entity == 'patient':
+        matches = Patient.query
+        for other, model in (('condition', Condition), ('document', Document)):
+            if other in compiled.entities:
+                matches = matches.join(model, model.patient_id == Patient.id, isouter=True)
+    else:
+        matches = Document.query.join(Patient, Document.patient_id == Patient.id, isouter=True).join(
+            Condition, Patient.id == Condition.patient_id, isouter=True)
+    return matches.filter(flat_condition(compiled.ast))
+
+def ids(matches, entity):
+    model = Patient if entity == 'patient' else Document
+    return matches.with_entities(model.id)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--conditions', type=int, default=40)
+    parser.add_argument('--documents', type=int, default=10)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        start = time.perf_counter()
+        populate(args.patients, create_user().id, args.conditions, args.documents)
+        db.session.execute(db.text('ANALYZE'))
+        print(f"Inserted {args.patients} patients, {Condition.query.count()} conditions and "
+              f"{Document.query.count()} documents in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'case':>8} {'median ms':>10} {'best ms':>10} {'rows in':>9} {'matches':>8}  query")
+        for entity, query in QUERIES:
+            old = joined(entity, query)
+            new = plan_query(entity, compile_query(query))
+            rows_in = db.session.query(func.count()).select_from(ids(old, entity).subquery()).scalar()
+            for label, matches in (('joined', ids(old, entity).distinct()), ('exists', ids(new, entity))):
+                count = len(matches.all())
+                median, best = time_call(lambda: matches.all(), repeat=3)
+                shown = rows_in if label == 'joined' else count
+                print(f"{label:>8} {median:>10.1f} {best:>10.1f} {shown:>9} {count:>8}  {entity}: {query}")
+
+if __name__ == '__main__':
+    main()
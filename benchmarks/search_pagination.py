@@ -0,0 +1,96 @@
+"""Broad HTQL searches: loading every match vs the first keyset page.
+
+Run from the repository root:
+
+    python -m benchmarks.search_pagination [--patients 100000]
+
+"all rows" is what the search page used to do (every match and its
+relationships loaded up front); "first page" renders one 50-row page plus
+the capped count.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from benchmarks.common import make_app, create_user
+from models import db, Patient, Document, DocumentBody, Condition
+from utils import fulltext
+from utils.search import plan_query, search_documents, search_patients
+from utils.htql import compile_query
+
+QUERIES = [
+    ('patients', 'patient.state:Ohio'),
+    ('patients', 'condition.status:active'),
+    ('documents', 'document.title:note'),
+    ('documents', 'document.text:anxiety'),
+]
+
+def populate(count, user_id, batch_size=10000):
+    rng = random.Random(11)
+    words = 'anxiety sleep mood stable follow plan medication review'.split()
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        db.session.execute(Patient.__table__.insert(), [{
+            'identifier': f'P{start + i:07d}',
+            'family_name': f'Family{rng.randrange(20000)}',
+            'given_name': f'Given{rng.randrange(2000)}',
+            'state': rng.choice(['Ohio', 'Texas', 'Oregon']),
+            'active': True,
+        } for i in range(size)])
+        db.session.execute(Condition.__table__.insert(), [{
+            'patient_id': start + i + 1, 'clinical_status': 'active', 'code': 'F41.1',
+        } for i in range(size) for _ in range(rng.randrange(3))])
+        db.session.execute(Document.__table__.insert(), [{
+            'id': start + i + 1,
+            'title': f'Progress note {start + i}',
+            'user_id': user_id,
+            'patient_id': start + i + 1,
+        } for i in range(size)])
+        db.session.execute(DocumentBody.__table__.insert(), [{
+            'document_id': start + i + 1,
+            'content': ' '.join(rng.choice(words) for _ in range(80)),
+        } for i in range(size)])
+        db.session.commit()
+
+def load_all(kind, query):
+    rows = plan_query(kind[:-1], compile_query(query)).all()
+    # The results template touched these on every row
+    for row in rows:
+        row.conditions if kind == 'patients' else row.patient
+    return len(rows)
+
+def first_page(kind, query):
+    page = (search_patients if kind == 'patients' else search_documents)(query)
+    for row in page:
+        row.conditions if kind == 'patients' else row.patient
+    page.total_label
+    return len(page)
+
+def measure(func, *args):
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = func(*args)
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024, rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patients', type=int, default=100000)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        user = create_user()
+        populate(args.patients, user.id)
+        fulltext.ensure_fulltext_index()
+        print(f"{'case':>12} {'ms':>9} {'peak MB':>9} {'rows':>8}  query")
+        for kind, query in QUERIES:
+            for label, func in (('all rows', load_all), ('first page', first_page)):
+                elapsed, peak, rows = measure(func, kind, query)
+                print(f"{label:>12} {elapsed:>9.1f} {peak:>9.1f} {rows:>8}  {kind}: {query}")
+
+if __name__ == '__main__':
+    main()
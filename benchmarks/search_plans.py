@@ -0,0 +1,77 @@
+"""EXPLAIN check for HTQL search plans.
+
+Run from the repository root:
+
+    python -m benchmarks.search_plans [--database-url URL]
+
+Builds a small fan-out dataset, plans representative searches and exits
+with status 1 if any of them joins a child table, de-duplicates rows, or (on
+SQLite) scans condition/document instead of probing them through their
+patient_id index.
+"""
+import argparse
+import re
+import sys
+from sqlalchemy import text
+from benchmarks.common import make_app, create_user
+from benchmarks.search_fanout import populate
+from models import db
+from utils.htql import compile_query
+from utils.search import plan_query
+
+CHECKS = [
+    ('patient', 'condition.code:F32'),
+    ('patient', 'condition.code:F32 AND condition.status:active'),
+    ('patient', 'NOT condition.code:F32 AND patient.state:Ohio'),
+    ('patient', 'document.title:intake OR condition.severity:severe'),
+    ('patient', 'depression'),
+    ('document', 'condition.code:F41 AND patient.state:Ohio'),
+    ('document', 'document.title:note AND NOT condition.status:resolved'),
+]
+CHILD_TABLES = {'patient': ('condition', 'document'), 'document': ('condition',)}
+
+def explain(statement):
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + sql)).fetchall()
+    return sql, [row[-1] for row in rows]
+
+def problems(entity, sql, plan):
+    found = []
+    if re.search(r'\bDISTINCT\b', sql):
+        found.append('uses DISTINCT')
+    for table in CHILD_TABLES[entity]:
+        if re.search(rf'\bJOIN {table}\b', sql):
+            found.append(f'joins {table}')
+    for line in plan:
+        if 'TEMP B-TREE FOR DISTINCT' in line or line.lstrip().startswith(('Unique', 'HashAggregate')):
+            found.append(f'de-duplicates rows: {line.strip()}')
+        for table in CHILD_TABLES[entity]:
+            if re.match(rf'\s*SCAN {table}\b', line):
+                found.append(f'scans {table}: {line.strip()}')
+    return found
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app = make_app(database_uri=args.database_url)
+    failures = 0
+    with app.app_context():
+        populate(2000, create_user().id, conditions=20, documents=5)
+        db.session.execute(text('ANALYZE'))
+        for entity, query in CHECKS:
+            sql, plan = explain(plan_query(entity, compile_query(query)).statement)
+            found = problems(entity, sql, plan)
+            print(f"{'FAIL' if found else 'ok':>4}  {entity}: {query}")
+            for line in plan:
+                print(f"        {line}")
+            for problem in found:
+                print(f"      ! {problem}")
+            failures += bool(found)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
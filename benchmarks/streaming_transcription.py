@@ -0,0 +1,67 @@
+"""Time-to-first-text and total time for windowed vs whole-file transcription.
+
+Run from the repository root:
+
+    python -m benchmarks.streaming_transcription
+
+Uses the offline fake client (LLM_BACKEND=fake) whose latency scales with the
+audio it is given, so a single whole-file call models a long Whisper request.
+"""
+import math
+import os
+import struct
+import tempfile
+import time
+import wave
+
+os.environ['LLM_BACKEND'] = 'fake'
+os.environ.setdefault('FAKE_LLM_LATENCY', '2.0')
+os.environ.setdefault('TRANSCRIPTION_PROCESSES', '4')
+
+from utils import transcription
+from utils.audio_chunks import iter_audio_windows
+
+SAMPLE_RATE = 16000
+SPEECH_SECONDS = 25
+PAUSE_SECONDS = 1
+SEGMENTS = 12  # ~5 minutes of audio
+
+def make_recording(path):
+    """Alternate 25 s of tone with 1 s pauses, roughly like dictated speech"""
+    tone = b''.join(struct.pack('<h', int(8000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE)))
+                    for i in range(SAMPLE_RATE))
+    silence = b'\x00\x00' * SAMPLE_RATE
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        for _ in range(SEGMENTS):
+            for _ in range(SPEECH_SECONDS):
+                wav.writeframes(tone)
+            for _ in range(PAUSE_SECONDS):
+                wav.writeframes(silence)
+
+def main():
+    latency = float(os.environ['FAKE_LLM_LATENCY'])
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'recording.wav')
+        make_recording(path)
+        duration = transcription.audio_duration(path)
+        windows = list(iter_audio_windows(path))
+        print(f"{duration:.0f}s recording -> {len(windows)} windows "
+              f"({sum(1 for w in windows if w.overlap)} hard cuts with overlap)")
+
+        # A whole-file request pays latency proportional to the full recording
+        whole_file = latency * len(windows)
+        print(f"{'whole file':>12}: first text {whole_file:6.1f}s, total {whole_file:6.1f}s (modelled)")
+
+        start = time.perf_counter()
+        first = None
+        for update in transcription.stream_transcription(path, backend='openai'):
+            if first is None:
+                first = time.perf_counter() - start
+        total = time.perf_counter() - start
+        print(f"{'streaming':>12}: first text {first:6.1f}s, total {total:6.1f}s ({transcription.TRANSCRIPTION_PROCESSES} processes)")
+
+if __name__ == '__main__':
+    main()
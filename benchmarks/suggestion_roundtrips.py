@@ -0,0 +1,106 @@
+"""Code suggestion round trips while typing: one request per keystroke vs
+prefetching candidates and narrowing them in the browser.
+
+Run from the repository root (needs node on PATH):
+
+    python -m benchmarks.suggestion_roundtrips [--codes 72000]
+
+Replays typing sessions through static/js/htql-suggestions.js in node, with
+fetch answered from /api/code-suggestions on a synthetic ICD-10-CM sized code
+set (see benchmarks/code_suggestions.py). Every keystroke's suggestions are
+checked against the server's own top 10 for the full text typed so far.
+"""
+import os
+import json
+import argparse
+import subprocess
+from benchmarks.common import ROOT, make_app, create_user, logged_in_client
+from benchmarks.code_suggestions import generate
+from models import db, ICD10Code
+from routes.search import search_bp
+
+SESSIONS = ['F41.1', 'S72.32', 'displaced fracture of femur', 'generalized anxiety disorder',
+            'chronic asthma of lung', 'mild burn of skin, left', "Parkinson's", 'zzz']
+
+# Loads the real client class with just enough DOM for its constructor, and
+# answers fetch from the responses prepared below, counting requests
+HARNESS = r"""
+const fs = require('fs');
+const { sessions, responses } = JSON.parse(fs.readFileSync(0, 'utf8'));
+global.document = { getElementById: () => null, addEventListener: () => {} };
+const HTQLSuggestions = require(process.argv[1]);
+let fetched = [];
+global.fetch = async (url) => {
+    const q = new URL(url, 'http://localhost').searchParams.get('q');
+    fetched.push(q);
+    return { ok: true, json: async () => responses[q] };
+};
+(async () => {
+    const results = {};
+    for (const text of sessions) {
+        const client = new HTQLSuggestions({ parentNode: { querySelector: () => null },
+                                             addEventListener: () => {} });
+        fetched = [];
+        results[text] = { keystrokes: [] };
+        for (let i = 1; i <= text.length; i++) {
+            const suggestions = await client.getCodeSuggestions(text.slice(0, i));
+            results[text].keystrokes.push(suggestions.map(s => [s.code, s.description, s.system]));
+        }
+        results[text].fetched = fetched;
+    }
+    console.log(JSON.stringify(results));
+})();
+"""
+
+def normalize(text):
+    # htql-suggestions.js normalizeTerm
+    return ' '.join(text.translate(str.maketrans('', '', ";'[]\\")).split()).lower()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--codes', type=int, default=72000)
+    args = parser.parse_args()
+
+    app = make_app(search_bp)
+    with app.app_context():
+        db.session.execute(ICD10Code.__table__.insert(), [
+            {'code': code, 'description': description, 'category': category}
+            for code, (description, category) in generate(args.codes).items()])
+        db.session.commit()
+        client = logged_in_client(app, create_user().id)
+
+        expected, responses, sent = {}, {}, {}
+        for text in SESSIONS:
+            expected[text], sent[text] = [], 0
+            for i in range(1, len(text) + 1):
+                typed = text[:i]
+                response = client.get('/api/code-suggestions', query_string={'q': typed})
+                sent[text] += len(response.data)
+                expected[text].append([[s['code'], s['description'], s['system']] for s in response.get_json()])
+                term = normalize(typed)
+                if term not in responses:
+                    responses[term] = client.get('/api/code-suggestions', query_string={
+                        'q': term, 'limit': 100, 'format': 'compact'}).get_json()
+
+    output = subprocess.run(['node', '-e', HARNESS, os.path.join(ROOT, 'static', 'js', 'htql-suggestions.js')],
+                            input=json.dumps({'sessions': SESSIONS, 'responses': responses}),
+                            capture_output=True, text=True, check=True).stdout
+    results = json.loads(output.splitlines()[-1])
+
+    print(f"{'typed':>30} {'keys':>5} {'requests':>14} {'KB':>13}  identical")
+    total_keys = total_requests = 0
+    for text in SESSIONS:
+        result = results[text]
+        mismatches = [i + 1 for i, (got, want) in enumerate(zip(result['keystrokes'], expected[text]))
+                      if got != want]
+        received = sum(len(json.dumps(responses[q], separators=(',', ':'))) for q in result['fetched'])
+        total_keys += len(text)
+        total_requests += len(result['fetched'])
+        print(f"{text!r:>30} {len(text):>5} {len(text):>6} -> {len(result['fetched']):>3} "
+              f"{sent[text] / 1024:>5.1f} -> {received / 1024:>5.1f}  "
+              f"{'yes' if not mismatches else 'no, keystrokes ' + ', '.join(map(str, mismatches))}")
+    print(f"\n{total_requests} requests for {total_keys} keystrokes "
+          f"({100 * (1 - total_requests / total_keys):.0f}% fewer round trips)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Measure import time and resident memory with eager vs lazy Whisper loading.
+
+Run from the repository root:
+
+    python -m benchmarks.transcription_startup
+
+Each case runs in a fresh interpreter. "eager" reproduces the old module-level
+whisper.load_model() in routes/audio.py; "lazy" imports the transcription
+engine the way a web worker now does and never touches the model.
+"""
+import json
+import os
+import subprocess
+import sys
+from benchmarks.common import ROOT
+
+CASES = {
+    'eager': (
+        "import whisper\n"
+        "whisper.load_model(os.environ.get('WHISPER_MODEL', 'base'))\n"
+    ),
+    'lazy': (
+        "import utils.transcription\n"
+    ),
+}
+
+PROBE = """
+import os, time, resource, json
+start = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - start
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss_mb}}))
+"""
+
+def run_case(body):
+    proc = subprocess.run([sys.executable, '-c', PROBE.format(body=body)],
+                          cwd=ROOT, capture_output=True, text=True, env=dict(os.environ))
+    if proc.returncode != 0:
+        return None, proc.stderr.strip().splitlines()[-1]
+    return json.loads(proc.stdout.strip().splitlines()[-1]), None
+
+def main():
+    print(f"{'case':>8} {'startup (s)':>12} {'peak RSS (MB)':>14}")
+    for name, body in CASES.items():
+        result, error = run_case(body)
+        if error:
+            print(f"{name:>8} failed: {error}")
+            continue
+        print(f"{name:>8} {result['seconds']:>12.2f} {result['rss_mb']:>14.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Measure /documents/<id>/upload-audio latency as recording length grows.
+
+Run from the repository root:
+
+    python -m benchmarks.upload_latency
+
+Processing happens in the job worker, so request latency should stay flat
+(it only grows with the bytes written to disk) regardless of recording length.
+"""
+import io
+import wave
+from benchmarks.common import make_app, create_user, logged_in_client, time_call
+from models import db, Document, ProcessingJob
+from routes.documents import documents_bp
+
+SAMPLE_RATE = 8000
+DURATIONS = [10, 60, 300, 600]  # seconds of audio
+
+def make_wav(seconds):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(b'\x00\x00' * SAMPLE_RATE * seconds)
+    return buffer.getvalue()
+
+def main():
+    app = make_app(documents_bp)
+    with app.app_context():
+        user = create_user()
+        document = Document(title='Benchmark recording', user_id=user.id)
+        db.session.add(document)
+        db.session.commit()
+        user_id, document_id = user.id, document.id
+
+    client = logged_in_client(app, user_id)
+    print(f"{'audio (s)':>10} {'size (MB)':>10} {'median (ms)':>12} {'min (ms)':>10}")
+    for seconds in DURATIONS:
+        payload = make_wav(seconds)
+
+        def upload():
+            response = client.post(
+                f'/documents/{document_id}/upload-audio',
+                data={'audio': (io.BytesIO(payload), 'recording.wav')},
+                content_type='multipart/form-data'
+            )
+            assert response.status_code == 202, response.get_data(as_text=True)
+
+        median, fastest = time_call(upload)
+        print(f"{seconds:>10} {len(payload) / 1e6:>10.1f} {median:>12.1f} {fastest:>10.1f}")
+
+    with app.app_context():
+        print(f"Jobs queued: {ProcessingJob.query.count()}")
+
+if __name__ == '__main__':
+    main()
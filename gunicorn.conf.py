@@ -0,0 +1,13 @@
+# gunicorn -c gunicorn.conf.py app:app
+#
+# For /metrics to add up every worker, export PROMETHEUS_MULTIPROC_DIR as an
+# empty directory before starting gunicorn and worker.py (see utils/metrics.py).
+import os
+from utils.metrics import mark_process_dead
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+
+def child_exit(server, worker):
+    # A dead worker's connections are no longer in use
+    mark_process_dead(worker.pid)
@@ -1,9 +1,10 @@
-import csv
-from app import app, db
-from models import ICD10Code
+import sys
+import argparse
+from app import app
+from utils.icd10_import import CodeRow, IMPORT_BATCH_SIZE, import_icd10_codes, import_icd10_file
 
-def import_icd10_codes():
-    # Since CDC FTP is not accessible, we'll use a basic set of common codes
+def sample_codes():
+    # A basic set of common codes for when no CMS release file is at hand
     codes = {
         'E11': 'Type 2 diabetes mellitus',
         'E11.0': 'Type 2 diabetes with hyperosmolarity',
@@ -29,23 +30,33 @@ def import_icd10_codes():
         'F41.1': 'Generalized anxiety disorder'
     }
     
+    return [CodeRow(code, description, code.split('.')[0]) for code, description in codes.items()]
+
+def main():
+    parser = argparse.ArgumentParser(description='Load ICD-10-CM codes into icd10_code')
+    parser.add_argument('path', nargs='?',
+                        help='CMS icd10cm_order/icd10cm_codes .txt file or release .zip '
+                             '(default: the built-in sample codes)')
+    parser.add_argument('--replace', action='store_true', help='empty the table before loading')
+    parser.add_argument('--prune', action='store_true', help='delete codes that are not in the file')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
     with app.app_context():
-        # Clear existing codes
-        ICD10Code.query.delete()
-        
-        # Import new codes
-        for code, description in codes.items():
-            category = code.split('.')[0] if '.' in code else code
-            
-            icd10_code = ICD10Code(
-                code=code,
-                description=description,
-                category=category
-            )
-            db.session.add(icd10_code)
-        
-        db.session.commit()
-        print('ICD-10 codes imported successfully')
+        try:
+            if args.path:
+                stats = import_icd10_file(args.path, replace=args.replace, prune=args.prune,
+                                          batch_size=args.batch_size)
+            else:
+                stats = import_icd10_codes(sample_codes(), replace=args.replace, prune=args.prune,
+                                           batch_size=args.batch_size)
+        except (OSError, ValueError) as e:
+            print(f'Error importing ICD-10 codes: {str(e)}')
+            sys.exit(1)
+        print(f'ICD-10 codes imported successfully: {stats.rows} rows read, {stats.inserted} new, '
+              f'{stats.updated} changed, {stats.deleted} deleted')
+        print(f'Loaded in {stats.load_seconds:.2f}s ({stats.rows / max(stats.load_seconds, 1e-9):,.0f} rows/s), '
+              f'{stats.seconds:.2f}s total ({stats.rows / max(stats.seconds, 1e-9):,.0f} rows/s)')
 
 if __name__ == '__main__':
-    import_icd10_codes()
+    main()
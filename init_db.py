@@ -1,13 +1,19 @@
 from app import app, db
 from models import User
+from utils.fulltext import drop_fulltext_index, ensure_fulltext_index
+from utils.patient_search import ensure_trigram_indexes
 
 def init_database():
     with app.app_context():
         # Drop and recreate all tables
         print("Dropping all tables...")
+        drop_fulltext_index()
         db.drop_all()
         print("Creating all tables...")
         db.create_all()
+        print("Creating search indexes...")
+        ensure_fulltext_index()
+        ensure_trigram_indexes()
         
         # Create test user
         print("Creating test user...")
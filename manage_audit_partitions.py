@@ -0,0 +1,58 @@
+import sys
+import argparse
+from datetime import date
+from app import app
+from utils.audit_partitions import (AUDIT_ONLINE_MONTHS, AUDIT_PREMAKE_MONTHS, archive_dir, archive_month,
+                                    archive_old_months, ensure_partitions, list_partitions)
+
+def parse_month(value):
+    try:
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected YYYY-MM, got {value!r}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage monthly audit_log partitions and their archives')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='show partitions and their estimated row counts')
+    ensure = commands.add_parser('ensure', help='create partitions for the coming months')
+    ensure.add_argument('--months-ahead', type=int, default=AUDIT_PREMAKE_MONTHS)
+    archive = commands.add_parser('archive', help='archive months older than the online window')
+    archive.add_argument('--online-months', type=int, default=AUDIT_ONLINE_MONTHS,
+                         help='months kept in audit_log, counting the current one')
+    archive.add_argument('--month', type=parse_month, help='archive just this month (YYYY-MM)')
+    maintain = commands.add_parser('maintain', help='ensure, then archive; run daily')
+    maintain.add_argument('--months-ahead', type=int, default=AUDIT_PREMAKE_MONTHS)
+    maintain.add_argument('--online-months', type=int, default=AUDIT_ONLINE_MONTHS)
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'list':
+                partitions = list_partitions()
+                if not partitions:
+                    print('audit_log is not partitioned (SQLite, or the migration has not run)')
+                for partition in partitions:
+                    print(f'{partition.name:<24} {partition.start} .. {partition.end}  ~{partition.rows:,} rows')
+                print(f'Archives: {archive_dir()}')
+                return
+            if args.command in ('ensure', 'maintain'):
+                created = ensure_partitions(args.months_ahead)
+                print(f'Created {len(created)} partition(s)' + (f": {', '.join(created)}" if created else ''))
+            if args.command in ('archive', 'maintain'):
+                if getattr(args, 'month', None):
+                    archived = [archive_month(args.month)]
+                else:
+                    archived = archive_old_months(args.online_months)
+                for stats in archived:
+                    if stats.rows:
+                        print(f'{stats.month:%Y-%m}: {stats.rows:,} rows -> {stats.path} ({stats.seconds:.1f}s)')
+                print(f'Archived {sum(stats.rows for stats in archived):,} row(s) '
+                      f'from {sum(1 for stats in archived if stats.rows)} month(s)')
+        except Exception as e:
+            print(f'Error managing audit log partitions: {str(e)}')
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
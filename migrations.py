@@ -1,12 +1,16 @@
 from flask_migrate import Migrate
 from app import app
 from models import db
+from utils.fulltext import ensure_fulltext_index
+from utils.patient_search import ensure_trigram_indexes
 
 migrate = Migrate(app, db)
 
 def init_db():
     with app.app_context():
         db.create_all()
+        ensure_fulltext_index()
+        ensure_trigram_indexes()
 
 if __name__ == '__main__':
     init_db()
@@ -90,9 +90,24 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the full-text and trigram indexes live outside the models (see
+    # utils/fulltext.py and utils/patient_search.py), so keep autogenerate
+    # from dropping them
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == 'table' and name.startswith('document_fts'):
+            return False
+        if type_ == 'column' and name == 'search_vector':
+            return False
+        if type_ == 'index' and (name == 'idx_document_search_vector'
+                                 or name.endswith('_trgm')):
+            return False
+        return True
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
@@ -0,0 +1,25 @@
+"""Add assessment result assessor/date index
+
+Revision ID: 3b7f0c9e2d41
+Revises: 9e4b7d2c6a18
+Create Date: 2026-10-19 02:03:31.871950
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7f0c9e2d41'
+down_revision = '9e4b7d2c6a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_assessment_result_assessor_date', 'assessment_result',
+                    ['assessor_id', 'assessment_date', 'status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_assessment_result_assessor_date', table_name='assessment_result')
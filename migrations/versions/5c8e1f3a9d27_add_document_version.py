@@ -0,0 +1,25 @@
+"""Add document version
+
+Revision ID: 5c8e1f3a9d27
+Revises: d2b8f6a05c19
+Create Date: 2026-10-18 23:55:02.614093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8e1f3a9d27'
+down_revision = 'd2b8f6a05c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A plain ADD COLUMN, so SQLite keeps the document_fts triggers
+    op.add_column('document', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('document', 'version')
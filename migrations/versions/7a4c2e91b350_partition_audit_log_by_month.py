@@ -0,0 +1,92 @@
+"""Partition audit log by month
+
+Revision ID: 7a4c2e91b350
+Revises: e6b3d91f4c28
+Create Date: 2026-10-18 21:12:37.604118
+
+"""
+from datetime import date, datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4c2e91b350'
+down_revision = 'e6b3d91f4c28'
+branch_labels = None
+depends_on = None
+
+
+# Partitions made ahead of the current month; manage_audit_partitions.py keeps this up
+PREMAKE_MONTHS = 3
+
+COLUMNS = ('id, timestamp, user_id, action, resource_type, resource_id, details, '
+           'ip_address, user_agent, before_value, after_value')
+
+TABLE_DDL = """CREATE TABLE {name} (
+    id INTEGER NOT NULL DEFAULT nextval('audit_log_id_seq'),
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES "user" (id),
+    action VARCHAR(100) NOT NULL,
+    resource_type VARCHAR(50) NOT NULL,
+    resource_id INTEGER,
+    details TEXT,
+    ip_address VARCHAR(45),
+    user_agent VARCHAR(200),
+    before_value TEXT,
+    after_value TEXT,
+    PRIMARY KEY ({key})
+){partitioning}"""
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _swap_in(new_table_ddl):
+    """Copy audit_log into a new table built by new_table_ddl and drop the old one"""
+    op.execute("ALTER TABLE audit_log RENAME TO audit_log_old")
+    op.execute("ALTER TABLE audit_log_old RENAME CONSTRAINT audit_log_pkey TO audit_log_old_pkey")
+    op.execute("ALTER INDEX idx_audit_timestamp RENAME TO idx_audit_timestamp_old")
+    op.execute("ALTER INDEX idx_audit_action_type RENAME TO idx_audit_action_type_old")
+    new_table_ddl()
+    op.execute(f"INSERT INTO audit_log ({COLUMNS}) SELECT {COLUMNS} FROM audit_log_old")
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id")
+    op.execute("DROP TABLE audit_log_old")
+    op.execute("CREATE INDEX idx_audit_timestamp ON audit_log (timestamp)")
+    op.execute("CREATE INDEX idx_audit_action_type ON audit_log (action, resource_type)")
+
+
+def upgrade():
+    # SQLite keeps a plain table; manage_audit_partitions.py archives it by month all the same
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    oldest = bind.execute(sa.text("SELECT min(timestamp) FROM audit_log")).scalar()
+    now = datetime.utcnow()
+    month = date((oldest or now).year, (oldest or now).month, 1)
+    last = _add_months(date(now.year, now.month, 1), PREMAKE_MONTHS)
+
+    def partitioned_table():
+        # The partition key has to be part of the primary key
+        op.execute(TABLE_DDL.format(name='audit_log', key='id, timestamp',
+                                    partitioning=' PARTITION BY RANGE (timestamp)'))
+        op.execute("CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT")
+        start = month
+        while start <= last:
+            end = _add_months(start, 1)
+            op.execute(f"CREATE TABLE audit_log_y{start.year:04d}m{start.month:02d} PARTITION OF audit_log "
+                       f"FOR VALUES FROM ('{start}') TO ('{end}')")
+            start = end
+
+    _swap_in(partitioned_table)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # Archived months are not restored; load them back from their files if needed
+    _swap_in(lambda: op.execute(TABLE_DDL.format(name='audit_log', key='id', partitioning='')))
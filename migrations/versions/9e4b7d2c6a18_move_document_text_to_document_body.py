@@ -0,0 +1,214 @@
+"""Move document text to document_body
+
+Revision ID: 9e4b7d2c6a18
+Revises: 5c8e1f3a9d27
+Create Date: 2026-10-19 01:12:47.205311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7d2c6a18'
+down_revision = '5c8e1f3a9d27'
+branch_labels = None
+depends_on = None
+
+
+BODY_COLUMNS = ['content', 'transcription', 'meat_monitoring', 'meat_assessment', 'meat_evaluation', 'meat_treatment']
+
+# The full-text index from add_document_fulltext reads the document row only
+POSTGRES_DROP_ROW_INDEX = [
+    "DROP INDEX IF EXISTS idx_document_search_vector",
+    "ALTER TABLE document DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_DROP_ROW_INDEX = [
+    "DROP TRIGGER IF EXISTS document_fts_update",
+    "DROP TRIGGER IF EXISTS document_fts_delete",
+    "DROP TRIGGER IF EXISTS document_fts_insert",
+    "DROP TABLE IF EXISTS document_fts",
+]
+
+POSTGRES_ROW_INDEX = [
+    """ALTER TABLE document ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(content, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(transcription, '')), 'C')
+        ) STORED""",
+    "CREATE INDEX idx_document_search_vector ON document USING gin (search_vector)",
+]
+
+SQLITE_ROW_INDEX = [
+    """CREATE VIRTUAL TABLE document_fts USING fts5(
+        title, content, transcription,
+        content='document', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER document_fts_insert AFTER INSERT ON document BEGIN
+        INSERT INTO document_fts(rowid, title, content, transcription)
+        VALUES (new.id, new.title, new.content, new.transcription);
+    END""",
+    """CREATE TRIGGER document_fts_delete AFTER DELETE ON document BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, content, transcription)
+        VALUES ('delete', old.id, old.title, old.content, old.transcription);
+    END""",
+    """CREATE TRIGGER document_fts_update AFTER UPDATE OF title, content, transcription ON document BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, content, transcription)
+        VALUES ('delete', old.id, old.title, old.content, old.transcription);
+        INSERT INTO document_fts(rowid, title, content, transcription)
+        VALUES (new.id, new.title, new.content, new.transcription);
+    END""",
+    "INSERT INTO document_fts(document_fts) VALUES ('rebuild')",
+]
+
+# Same objects as utils/fulltext.py creates: title comes from document and
+# content/transcription from document_body, kept current by triggers on both
+POSTGRES_SPLIT_INDEX = [
+    "ALTER TABLE document ADD COLUMN search_vector tsvector",
+    """CREATE OR REPLACE FUNCTION document_search_vector(title text, content text, transcription text)
+        RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+            SELECT setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                   setweight(to_tsvector('english', coalesce(content, '')), 'B') ||
+                   setweight(to_tsvector('english', coalesce(transcription, '')), 'C')
+        $$""",
+    """CREATE OR REPLACE FUNCTION document_search_vector_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_vector := document_search_vector(NEW.title,
+                (SELECT content FROM document_body WHERE document_id = NEW.id),
+                (SELECT transcription FROM document_body WHERE document_id = NEW.id));
+            RETURN NEW;
+        END $$""",
+    """CREATE OR REPLACE FUNCTION document_body_search_vector_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            body document_body%ROWTYPE;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                body := OLD;
+                body.content := NULL;
+                body.transcription := NULL;
+            ELSE
+                body := NEW;
+            END IF;
+            UPDATE document SET search_vector = document_search_vector(title, body.content, body.transcription)
+            WHERE id = body.document_id;
+            RETURN NULL;
+        END $$""",
+    """CREATE TRIGGER document_search_vector_update BEFORE INSERT OR UPDATE OF title ON document
+        FOR EACH ROW EXECUTE FUNCTION document_search_vector_trigger()""",
+    """CREATE TRIGGER document_body_search_vector_update
+        AFTER INSERT OR UPDATE OF content, transcription OR DELETE ON document_body
+        FOR EACH ROW EXECUTE FUNCTION document_body_search_vector_trigger()""",
+    """UPDATE document SET search_vector = document_search_vector(title,
+        (SELECT content FROM document_body WHERE document_id = document.id),
+        (SELECT transcription FROM document_body WHERE document_id = document.id))""",
+    "CREATE INDEX idx_document_search_vector ON document USING gin (search_vector)",
+]
+
+POSTGRES_DROP_SPLIT_INDEX = [
+    "DROP TRIGGER IF EXISTS document_body_search_vector_update ON document_body",
+    "DROP TRIGGER IF EXISTS document_search_vector_update ON document",
+    "DROP FUNCTION IF EXISTS document_body_search_vector_trigger()",
+    "DROP FUNCTION IF EXISTS document_search_vector_trigger()",
+    "DROP FUNCTION IF EXISTS document_search_vector(text, text, text)",
+    "DROP INDEX IF EXISTS idx_document_search_vector",
+    "ALTER TABLE document DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_SPLIT_INDEX = [
+    """CREATE VIEW document_text AS
+        SELECT document.id AS id, document.title AS title,
+               document_body.content AS content, document_body.transcription AS transcription
+        FROM document LEFT JOIN document_body ON document_body.document_id = document.id""",
+    """CREATE VIRTUAL TABLE document_fts USING fts5(
+        title, content, transcription,
+        content='document_text', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER document_fts_insert AFTER INSERT ON document BEGIN
+        INSERT INTO document_fts(rowid, title, content, transcription)
+        SELECT id, title, content, transcription FROM document_text WHERE id = new.id;
+    END""",
+    """CREATE TRIGGER document_fts_delete AFTER DELETE ON document BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, content, transcription)
+        VALUES ('delete', old.id, old.title,
+                (SELECT content FROM document_body WHERE document_id = old.id),
+                (SELECT transcription FROM document_body WHERE document_id = old.id));
+    END""",
+    """CREATE TRIGGER document_fts_update AFTER UPDATE OF title ON document BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, content, transcription)
+        SELECT 'delete', old.id, old.title, content, transcription FROM document_text WHERE id = new.id;
+        INSERT INTO document_fts(rowid, title, content, transcription)
+        SELECT id, title, content, transcription FROM document_text WHERE id = new.id;
+    END""",
+    """CREATE TRIGGER document_body_fts_insert AFTER INSERT ON document_body BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, content, transcription)
+        SELECT 'delete', id, title, NULL, NULL FROM document WHERE id = new.document_id;
+        INSERT INTO document_fts(rowid, title, content, transcription)
+        SELECT id, title, new.content, new.transcription FROM document WHERE id = new.document_id;
+    END""",
+    """CREATE TRIGGER document_body_fts_update AFTER UPDATE OF content, transcription ON document_body BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, content, transcription)
+        SELECT 'delete', id, title, old.content, old.transcription FROM document WHERE id = old.document_id;
+        INSERT INTO document_fts(rowid, title, content, transcription)
+        SELECT id, title, new.content, new.transcription FROM document WHERE id = new.document_id;
+    END""",
+    """CREATE TRIGGER document_body_fts_delete AFTER DELETE ON document_body BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, content, transcription)
+        SELECT 'delete', id, title, old.content, old.transcription FROM document WHERE id = old.document_id;
+        INSERT INTO document_fts(rowid, title, content, transcription)
+        SELECT id, title, NULL, NULL FROM document WHERE id = old.document_id;
+    END""",
+    "INSERT INTO document_fts(document_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_SPLIT_INDEX = [
+    "DROP TRIGGER IF EXISTS document_body_fts_delete",
+    "DROP TRIGGER IF EXISTS document_body_fts_update",
+    "DROP TRIGGER IF EXISTS document_body_fts_insert",
+    "DROP TRIGGER IF EXISTS document_fts_update",
+    "DROP TRIGGER IF EXISTS document_fts_delete",
+    "DROP TRIGGER IF EXISTS document_fts_insert",
+    "DROP TABLE IF EXISTS document_fts",
+    "DROP VIEW IF EXISTS document_text",
+]
+
+
+def _execute(statements):
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    _execute(POSTGRES_DROP_ROW_INDEX if dialect == 'postgresql' else SQLITE_DROP_ROW_INDEX)
+
+    op.create_table('document_body',
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        *[sa.Column(name, sa.Text(), nullable=True) for name in BODY_COLUMNS],
+        sa.ForeignKeyConstraint(['document_id'], ['document.id'], ),
+        sa.PrimaryKeyConstraint('document_id')
+    )
+    columns = ', '.join(BODY_COLUMNS)
+    op.execute(f"INSERT INTO document_body (document_id, {columns}) SELECT id, {columns} FROM document "
+               f"WHERE {' OR '.join(f'{name} IS NOT NULL' for name in BODY_COLUMNS)}")
+
+    # SQLite rebuilds the table here, which is why its triggers were dropped first
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        for name in BODY_COLUMNS:
+            batch_op.drop_column(name)
+
+    _execute(POSTGRES_SPLIT_INDEX if dialect == 'postgresql' else SQLITE_SPLIT_INDEX)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    _execute(POSTGRES_DROP_SPLIT_INDEX if dialect == 'postgresql' else SQLITE_DROP_SPLIT_INDEX)
+
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        for name in BODY_COLUMNS:
+            batch_op.add_column(sa.Column(name, sa.Text(), nullable=True))
+    op.execute("UPDATE document SET " + ', '.join(
+        f"{name} = (SELECT {name} FROM document_body WHERE document_body.document_id = document.id)"
+        for name in BODY_COLUMNS))
+    op.drop_table('document_body')
+
+    _execute(POSTGRES_ROW_INDEX if dialect == 'postgresql' else SQLITE_ROW_INDEX)
@@ -0,0 +1,81 @@
+"""Add document full-text index
+
+Revision ID: c4f1a9e27d60
+Revises: 5d2e8b4f7a13
+Create Date: 2026-10-18 16:22:08.913407
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f1a9e27d60'
+down_revision = '5d2e8b4f7a13'
+branch_labels = None
+depends_on = None
+
+
+POSTGRES_UPGRADE = [
+    """ALTER TABLE document ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(content, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(transcription, '')), 'C')
+        ) STORED""",
+    "CREATE INDEX idx_document_search_vector ON document USING gin (search_vector)",
+]
+
+POSTGRES_DOWNGRADE = [
+    "DROP INDEX IF EXISTS idx_document_search_vector",
+    "ALTER TABLE document DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_UPGRADE = [
+    """CREATE VIRTUAL TABLE document_fts USING fts5(
+        title, content, transcription,
+        content='document', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER document_fts_insert AFTER INSERT ON document BEGIN
+        INSERT INTO document_fts(rowid, title, content, transcription)
+        VALUES (new.id, new.title, new.content, new.transcription);
+    END""",
+    """CREATE TRIGGER document_fts_delete AFTER DELETE ON document BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, content, transcription)
+        VALUES ('delete', old.id, old.title, old.content, old.transcription);
+    END""",
+    """CREATE TRIGGER document_fts_update AFTER UPDATE OF title, content, transcription ON document BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, content, transcription)
+        VALUES ('delete', old.id, old.title, old.content, old.transcription);
+        INSERT INTO document_fts(rowid, title, content, transcription)
+        VALUES (new.id, new.title, new.content, new.transcription);
+    END""",
+    "INSERT INTO document_fts(document_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS document_fts_update",
+    "DROP TRIGGER IF EXISTS document_fts_delete",
+    "DROP TRIGGER IF EXISTS document_fts_insert",
+    "DROP TABLE IF EXISTS document_fts",
+]
+
+
+def upgrade():
+    # The B-tree on a Text column could never serve substring or word searches
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_index('idx_document_content')
+
+    dialect = op.get_bind().dialect.name
+    statements = POSTGRES_UPGRADE if dialect == 'postgresql' else SQLITE_UPGRADE
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    statements = POSTGRES_DOWNGRADE if dialect == 'postgresql' else SQLITE_DOWNGRADE
+    for statement in statements:
+        op.execute(statement)
+
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.create_index('idx_document_content', ['content'], unique=False)
@@ -0,0 +1,46 @@
+"""Add audit log keyset indexes
+
+Revision ID: d2b8f6a05c19
+Revises: 7a4c2e91b350
+Create Date: 2026-10-18 22:40:15.318426
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b8f6a05c19'
+down_revision = '7a4c2e91b350'
+branch_labels = None
+depends_on = None
+
+
+KEYSET_INDEXES = [
+    ('idx_audit_timestamp_id', ['timestamp', 'id']),
+    ('idx_audit_user_timestamp', ['user_id', 'timestamp', 'id']),
+    ('idx_audit_action_timestamp', ['action', 'timestamp', 'id']),
+    ('idx_audit_resource_timestamp', ['resource_type', 'resource_id', 'timestamp', 'id']),
+]
+
+
+def upgrade():
+    # Both are prefixes of the new indexes
+    op.drop_index('idx_audit_timestamp', table_name='audit_log')
+    op.drop_index('idx_audit_action_type', table_name='audit_log')
+    for name, columns in KEYSET_INDEXES:
+        op.create_index(name, 'audit_log', columns, unique=False)
+
+    # Word search on details; elsewhere it is a substring match inside the other filters
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE INDEX idx_audit_details_fts ON audit_log "
+                   "USING gin (to_tsvector('simple', coalesce(details, '')))")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS idx_audit_details_fts")
+    for name, _ in reversed(KEYSET_INDEXES):
+        op.drop_index(name, table_name='audit_log')
+    op.create_index('idx_audit_action_type', 'audit_log', ['action', 'resource_type'], unique=False)
+    op.create_index('idx_audit_timestamp', 'audit_log', ['timestamp'], unique=False)
@@ -0,0 +1,40 @@
+"""Add patient trigram indexes
+
+Revision ID: e6b3d91f4c28
+Revises: c4f1a9e27d60
+Create Date: 2026-10-18 19:04:51.226174
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b3d91f4c28'
+down_revision = 'c4f1a9e27d60'
+branch_labels = None
+depends_on = None
+
+
+TRIGRAM_COLUMNS = ['family_name', 'given_name', 'city', 'state']
+
+
+def upgrade():
+    # SQLite has no trigram index; utils/patient_search.py keeps one in memory
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in TRIGRAM_COLUMNS:
+        op.execute(f"CREATE INDEX idx_patient_{column}_trgm ON patient USING gin ({column} gin_trgm_ops)")
+    op.execute("CREATE INDEX idx_patient_full_name_trgm ON patient "
+               "USING gin ((given_name || ' ' || family_name) gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("DROP INDEX IF EXISTS idx_patient_full_name_trgm")
+    for column in reversed(TRIGRAM_COLUMNS):
+        op.execute(f"DROP INDEX IF EXISTS idx_patient_{column}_trgm")
@@ -3,6 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from sqlalchemy import or_
+from sqlalchemy.ext.associationproxy import association_proxy
 
 db = SQLAlchemy()
 
@@ -44,30 +45,121 @@ class AuditLog(db.Model):
     
     user = db.relationship('User', backref='audit_logs')
 
+    # On PostgreSQL the table is range-partitioned by month on timestamp, with
+    # (id, timestamp) as its primary key; see utils/audit_partitions.py
+    # Each filter of the admin viewer is an equality prefix followed by the
+    # (timestamp, id) keyset order; see utils/audit_search.py
     __table_args__ = (
-        db.Index('idx_audit_timestamp', 'timestamp'),
-        db.Index('idx_audit_action_type', 'action', 'resource_type'),
+        db.Index('idx_audit_timestamp_id', 'timestamp', 'id'),
+        db.Index('idx_audit_user_timestamp', 'user_id', 'timestamp', 'id'),
+        db.Index('idx_audit_action_timestamp', 'action', 'timestamp', 'id'),
+        db.Index('idx_audit_resource_timestamp', 'resource_type', 'resource_id', 'timestamp', 'id'),
     )
 
+def _body_field(name):
+    # Reads go through the body, loaded on first use; setting a field on a
+    # document without a body creates one
+    return association_proxy('body', name, creator=lambda value: DocumentBody(**{name: value}))
+
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     audio_file = db.Column(db.String(500))
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=True)
+    # Bumped by every write to the editable fields; autosave sends it back so
+    # edits made elsewhere meanwhile are not overwritten (see utils/document_edits.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # The long text is kept in document_body so lists, the dashboard and
+    # search read short rows; it is fetched only when a page uses it
+    body = db.relationship('DocumentBody', uselist=False, backref='document', cascade='all, delete-orphan')
+    content = _body_field('content')
+    transcription = _body_field('transcription')
+    meat_monitoring = _body_field('meat_monitoring')
+    meat_assessment = _body_field('meat_assessment')
+    meat_evaluation = _body_field('meat_evaluation')
+    meat_treatment = _body_field('meat_treatment')
+
+    __table_args__ = (
+        db.Index('idx_document_title', 'title'),
+        # title, content and transcription are also full-text indexed outside
+        # the ORM (search_vector on PostgreSQL, document_fts on SQLite); see utils/fulltext.py
+        db.Index('idx_document_patient', 'patient_id'),
+    )
+
+class DocumentBody(db.Model):
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    content = db.Column(db.Text)
     transcription = db.Column(db.Text)
     meat_monitoring = db.Column(db.Text)
     meat_assessment = db.Column(db.Text)
     meat_evaluation = db.Column(db.Text)
     meat_treatment = db.Column(db.Text)
-    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=True)
+
+class ProcessingJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # e.g., 'audio_pipeline'
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    stage = db.Column(db.String(50), nullable=False)  # current pipeline stage
+    progress = db.Column(db.Integer, nullable=False, default=0)  # percent complete
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # attempts at the current stage
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    payload = db.Column(db.JSON)  # Job input, e.g. the saved audio path
+    result = db.Column(db.JSON)  # Accumulated stage outputs
+    error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    document = db.relationship('Document', backref=db.backref('processing_jobs', lazy=True, cascade='all, delete-orphan'))
 
     __table_args__ = (
-        db.Index('idx_document_title', 'title'),
-        db.Index('idx_document_content', 'content'),
-        db.Index('idx_document_patient', 'patient_id'),
+        db.Index('idx_processing_job_queue', 'status', 'run_after'),
+        db.Index('idx_processing_job_document', 'document_id'),
+    )
+
+class AudioUpload(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    job_id = db.Column(db.Integer, db.ForeignKey('processing_job.id'))
+    filename = db.Column(db.String(255), nullable=False)  # relative to UPLOAD_FOLDER
+    mime_type = db.Column(db.String(100))
+    bytes_received = db.Column(db.BigInteger, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='open')  # open, complete
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    document = db.relationship('Document', backref=db.backref('audio_uploads', lazy=True, cascade='all, delete-orphan'))
+    job = db.relationship('ProcessingJob')
+
+    __table_args__ = (
+        db.Index('idx_audio_upload_document', 'document_id'),
+    )
+
+class AnalysisCache(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 hex digest
+    analysis = db.Column(db.String(50), nullable=False)  # e.g., 'meat_analysis'
+    model = db.Column(db.String(50), nullable=False)
+    prompt_version = db.Column(db.String(20), nullable=False)
+    value = db.Column(db.JSON)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_analysis_cache_expires', 'expires_at'),
+        db.Index('idx_analysis_cache_accessed', 'last_accessed_at'),
     )
 
 class PatientIdentifier(db.Model):
@@ -248,6 +340,8 @@ class AssessmentResult(db.Model):
         db.Index('idx_assessment_result_tool', 'tool_id'),
         db.Index('idx_assessment_result_date', 'assessment_date'),
         db.Index('idx_assessment_result_document', 'document_id'),
+        # The dashboard's counts for one assessor, read from the index alone; see utils/dashboard.py
+        db.Index('idx_assessment_result_assessor_date', 'assessor_id', 'assessment_date', 'status'),
     )
 
     def calculate_score(self):
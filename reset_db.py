@@ -1,11 +1,16 @@
 from app import app, db
 from models import User
+from utils.fulltext import drop_fulltext_index, ensure_fulltext_index
+from utils.patient_search import ensure_trigram_indexes
 
 def reset_database():
     with app.app_context():
-        # Drop and recreate all tables
+        # Drop and recreate all tables, with the indexes create_all() cannot build
+        drop_fulltext_index()
         db.drop_all()
         db.create_all()
+        ensure_fulltext_index()
+        ensure_trigram_indexes()
         
         # Create test user if it doesn't exist
         if not User.query.filter_by(username='test_user').first():
@@ -1,9 +1,14 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, jsonify
+from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, jsonify, Response
 from flask_login import login_required, current_user
-from models import User, AuditLog, db, AssessmentTool, AssessmentQuestion
+from models import User, db, AssessmentTool, AssessmentQuestion
+from sqlalchemy import func
+from utils.suggestion_cache import cache_stats as suggestion_cache_stats
+from utils.audit_partitions import query_window
+from utils.audit_search import AuditFilters, search_audit_logs
+from utils.pagination import InvalidCursorError
+from utils import query_profile
 from functools import wraps
-from sqlalchemy import or_
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 
 admin_bp = Blueprint('admin', __name__)
@@ -21,35 +26,74 @@ def admin_required(f):
 @login_required
 @admin_required
 def admin_dashboard():
-    return render_template('admin/dashboard.html')
+    return render_template('admin/dashboard.html', suggestion_cache=suggestion_cache_stats())
 
 @admin_bp.route('/admin/audit-logs')
 @login_required
 @admin_required
 def audit_logs():
-    page = request.args.get('page', 1, type=int)
-    query = request.args.get('q', '')
-    
-    logs_query = AuditLog.query.order_by(AuditLog.timestamp.desc())
-    
-    if query:
-        logs_query = logs_query.filter(
-            or_(
-                AuditLog.action.ilike(f'%{query}%'),
-                AuditLog.resource_type.ilike(f'%{query}%'),
-                AuditLog.details.ilike(f'%{query}%')
-            )
-        )
-    
-    logs = logs_query.paginate(page=page, per_page=50)
-    return render_template('admin/audit_logs.html', logs=logs, query=query)
+    start = request.args.get('start', '')
+    end = request.args.get('end', '')
+    try:
+        since, until = query_window(start, end)
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format', 'danger')
+        start, end = '', ''
+        since, until = query_window()
+
+    # Always bounded by date, so only the matching monthly partitions are scanned
+    filters = AuditFilters(
+        since=since,
+        until=until,
+        username=request.args.get('user', '').strip(),
+        action=request.args.get('action', '').strip(),
+        resource_type=request.args.get('resource_type', '').strip(),
+        resource_id=request.args.get('resource_id', type=int),
+        text=request.args.get('q', '').strip()
+    )
+    # Links to the next page keep the filters exactly as typed
+    params = {name: value for name, value in request.args.items() if name != 'cursor' and value}
+
+    try:
+        logs = search_audit_logs(filters, request.args.get('cursor'))
+    except InvalidCursorError:
+        flash('That audit log page is no longer valid; showing the newest entries', 'warning')
+        return redirect(url_for('admin.audit_logs', **params))
+
+    return render_template('admin/audit_logs.html', logs=logs, filters=filters, params=params,
+                           start=start, end=end, first_day=since.date(),
+                           last_day=(until - timedelta(days=1)).date())
+
+@admin_bp.route('/admin/query-stats')
+@login_required
+@admin_required
+def query_stats():
+    return render_template('admin/query_stats.html', stats=query_profile.endpoint_stats(),
+                           slow_query_ms=query_profile.SQL_SLOW_QUERY_MS, enabled=query_profile.SQL_PROFILE)
+
+@admin_bp.route('/admin/query-stats.json')
+@login_required
+@admin_required
+def query_stats_json():
+    return Response(query_profile.stats_json(), mimetype='application/json',
+                    headers={'Content-Disposition': 'attachment; filename=query-stats.json'})
+
+@admin_bp.route('/admin/query-stats/reset', methods=['POST'])
+@login_required
+@admin_required
+def reset_query_stats():
+    query_profile.reset_stats()
+    flash('Query statistics reset', 'success')
+    return redirect(url_for('admin.query_stats'))
 
 @admin_bp.route('/admin/assessment-tools')
 @login_required
 @admin_required
 def list_assessment_tools():
     tools = AssessmentTool.query.order_by(AssessmentTool.name).all()
-    return render_template('admin/assessment_tools/list.html', tools=tools)
+    question_counts = dict(db.session.query(AssessmentQuestion.tool_id, func.count(AssessmentQuestion.id))
+                           .group_by(AssessmentQuestion.tool_id).all())
+    return render_template('admin/assessment_tools/list.html', tools=tools, question_counts=question_counts)
 
 @admin_bp.route('/admin/assessment-tools/new', methods=['GET', 'POST'])
 @login_required
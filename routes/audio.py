@@ -1,5 +1,4 @@
 import os
-import whisper
 import logging
 import json
 from flask import Blueprint, request, jsonify, send_file
@@ -9,6 +8,7 @@ import datetime
 from app import db
 from models import Document
 from utils.ai_analysis import analyze_transcription
+from utils.transcription import transcribe_chunked
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -23,8 +23,6 @@ UPLOAD_FOLDER = 'uploads/audio'
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-model = whisper.load_model("base")
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -88,8 +86,7 @@ def upload_audio():
             
             try:
                 logger.info("Starting audio transcription")
-                result = model.transcribe(save_path)
-                transcription = result["text"]
+                transcription = transcribe_chunked(save_path, backend='local')
                 logger.info("Transcription completed successfully")
                 
                 document.recording_path = save_path
@@ -1,125 +1,30 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, current_app
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
-from models import Document, Patient, Condition, db
+from models import Document, Patient, ProcessingJob, AudioUpload, db
 from datetime import datetime
 import os
-from werkzeug.utils import secure_filename
-import openai
 import json
+import time
+from sqlalchemy.orm import joinedload
+from werkzeug.utils import secure_filename
+from utils.document_edits import (EDITABLE_FIELDS, changed_fields, field_digest, merge_stale_edits, save_edits,
+                                  EditConflictError, InvalidEditError)
+from utils.jobs import enqueue_audio_job, job_status
+from utils.uploads import (create_upload, append_chunk, complete_upload, upload_path, upload_offset,
+                           UploadOffsetError, UploadTooLargeError)
 
 documents_bp = Blueprint('documents', __name__)
 
-def analyze_meat_criteria(text):
-    client = openai.OpenAI()
-    
-    prompt = '''Analyze the following medical transcription and categorize the content into MEAT criteria.
-    
-    Transcription:
-    {text}
-    
-    Please categorize the content into these sections:
-    1. Monitoring: Vital signs, physical findings, symptoms, behaviors
-    2. Assessment: Current clinical assessment, diagnosis updates
-    3. Evaluation: Test results, responses to treatment
-    4. Treatment: Medications, therapies, procedures, changes in treatment
-
-    Return the response in this exact format with these exact section headers:
-    Monitoring:
-    <monitoring content>
-    
-    Assessment:
-    <assessment content>
-    
-    Evaluation:
-    <evaluation content>
-    
-    Treatment:
-    <treatment content>'''
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a medical documentation assistant analyzing clinical notes for MEAT criteria."},
-                {"role": "user", "content": prompt.format(text=text)}
-            ]
-        )
-        
-        # Parse the response text into sections
-        response_text = response.choices[0].message.content
-        sections = {}
-        current_section = None
-        current_content = []
-        
-        for line in response_text.split('\n'):
-            line = line.strip()
-            if line.endswith(':'):
-                if current_section and current_content:
-                    sections[current_section] = '\n'.join(current_content).strip()
-                current_section = line[:-1].lower()
-                current_content = []
-            elif line and current_section:
-                current_content.append(line)
-        
-        # Add the last section
-        if current_section and current_content:
-            sections[current_section] = '\n'.join(current_content).strip()
-        
-        return {
-            'monitoring': sections.get('monitoring', ''),
-            'assessment': sections.get('assessment', ''),
-            'evaluation': sections.get('evaluation', ''),
-            'treatment': sections.get('treatment', '')
-        }
-    except Exception as e:
-        current_app.logger.error(f'MEAT analysis error: {str(e)}')
-        return None
-
-def extract_conditions(text):
-    client = openai.OpenAI()
-    
-    prompt = '''Extract medical conditions from the following transcription.
-    For each condition, provide:
-    1. ICD-10 or SNOMED CT code
-    2. Clinical description
-    3. Body site (if applicable)
-    4. Severity (mild/moderate/severe if mentioned)
-
-    Transcription:
-    {text}
-
-    Return the response in JSON format with an array of conditions:
-    [
-        {{
-            "code": "ICD-10 or SNOMED code",
-            "code_system": "ICD-10" or "SNOMED-CT",
-            "description": "condition description",
-            "body_site": "affected body part",
-            "severity": "mild/moderate/severe"
-        }},
-        ...
-    ]'''
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a medical coding specialist extracting and coding conditions from clinical notes."},
-                {"role": "user", "content": prompt.format(text=text)}
-            ]
-        )
-        
-        # Parse the response text as JSON
-        conditions = json.loads(response.choices[0].message.content)
-        return conditions
-    except Exception as e:
-        current_app.logger.error(f'Condition extraction error: {str(e)}')
-        return None
+JOB_EVENTS_MAX_SECONDS = 30
+JOB_EVENTS_POLL_SECONDS = 1
 
 @documents_bp.route('/documents')
 @login_required
 def list_documents():
-    documents = Document.query.filter_by(user_id=current_user.id).all()
+    documents = (Document.query.filter_by(user_id=current_user.id)
+                 .options(joinedload(Document.patient))
+                 .order_by(Document.updated_at.desc(), Document.id.desc())
+                 .all())
     return render_template('documents/list.html', documents=documents)
 
 @documents_bp.route('/documents/new', methods=['GET', 'POST'])
@@ -154,38 +59,103 @@ def create_document():
 @documents_bp.route('/documents/<int:id>')
 @login_required
 def view_document(id):
-    document = Document.query.get_or_404(id)
+    document = Document.query.options(joinedload(Document.body)).get_or_404(id)
     if document.user_id != current_user.id:
         flash('Access denied')
         return redirect(url_for('documents.list_documents'))
     return render_template('documents/view.html', document=document)
 
+def _render_editor(document, values=None, version=None, base_digests=None, conflict=(), theirs=None):
+    """The edit form, showing values (default: the document's) based on version.
+
+    base_digests fingerprints what the server had at that version, so a stale
+    post can be merged; conflict lists fields to flag, with their values in theirs.
+    """
+    saved = {field: getattr(document, field) or '' for field in EDITABLE_FIELDS}
+    return render_template('documents/edit.html', document=document,
+                           values=values or saved,
+                           version=document.version if version is None else version,
+                           base_digests=base_digests or {field: field_digest(saved[field]) for field in EDITABLE_FIELDS},
+                           conflict=list(conflict), theirs=theirs or {})
+
+def _submitted(document):
+    """The posted form as the editor should show it again, nothing typed lost"""
+    return ({field: request.form.get(field, getattr(document, field) or '') for field in EDITABLE_FIELDS},
+            {field: request.form.get(f'base_{field}') for field in EDITABLE_FIELDS})
+
 @documents_bp.route('/documents/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_document(id):
-    document = Document.query.get_or_404(id)
+    document = Document.query.options(joinedload(Document.body)).get_or_404(id)
     if document.user_id != current_user.id:
         flash('Access denied')
         return redirect(url_for('documents.list_documents'))
     
     if request.method == 'POST':
+        version = request.form.get('version', type=int)
         try:
-            document.title = request.form.get('title')
-            document.content = request.form.get('content')
-            document.meat_monitoring = request.form.get('meat_monitoring')
-            document.meat_assessment = request.form.get('meat_assessment')
-            document.meat_evaluation = request.form.get('meat_evaluation')
-            document.meat_treatment = request.form.get('meat_treatment')
-            document.updated_at = datetime.utcnow()
-            db.session.commit()
+            # Autosave has usually written everything already; only what differs is sent on
+            save_edits(id, document.version if version is None else version, changed_fields(document, request.form))
             flash('Document updated successfully', 'success')
             return redirect(url_for('documents.view_document', id=id))
+        except InvalidEditError as e:
+            flash(str(e), 'danger')
+            values, base_digests = _submitted(document)
+            return _render_editor(document, values, version, base_digests)
+        except EditConflictError as e:
+            # Merged against the current version; saving again keeps what is shown
+            values, conflict = merge_stale_edits(e.fields, request.form, _submitted(document)[1])
+            if conflict:
+                flash('This document was changed elsewhere while you were editing it. Your text is kept; '
+                      'the fields marked below were changed by both of you, so check them and save again.', 'warning')
+            else:
+                flash('This document was changed elsewhere while you were editing it. Their changes were '
+                      'merged with yours; save again to keep the result.', 'warning')
+            return _render_editor(document, values, e.version, conflict=conflict, theirs=e.fields)
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error(f'Error updating document: {str(e)}')
             flash('An error occurred while updating the document', 'danger')
-            return render_template('documents/edit.html', document=document)
+            values, base_digests = _submitted(document)
+            return _render_editor(document, values, version, base_digests)
     
-    return render_template('documents/edit.html', document=document)
+    return _render_editor(document)
+
+@documents_bp.route('/documents/<int:id>', methods=['PATCH'])
+@login_required
+def autosave_document(id):
+    """Save the fields the editor changed since its last save.
+
+    Takes {"version": n, "changes": {field: value}}; answers 409 with the
+    current version and fields if someone else saved since version n.
+    """
+    owner_id = db.session.query(Document.user_id).filter_by(id=id).scalar()
+    if owner_id is None:
+        return jsonify({'error': 'Document not found'}), 404
+    if owner_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    if not isinstance(version, int) or isinstance(version, bool):
+        return jsonify({'error': 'version is required'}), 400
+
+    try:
+        saved = save_edits(id, version, data.get('changes') or {})
+    except InvalidEditError as e:
+        return jsonify({'error': str(e)}), 400
+    except EditConflictError as e:
+        return jsonify({'error': 'Document was changed elsewhere', 'version': e.version, 'fields': e.fields}), 409
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Autosave error: {str(e)}')
+        return jsonify({'error': 'Error saving document'}), 500
+
+    return jsonify({
+        'version': saved.version,
+        'saved': list(saved.fields),
+        'updated_at': saved.updated_at.isoformat() if saved.updated_at else None
+    })
 
 @documents_bp.route('/documents/<int:id>/upload-audio', methods=['POST'])
 @login_required
@@ -203,7 +173,7 @@ def upload_audio(id):
             return jsonify({'error': 'No audio file provided'}), 400
 
         # Create uploads directory if it doesn't exist
-        uploads_dir = os.path.join(current_app.root_path, 'uploads')
+        uploads_dir = current_app.config['UPLOAD_FOLDER']
         os.makedirs(uploads_dir, exist_ok=True)
 
         # Generate unique filename
@@ -214,67 +184,174 @@ def upload_audio(id):
         # Save the audio file
         audio_file.save(filepath)
         document.audio_file = filename
+        db.session.commit()
 
-        # Transcribe audio using OpenAI's new API format
-        try:
-            client = openai.OpenAI()
-            with open(filepath, 'rb') as audio:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio,
-                    response_format="text"
-                )
-                document.transcription = transcript
-
-            # Perform MEAT analysis on the transcription
-            meat_analysis = analyze_meat_criteria(transcript)
-            if meat_analysis:
-                document.meat_monitoring = meat_analysis.get('monitoring', '')
-                document.meat_assessment = meat_analysis.get('assessment', '')
-                document.meat_evaluation = meat_analysis.get('evaluation', '')
-                document.meat_treatment = meat_analysis.get('treatment', '')
-
-            # Extract and create conditions if document is linked to a patient
-            conditions_created = []
-            if document.patient_id:
-                conditions = extract_conditions(transcript)
-                if conditions:
-                    for condition_data in conditions:
-                        condition = Condition(
-                            identifier=Condition.generate_identifier(),
-                            clinical_status='active',
-                            category='encounter-diagnosis',
-                            code=condition_data.get('code'),
-                            code_system=condition_data.get('code_system'),
-                            body_site=condition_data.get('body_site'),
-                            severity=condition_data.get('severity'),
-                            patient_id=document.patient_id,
-                            onset_date=datetime.utcnow().date(),
-                            notes=condition_data.get('description')
-                        )
-                        db.session.add(condition)
-                        conditions_created.append({
-                            'code': condition.code,
-                            'description': condition.notes,
-                            'severity': condition.severity
-                        })
-
-            db.session.commit()
-            return jsonify({
-                'status': 'success',
-                'filename': filename,
-                'transcription': transcript,
-                'meat_analysis': meat_analysis,
-                'conditions_created': conditions_created
-            })
-        except Exception as e:
-            current_app.logger.error(f'Transcription error: {str(e)}')
-            return jsonify({'error': 'Error processing audio'}), 500
+        # Transcription and analysis run in the background worker
+        force_reanalysis = request.form.get('reanalyze') == 'true'
+        job = enqueue_audio_job(document, filepath, current_user.id, force_reanalysis=force_reanalysis)
+        return jsonify({
+            'status': 'queued',
+            'filename': filename,
+            'job_id': job.id,
+            'status_url': url_for('documents.audio_job_status', id=document.id, job_id=job.id),
+            'events_url': url_for('documents.audio_job_events', id=document.id, job_id=job.id)
+        }), 202
 
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f'Upload error: {str(e)}')
         return jsonify({'error': 'Error uploading audio'}), 500
 
+def _upload_response(document, upload):
+    return {
+        'upload_id': upload.id,
+        'status': upload.status,
+        'offset': upload_offset(upload, current_app.config['UPLOAD_FOLDER']),
+        'filename': upload.filename,
+        'job_id': upload.job_id,
+        'chunk_url': url_for('documents.append_audio_chunk', id=document.id, upload_id=upload.id),
+        'finalize_url': url_for('documents.finalize_audio_upload', id=document.id, upload_id=upload.id),
+        'status_url': url_for('documents.audio_job_status', id=document.id, job_id=upload.job_id),
+        'events_url': url_for('documents.audio_job_events', id=document.id, job_id=upload.job_id)
+    }
+
+def _get_upload(document_id, upload_id):
+    return AudioUpload.query.filter_by(id=upload_id, document_id=document_id,
+                                       user_id=current_user.id).first_or_404()
+
+@documents_bp.route('/documents/<int:id>/uploads', methods=['POST'])
+@login_required
+def start_audio_upload(id):
+    """Start a resumable recording upload.
+
+    Chunks are PUT to chunk_url as they are recorded and the transcription
+    job starts straight away, following the file as it grows.
+    """
+    try:
+        document = Document.query.get_or_404(id)
+        if document.user_id != current_user.id:
+            return jsonify({'error': 'Access denied'}), 403
+
+        data = request.get_json(silent=True) or {}
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        upload = create_upload(document, current_user.id, data.get('mime_type'), upload_folder)
+        document.audio_file = upload.filename
+
+        job = enqueue_audio_job(document, upload_path(upload, upload_folder), current_user.id,
+                                force_reanalysis=bool(data.get('reanalyze')), upload_id=upload.id)
+        upload.job_id = job.id
+        db.session.commit()
+        return jsonify(_upload_response(document, upload)), 201
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Error starting audio upload: {str(e)}')
+        return jsonify({'error': 'Error starting audio upload'}), 500
+
+@documents_bp.route('/documents/<int:id>/uploads/<int:upload_id>')
+@login_required
+def audio_upload_status(id, upload_id):
+    """Report how much has been received, so a client can resume"""
+    document = Document.query.get_or_404(id)
+    if document.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify(_upload_response(document, _get_upload(document.id, upload_id)))
+
+@documents_bp.route('/documents/<int:id>/uploads/<int:upload_id>', methods=['PUT'])
+@login_required
+def append_audio_chunk(id, upload_id):
+    """Append the raw request body at ?offset=, which must equal the bytes received"""
+    document = Document.query.get_or_404(id)
+    if document.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    upload = _get_upload(document.id, upload_id)
+    if upload.status != 'open':
+        return jsonify({'error': 'Upload is already complete'}), 409
+
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'offset is required'}), 400
+
+    try:
+        size = append_chunk(upload, offset, request.stream, current_app.config['UPLOAD_FOLDER'])
+        return jsonify({'offset': size})
+    except UploadOffsetError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), 409
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Error appending audio chunk: {str(e)}')
+        return jsonify({'error': 'Error uploading audio',
+                        'offset': upload_offset(upload, current_app.config['UPLOAD_FOLDER'])}), 500
+
+@documents_bp.route('/documents/<int:id>/uploads/<int:upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_audio_upload(id, upload_id):
+    """Close the upload once the client has sent every chunk"""
+    document = Document.query.get_or_404(id)
+    if document.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    upload = _get_upload(document.id, upload_id)
+
+    # Finalizing twice is harmless, e.g. when the first response was lost
+    if upload.status == 'open':
+        size = (request.get_json(silent=True) or {}).get('size')
+        if size is None:
+            return jsonify({'error': 'size is required'}), 400
+        try:
+            complete_upload(upload, int(size), current_app.config['UPLOAD_FOLDER'])
+        except UploadOffsetError as e:
+            return jsonify({'error': str(e), 'offset': e.offset}), 409
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'Error finalizing audio upload: {str(e)}')
+            return jsonify({'error': 'Error finalizing audio upload'}), 500
+
+    return jsonify(_upload_response(document, upload))
+
+@documents_bp.route('/documents/<int:id>/jobs/<int:job_id>')
+@login_required
+def audio_job_status(id, job_id):
+    document = Document.query.get_or_404(id)
+    if document.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+
+    job = ProcessingJob.query.filter_by(id=job_id, document_id=document.id).first_or_404()
+    return jsonify(job_status(job))
+
+@documents_bp.route('/documents/<int:id>/jobs/<int:job_id>/events')
+@login_required
+def audio_job_events(id, job_id):
+    """Server-sent events stream of job progress and the partial transcript.
+
+    Each connection is capped at JOB_EVENTS_MAX_SECONDS; EventSource clients
+    reconnect automatically, so a long job never pins a worker indefinitely.
+    """
+    document = Document.query.get_or_404(id)
+    if document.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    ProcessingJob.query.filter_by(id=job_id, document_id=document.id).first_or_404()
+
+    def generate():
+        deadline = time.monotonic() + JOB_EVENTS_MAX_SECONDS
+        last_update = None
+        yield f"retry: {JOB_EVENTS_POLL_SECONDS * 1000}\n\n"
+        while time.monotonic() < deadline:
+            job = db.session.get(ProcessingJob, job_id)
+            status = job_status(job)
+            # Release the connection between polls
+            db.session.rollback()
+            if status['updated_at'] != last_update:
+                last_update = status['updated_at']
+                yield f"data: {json.dumps(status)}\n\n"
+            if status['status'] in ('completed', 'failed'):
+                return
+            time.sleep(JOB_EVENTS_POLL_SECONDS)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @documents_bp.route('/documents/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_document(id):
@@ -286,7 +363,7 @@ def delete_document(id):
     try:
         # Delete associated audio file if it exists
         if document.audio_file:
-            audio_path = os.path.join(current_app.root_path, 'uploads', document.audio_file)
+            audio_path = os.path.join(current_app.config['UPLOAD_FOLDER'], document.audio_file)
             if os.path.exists(audio_path):
                 os.remove(audio_path)
         
@@ -1,8 +1,9 @@
 from flask import Blueprint, render_template, redirect, url_for
 from flask_login import login_required, current_user
-from models import Document, Patient, AssessmentResult, AssessmentTool
+from models import Document, Patient, AssessmentResult
 from sqlalchemy import func
-from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
+from utils.dashboard import assessment_panel
 
 main_bp = Blueprint('main', __name__)
 
@@ -17,50 +18,27 @@ def index():
 def dashboard():
     # Recent documents
     recent_documents = Document.query.filter_by(user_id=current_user.id)\
+        .options(joinedload(Document.patient))\
         .order_by(Document.updated_at.desc())\
         .limit(5).all()
     
     # Recent patients
     recent_patients = Patient.query.order_by(Patient.updated_at.desc())\
         .limit(5).all()
+    latest_assessment_dates = dict(AssessmentResult.query\
+        .with_entities(AssessmentResult.patient_id, func.max(AssessmentResult.assessment_date))\
+        .filter(AssessmentResult.patient_id.in_([patient.id for patient in recent_patients]))\
+        .group_by(AssessmentResult.patient_id).all())
     
-    # Recent assessments
-    recent_assessments = AssessmentResult.query\
-        .filter_by(assessor_id=current_user.id)\
-        .order_by(AssessmentResult.assessment_date.desc())\
-        .limit(5).all()
-    
-    # Assessment statistics
-    today = datetime.utcnow().date()
-    month_start = today.replace(day=1)
-    
-    # Total assessments count
-    total_assessments = AssessmentResult.query\
-        .filter_by(assessor_id=current_user.id)\
-        .count()
-    
-    # This month's assessments count
-    monthly_assessments = AssessmentResult.query\
-        .filter(AssessmentResult.assessor_id == current_user.id,
-                func.date(AssessmentResult.assessment_date) >= month_start)\
-        .count()
-    
-    # Draft assessments count
-    draft_assessments = AssessmentResult.query\
-        .filter_by(assessor_id=current_user.id, status='draft')\
-        .count()
-    
-    # Available assessment tools
-    assessment_tools = AssessmentTool.query\
-        .filter_by(active=True)\
-        .order_by(AssessmentTool.name)\
-        .all()
+    # Counts, recent assessments and the tool menu; cached per user
+    panel = assessment_panel(current_user.id)
     
     return render_template('dashboard.html',
                          documents=recent_documents,
                          patients=recent_patients,
-                         recent_assessments=recent_assessments,
-                         total_assessments=total_assessments,
-                         monthly_assessments=monthly_assessments,
-                         draft_assessments=draft_assessments,
-                         assessment_tools=assessment_tools)
+                         latest_assessment_dates=latest_assessment_dates,
+                         recent_assessments=panel.recent,
+                         total_assessments=panel.stats.total,
+                         monthly_assessments=panel.stats.this_month,
+                         draft_assessments=panel.stats.drafts,
+                         assessment_tools=panel.tools)
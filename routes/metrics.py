@@ -0,0 +1,16 @@
+import hmac
+from flask import Blueprint, Response, request, abort
+from utils.metrics import METRICS_TOKEN, render_metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics')
+def metrics():
+    # Scraped by Prometheus, not people: a bearer token instead of a login.
+    # Without a configured token the endpoint does not exist.
+    if not METRICS_TOKEN:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        abort(401)
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
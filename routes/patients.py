@@ -1,11 +1,14 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, jsonify
+from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, jsonify, abort
 from flask_login import login_required, current_user
 from models import Patient, PatientIdentifier, AssessmentTool, AssessmentResult, AssessmentResponse, Document, db
+from sqlalchemy import func
 from utils.audit import audit_log
+from utils.chart import load_assessments, load_chart
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import os
 from utils.ai_analysis import extract_assessment_data
+from utils.patient_search import patient_field_match, search_patient_names
 
 patients_bp = Blueprint('patients', __name__)
 
@@ -112,7 +115,10 @@ def add_identifier_modal(id):
 @login_required
 def list_patients():
     patients = Patient.query.filter_by(active=True).order_by(Patient.family_name).all()
-    return render_template('patients/list.html', patients=patients)
+    # One grouped count instead of loading every patient's documents
+    document_counts = dict(db.session.query(Document.patient_id, func.count(Document.id))
+                           .join(Patient).filter(Patient.active.is_(True)).group_by(Document.patient_id).all())
+    return render_template('patients/list.html', patients=patients, document_counts=document_counts)
 
 @patients_bp.route('/assessments/create', methods=['POST'])
 @login_required
@@ -158,7 +164,11 @@ def select_patient_for_assessment():
         flash('Assessment tool not specified', 'danger')
         return redirect(url_for('patients.all_assessments'))
         
-    patients = Patient.query.filter_by(active=True).order_by(Patient.family_name).all()
+    search = request.args.get('q', '').strip()
+    if search:
+        patients = search_patient_names(search, limit=50)
+    else:
+        patients = Patient.query.filter_by(active=True).order_by(Patient.family_name).all()
     tool = AssessmentTool.query.get_or_404(tool_id)
     
     return render_template('patients/select_patient.html', 
@@ -168,9 +178,12 @@ def select_patient_for_assessment():
 @patients_bp.route('/patients/<int:id>')
 @login_required
 def view_patient(id):
-    patient = Patient.query.get_or_404(id)
+    chart = load_chart(id)
+    if chart is None:
+        abort(404)
     assessment_tools = AssessmentTool.query.filter_by(active=True).order_by(AssessmentTool.name).all()
-    return render_template('patients/view.html', patient=patient, assessment_tools=assessment_tools)
+    return render_template('patients/view.html', patient=chart.patient, chart=chart,
+                           assessment_tools=assessment_tools)
 
 @patients_bp.route('/patients/new', methods=['GET', 'POST'])
 @login_required
@@ -329,6 +342,7 @@ def patient_assessments(patient_id):
     assessment_tools = AssessmentTool.query.filter_by(active=True).order_by(AssessmentTool.name).all()
     return render_template('patients/assessments.html', 
                          patient=patient,
+                         assessments=load_assessments(patient_id),
                          assessment_tools=assessment_tools)
 
 @patients_bp.route('/assessments')
@@ -340,12 +354,7 @@ def all_assessments():
     # Apply filters
     patient_query = request.args.get('patient')
     if patient_query:
-        query = query.join(Patient).filter(
-            db.or_(
-                Patient.family_name.ilike(f'%{patient_query}%'),
-                Patient.given_name.ilike(f'%{patient_query}%')
-            )
-        )
+        query = query.join(Patient).filter(patient_field_match('name', patient_query))
         
     tool_id = request.args.get('tool', type=int)
     if tool_id:
@@ -483,7 +492,8 @@ def upload_assessment_document(patient_id, result_id):
         db.session.flush()  # Get document ID
         
         # Process file and extract assessment data
-        extracted_data = extract_assessment_data(filepath, result.tool.tool_type)
+        force_refresh = request.form.get('reanalyze') == 'true'
+        extracted_data = extract_assessment_data(filepath, result.tool.tool_type, force_refresh=force_refresh)
         
         # Clear existing responses
         for response in result.responses:
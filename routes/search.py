@@ -1,7 +1,12 @@
-from flask import Blueprint, render_template, request, jsonify, current_app
+from flask import (Blueprint, stream_template, request, jsonify, current_app,
+                   flash, get_flashed_messages, redirect, url_for)
 from flask_login import login_required
-from utils.search import search_patients, search_documents, get_code_suggestions
-from models import ICD10Code
+from utils.search import (search_patients, search_documents,
+                          SEARCH_PAGE_SIZE, MAX_SEARCH_PAGE_SIZE)
+from utils.htql import HTQLSyntaxError
+from utils.pagination import InvalidCursorError
+from utils.code_index import CODE_SUGGESTION_LIMIT, MAX_CODE_CANDIDATES, cached_suggest_codes
+from utils.patient_search import search_patient_names
 from utils.audit import audit_log
 from functools import wraps
 import re
@@ -19,11 +24,16 @@ def handle_errors(f):
     return decorated_function
 
 def sanitize_query(query):
-    # Remove dangerous characters and SQL injection attempts
-    sanitized = re.sub(r'[;\'"\[\]\\]', '', query)
+    # Remove dangerous characters and SQL injection attempts. Double quotes
+    # stay: HTQL uses them for phrases and values are always bound parameters.
+    sanitized = re.sub(r'[;\'\[\]\\]', '', query)
     # Limit query length
     return sanitized[:500] if sanitized else ''
 
+def _page_size():
+    limit = request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+    return min(max(limit, 1), MAX_SEARCH_PAGE_SIZE)
+
 @search_bp.route('/search', methods=['GET'])
 @login_required
 @audit_log(action='search', resource_type='global')
@@ -34,20 +44,86 @@ def search():
     
     if search_type not in ['all', 'patients', 'documents']:
         search_type = 'all'
+    # Cursors page through one result type at a time
+    cursor = request.args.get('cursor') if search_type != 'all' else None
     
     patients = []
     documents = []
     
-    if search_type in ['all', 'patients']:
-        patients = search_patients(query)
-    if search_type in ['all', 'documents']:
-        documents = search_documents(query)
-        
-    return render_template('search/results.html', 
-                         query=query,
-                         search_type=search_type,
-                         patients=patients,
-                         documents=documents)
+    try:
+        if query and search_type in ['all', 'patients']:
+            patients = search_patients(query, cursor, _page_size())
+        if query and search_type in ['all', 'documents']:
+            documents = search_documents(query, cursor, _page_size())
+    except HTQLSyntaxError as e:
+        flash(f'Invalid search query: {str(e)}', 'warning')
+    except InvalidCursorError:
+        flash('That results page is no longer valid; showing the first page', 'warning')
+        return redirect(url_for('search.search', q=query, type=search_type))
+
+    # The session cookie is saved before a streamed body renders, so take any
+    # flashed messages now; the template gets the same list from the request
+    get_flashed_messages()
+    # Rows are fetched while the page renders, after the search form is sent
+    return stream_template('search/results.html',
+                           query=query,
+                           search_type=search_type,
+                           patients=patients,
+                           documents=documents)
+
+@search_bp.route('/api/search')
+@login_required
+@audit_log(action='search', resource_type='global')
+@handle_errors
+def search_api():
+    query = sanitize_query(request.args.get('q', ''))
+    search_type = request.args.get('type', 'patients')
+    if search_type not in ['patients', 'documents']:
+        return jsonify({'error': 'type must be patients or documents'}), 400
+
+    try:
+        if search_type == 'patients':
+            page = search_patients(query, request.args.get('cursor'), _page_size())
+            results = [{
+                'id': patient.id,
+                'identifier': patient.identifier,
+                'name': f'{patient.family_name}, {patient.given_name}',
+                'city': patient.city,
+                'state': patient.state,
+                'conditions': len(patient.conditions)
+            } for patient in page]
+        else:
+            page = search_documents(query, request.args.get('cursor'), _page_size())
+            results = [{
+                'id': document.id,
+                'title': document.title,
+                'updated_at': document.updated_at.isoformat() if document.updated_at else None,
+                'patient_id': document.patient_id,
+                'patient': f'{document.patient.family_name}, {document.patient.given_name}' if document.patient else None
+            } for document in page]
+    except (HTQLSyntaxError, InvalidCursorError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'results': results,
+        'next_cursor': page.next_cursor,
+        'total': page.total,
+        'total_kind': page.total_kind
+    })
+
+@search_bp.route('/api/patient-suggestions')
+@login_required
+@audit_log(action='patient_search', resource_type='patient')
+@handle_errors
+def patient_suggestions():
+    query = sanitize_query(request.args.get('q', ''))
+    patients = search_patient_names(query) if query else []
+    return jsonify([{
+        'id': patient.id,
+        'identifier': patient.identifier,
+        'name': f'{patient.family_name}, {patient.given_name}',
+        'birth_date': patient.birth_date.isoformat() if patient.birth_date else None
+    } for patient in patients])
 
 @search_bp.route('/api/code-suggestions')
 @login_required
@@ -56,32 +132,26 @@ def search():
 def code_suggestions():
     query = sanitize_query(request.args.get('q', ''))
     code_type = request.args.get('type', '').upper()
+    limit = max(1, min(request.args.get('limit', CODE_SUGGESTION_LIMIT, type=int), MAX_CODE_CANDIDATES))
     suggestions = []
     
     try:
         if query:
-            # Get ICD-10 suggestions from database
-            if not code_type or code_type == 'ICD-10':
-                icd10_codes = ICD10Code.search_codes(query)
-                suggestions.extend([{
-                    'code': code.code,
-                    'description': code.description,
-                    'system': 'ICD-10'
-                } for code in icd10_codes])
-            
-            # Get SNOMED CT suggestions if requested
-            if not code_type or code_type == 'SNOMED-CT':
-                snomed_suggestions = get_code_suggestions(query, 'SNOMED-CT')
-                suggestions.extend(snomed_suggestions)
-            
-            # Sort and limit results
-            suggestions.sort(key=lambda x: (
-                0 if x['code'].startswith(query) else 1,
-                len(x['code']),
-                x['code']
-            ))
-            suggestions = suggestions[:10]
+            # Prefix trie over codes and word-prefix index over descriptions, already ranked.
+            # One extra tells the client whether it has every match; errors reach
+            # the handler below rather than coming back as a complete empty list.
+            suggestions = cached_suggest_codes(query, code_type or None, limit + 1)
+        complete = len(suggestions) <= limit
+        suggestions = suggestions[:limit]
         
+        if request.args.get('format') == 'compact':
+            # [code, description, system index] rows, for clients that narrow them as the user types
+            systems = list(dict.fromkeys(s['system'] for s in suggestions))
+            return jsonify({
+                'systems': systems,
+                'complete': complete,
+                'results': [[s['code'], s['description'], systems.index(s['system'])] for s in suggestions]
+            })
         return jsonify(suggestions)
     except Exception as e:
         current_app.logger.error(f'Error getting code suggestions: {str(e)}')
@@ -5,6 +5,10 @@ class AudioRecorder {
         this.isRecording = false;
         this.recordingTime = 0;
         this.recordingTimer = null;
+        this.jobPollInterval = 2000;
+        this.timeslice = 5000;  // ms of audio per uploaded chunk
+        this.upload = null;
+        this.uploadPaused = false;
         
         this.startButton = document.getElementById('startRecording');
         this.stopButton = document.getElementById('stopRecording');
@@ -50,14 +54,28 @@ class AudioRecorder {
     async startRecording() {
         try {
             console.log('Starting recording process');
+            const docId = window.location.pathname.split('/')[2];
+            console.log('Document ID from path:', docId);
+            
+            if (!docId || docId === '0') {
+                this.showStatus('Please save the document before recording audio. Click the Save Document button first.', 'warning');
+                return;
+            }
+            
             this.showStatus('Requesting microphone access...', 'info');
             
             const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
             this.mediaRecorder = new MediaRecorder(stream);
+            this.upload = new ChunkedAudioUpload(docId, this.mediaRecorder.mimeType);
+            await this.upload.start();
             
             this.mediaRecorder.ondataavailable = (event) => {
                 if (event.data.size > 0) {
+                    // Kept locally only for playback; the server receives each chunk as it is recorded
                     this.audioChunks.push(event.data);
+                    this.upload.append(event.data)
+                        .then(() => { this.uploadPaused = false; })
+                        .catch(error => this.handleUploadError(error));
                 }
             };
             
@@ -72,8 +90,9 @@ class AudioRecorder {
                 this.resetRecordingState();
             };
             
-            this.mediaRecorder.start();
+            this.mediaRecorder.start(this.timeslice);
             this.audioChunks = [];
+            this.uploadPaused = false;
             this.isRecording = true;
             this.startButton.disabled = true;
             this.stopButton.disabled = false;
@@ -81,7 +100,12 @@ class AudioRecorder {
             this.recordingTime = 0;
             this.recordingTimer = setInterval(() => {
                 this.recordingTime++;
-                this.showStatus(`Recording in progress... ${this.formatTime(this.recordingTime)}`, 'info');
+                if (this.uploadPaused) {
+                    this.showStatus(`Recording in progress... ${this.formatTime(this.recordingTime)} ` +
+                                    '(connection lost; audio is kept and will be sent when it returns)', 'warning');
+                } else {
+                    this.showStatus(`Recording in progress... ${this.formatTime(this.recordingTime)}`, 'info');
+                }
             }, 1000);
             
             console.log('Recording started successfully');
@@ -92,6 +116,21 @@ class AudioRecorder {
         }
     }
     
+    handleUploadError(error) {
+        console.error('Error uploading audio chunk:', error);
+        if (!error.fatal) {
+            // The chunk stays buffered and is sent with the next one
+            this.uploadPaused = true;
+            return;
+        }
+        // The server lost audio it had acknowledged; the session cannot be completed
+        if (this.isRecording) {
+            this.mediaRecorder.onstop = null;
+            this.stopRecording();
+        }
+        this.showStatus('Recording stopped: the upload failed (' + error.message + '). Please record again.', 'danger');
+    }
+    
     resetRecordingState() {
         this.isRecording = false;
         this.startButton.disabled = false;
@@ -118,40 +157,48 @@ class AudioRecorder {
         }
     }
     
+    async pollJob(statusUrl) {
+        while (true) {
+            const response = await fetch(statusUrl);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            
+            const job = await response.json();
+            if (job.result && job.result.partial_transcript) {
+                this.transcriptionDisplay.textContent = job.result.partial_transcript;
+            }
+            if (job.status === 'completed') {
+                return job.result;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Audio processing failed');
+            }
+            
+            this.showStatus(`Processing recording (${job.stage})... ${job.progress}%`, 'info');
+            await new Promise(resolve => setTimeout(resolve, this.jobPollInterval));
+        }
+    }
+    
     async handleRecordingComplete() {
         try {
             console.log('Starting recording upload process');
-            const audioBlob = new Blob(this.audioChunks, { type: 'audio/wav' });
+            const audioBlob = new Blob(this.audioChunks, { type: this.mediaRecorder.mimeType });
             const audioUrl = URL.createObjectURL(audioBlob);
             this.audioPlayer.src = audioUrl;
             
             const docId = window.location.pathname.split('/')[2];
-            console.log('Document ID from path:', docId);
-            
-            if (!docId || docId === '0') {
-                this.showStatus('Please save the document before recording audio. Click the Save Document button first.', 'warning');
-                return;
-            }
-            
-            const formData = new FormData();
-            formData.append('audio', audioBlob, 'recording.wav');
-            formData.append('document_id', docId);
             
             this.showStatus('Uploading recording...', 'info');
             
-            const response = await fetch('/api/upload-audio', {
-                method: 'POST',
-                body: formData
-            });
+            let result = await this.upload.finish();
+            console.log('Upload successful:', result);
             
-            if (!response.ok) {
-                const result = await response.json().catch(() => ({ error: 'Network response was not ok' }));
-                throw new Error(result.error || `HTTP error! status: ${response.status}`);
+            if (result.status_url) {
+                this.showStatus('Recording queued for transcription...', 'info');
+                result = await this.pollJob(result.status_url);
             }
             
-            const result = await response.json();
-            console.log('Upload successful:', result);
-            
             if (result.transcription) {
                 this.transcriptionDisplay.textContent = result.transcription;
                 console.log('Transcription received:', result.transcription);
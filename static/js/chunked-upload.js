@@ -0,0 +1,133 @@
+// Resumable recording upload: MediaRecorder chunks are appended on the server
+// as they are produced, so a long session never becomes one huge request and
+// transcription can start while recording is still going.
+class ChunkedAudioUpload {
+    constructor(documentId, mimeType, options = {}) {
+        this.documentId = documentId;
+        this.mimeType = mimeType;
+        this.reanalyze = Boolean(options.reanalyze);
+        this.maxRetries = options.maxRetries || 5;
+        this.retryDelay = options.retryDelay || 1000;
+        this.session = null;
+        // Bytes the server has acknowledged
+        this.offset = 0;
+        // Recorded chunks not yet acknowledged, starting at bufferStart. They
+        // are kept when sending fails so the next append or finish() resumes.
+        this.buffer = [];
+        this.bufferStart = 0;
+        this.interrupted = false;
+        // Chunks are sent strictly in order
+        this.queue = Promise.resolve();
+    }
+
+    async start() {
+        const response = await fetch(`/documents/${this.documentId}/uploads`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ mime_type: this.mimeType, reanalyze: this.reanalyze })
+        });
+        if (!response.ok) {
+            const result = await response.json().catch(() => ({}));
+            throw new Error(result.error || `HTTP error! status: ${response.status}`);
+        }
+        this.session = await response.json();
+        return this.session;
+    }
+
+    append(blob) {
+        this.buffer.push(blob);
+        return this.flush();
+    }
+
+    // Rejects if the buffered audio could not be sent, but the queue itself
+    // never stays rejected: the next call tries again from the server's offset
+    flush() {
+        const sent = this.queue.then(() => this.sendBuffered());
+        this.queue = sent.catch(() => {});
+        return sent;
+    }
+
+    async sendBuffered() {
+        if (!this.buffer.length) {
+            return;
+        }
+        if (this.interrupted) {
+            try {
+                this.offset = Math.max(this.bufferStart, await this.serverOffset());
+            } catch (statusError) {
+                console.warn('Could not fetch upload offset:', statusError);
+            }
+        }
+        const count = this.buffer.length;
+        const blob = new Blob(this.buffer);
+        try {
+            await this.sendChunk(blob, this.bufferStart);
+        } catch (error) {
+            this.interrupted = true;
+            throw error;
+        }
+        this.interrupted = false;
+        this.buffer = this.buffer.slice(count);
+        this.bufferStart += blob.size;
+    }
+
+    async serverOffset() {
+        const response = await fetch(this.session.chunk_url);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return (await response.json()).offset;
+    }
+
+    async sendChunk(blob, start) {
+        const end = start + blob.size;
+        let attempt = 0;
+
+        while (this.offset < end) {
+            try {
+                const response = await fetch(`${this.session.chunk_url}?offset=${this.offset}`, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/octet-stream' },
+                    body: blob.slice(this.offset - start)
+                });
+                const result = await response.json().catch(() => ({}));
+
+                // A 409 reports where the server actually is, e.g. after a lost response
+                if ((response.ok || response.status === 409) && typeof result.offset === 'number') {
+                    if (result.offset < start) {
+                        throw Object.assign(new Error('Upload lost data that was already sent'), { fatal: true });
+                    }
+                    this.offset = result.offset;
+                    continue;
+                }
+                throw new Error(result.error || `HTTP error! status: ${response.status}`);
+            } catch (error) {
+                attempt++;
+                if (error.fatal || attempt > this.maxRetries) {
+                    throw error;
+                }
+                console.warn(`Retrying audio chunk at offset ${this.offset}:`, error);
+                await new Promise(resolve => setTimeout(resolve, this.retryDelay * 2 ** (attempt - 1)));
+                try {
+                    this.offset = Math.max(start, await this.serverOffset());
+                } catch (statusError) {
+                    console.warn('Could not fetch upload offset:', statusError);
+                }
+            }
+        }
+    }
+
+    async finish() {
+        await this.flush();
+        const response = await fetch(this.session.finalize_url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ size: this.offset })
+        });
+        const result = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw new Error(result.error || `HTTP error! status: ${response.status}`);
+        }
+        return result;
+    }
+}
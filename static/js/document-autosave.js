@@ -0,0 +1,220 @@
+// Autosave for the document editor. Typing is debounced, only the fields
+// that differ from what the server last acknowledged are sent, and at most
+// one save is in flight: edits made meanwhile go out together in the next
+// one. Every save carries the version it was based on, so when someone else
+// (another tab, the audio pipeline) saved first the server answers 409 and
+// the edits are merged here instead of overwriting theirs.
+class DocumentAutosave {
+    constructor(form, options = {}) {
+        this.form = form;
+        this.url = options.url;
+        this.version = Number(options.version);
+        this.fields = options.fields;
+        this.delay = options.delay || 1000;
+        this.maxWait = options.maxWait || 10000;
+        this.retryDelay = options.retryDelay || 1000;
+        this.maxRetryDelay = options.maxRetryDelay || 30000;
+        this.onStatus = options.onStatus || (() => {});
+        this.onConflict = options.onConflict || (() => {});
+
+        // Field values as the server has them at this.version
+        this.saved = {};
+        this.fields.forEach(field => { this.saved[field] = this.value(field); });
+        this.timer = null;
+        this.firstChange = null;
+        this.inFlight = null;
+        this.queued = false;
+        this.conflict = null;
+
+        form.addEventListener('input', (event) => {
+            if (this.fields.includes(event.target.name)) {
+                this.schedule();
+            }
+        });
+        // Last chance to save; keepalive lets the request outlive the page
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') {
+                this.save({ keepalive: true });
+            }
+        });
+        window.addEventListener('pagehide', () => this.save({ keepalive: true }));
+        window.addEventListener('beforeunload', (event) => {
+            if (this.isDirty() || this.inFlight) {
+                event.preventDefault();
+                event.returnValue = '';
+            }
+        });
+    }
+
+    value(field) {
+        return this.form.elements[field].value;
+    }
+
+    changes() {
+        const changes = {};
+        this.fields.forEach(field => {
+            const value = this.value(field);
+            if (value !== this.saved[field]) {
+                changes[field] = value;
+            }
+        });
+        return changes;
+    }
+
+    isDirty() {
+        return Object.keys(this.changes()).length > 0;
+    }
+
+    // Save once typing pauses for `delay`, and at least every `maxWait` while it goes on
+    schedule() {
+        if (this.conflict) {
+            return;
+        }
+        const now = Date.now();
+        if (this.firstChange === null) {
+            this.firstChange = now;
+        }
+        clearTimeout(this.timer);
+        const wait = Math.max(0, Math.min(this.delay, this.firstChange + this.maxWait - now));
+        this.timer = setTimeout(() => this.save(), wait);
+        this.onStatus('pending');
+    }
+
+    save(options = {}) {
+        clearTimeout(this.timer);
+        this.timer = null;
+        this.firstChange = null;
+        if (this.conflict) {
+            return Promise.resolve(false);
+        }
+        if (this.inFlight) {
+            this.queued = true;
+        } else if (this.isDirty()) {
+            this.inFlight = this.send(Boolean(options.keepalive)).finally(() => { this.inFlight = null; });
+        } else {
+            return Promise.resolve(true);
+        }
+        return this.inFlight;
+    }
+
+    // Save now and wait for it; resolves true once everything typed is on the server
+    async flush() {
+        this.save();
+        while (this.inFlight) {
+            await this.inFlight;
+        }
+        return !this.conflict && !this.isDirty();
+    }
+
+    // The pipeline wrote these values and the editor now shows them
+    adopt(values) {
+        Object.assign(this.saved, values);
+    }
+
+    async send(keepalive) {
+        let retryDelay = this.retryDelay;
+        while (!this.conflict) {
+            const changes = this.changes();
+            if (Object.keys(changes).length === 0) {
+                this.onStatus('saved');
+                return true;
+            }
+            this.onStatus('saving');
+
+            let response;
+            let result;
+            try {
+                response = await fetch(this.url, {
+                    method: 'PATCH',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ version: this.version, changes: changes }),
+                    keepalive: keepalive
+                });
+                result = await response.json().catch(() => ({}));
+            } catch (error) {
+                // Offline, or a keepalive body over the browser's limit
+                keepalive = false;
+                this.onStatus('offline');
+                await new Promise(resolve => setTimeout(resolve, retryDelay));
+                retryDelay = Math.min(retryDelay * 2, this.maxRetryDelay);
+                continue;
+            }
+
+            if (response.ok) {
+                retryDelay = this.retryDelay;
+                this.version = result.version;
+                Object.assign(this.saved, changes);
+                if (!this.queued) {
+                    this.onStatus(this.isDirty() ? 'pending' : 'saved');
+                    return !this.isDirty();
+                }
+                this.queued = false;
+            } else if (response.status === 409) {
+                this.merge(result);
+            } else if (response.status >= 500) {
+                this.onStatus('error', result.error);
+                await new Promise(resolve => setTimeout(resolve, retryDelay));
+                retryDelay = Math.min(retryDelay * 2, this.maxRetryDelay);
+            } else {
+                // Invalid input or lost access: sending it again will not help
+                this.onStatus('error', result.error || `HTTP error! status: ${response.status}`);
+                return false;
+            }
+        }
+        return false;
+    }
+
+    // Someone saved since this.version. Fields only they changed are taken,
+    // fields only we changed are sent again, and fields both changed to
+    // different values are left for the user to resolve.
+    merge(current) {
+        const conflicting = [];
+        this.fields.forEach(field => {
+            const theirs = (current.fields[field] || '').replace(/\r\n/g, '\n');
+            const mine = this.value(field);
+            if (theirs === this.saved[field]) {
+                return;
+            }
+            if (mine === this.saved[field]) {
+                this.form.elements[field].value = theirs;
+            } else if (mine !== theirs) {
+                conflicting.push(field);
+            }
+            this.saved[field] = theirs;
+        });
+        this.version = current.version;
+        if (conflicting.length) {
+            this.conflict = { fields: conflicting, theirs: current.fields };
+            this.onStatus('conflict');
+            this.onConflict(conflicting, current.fields);
+        }
+    }
+
+    // The page was rendered after a plain form post conflicted: the form
+    // holds our values and theirs are what the server has at this.version
+    restoreConflict(fields, theirs) {
+        this.fields.forEach(field => {
+            this.saved[field] = (theirs[field] || '').replace(/\r\n/g, '\n');
+        });
+        this.conflict = { fields, theirs };
+        this.onStatus('conflict');
+        this.onConflict(fields, theirs);
+    }
+
+    // Resolve a conflict by overwriting their values with ours
+    keepMine() {
+        this.conflict = null;
+        return this.save();
+    }
+
+    // Resolve a conflict by dropping our values for the conflicting fields
+    useTheirs() {
+        if (this.conflict) {
+            this.conflict.fields.forEach(field => {
+                this.form.elements[field].value = this.saved[field];
+            });
+        }
+        this.conflict = null;
+        return this.save();
+    }
+}
@@ -7,6 +7,10 @@ class HTQLSuggestions {
         this.debounceTimer = null;
         this.debounceDelay = 300;
         this.cacheExpiry = 5 * 60 * 1000; // 5 minutes
+        // Code candidates fetched per request and narrowed locally as the user keeps typing
+        this.suggestionLimit = 10;
+        this.candidateLimit = 100;
+        this.pendingRequest = null;
         this.currentSuggestions = [];
         this.selectedIndex = -1;
         
@@ -83,33 +87,159 @@ class HTQLSuggestions {
         return isValid;
     }
 
+    // Same characters dropped as sanitize_query in routes/search.py, so the
+    // terms narrowed here are the ones the server would rank
+    static normalizeTerm(term) {
+        return term.replace(/[;'\[\]\\]/g, '').trim().replace(/\s+/g, ' ').toLowerCase();
+    }
+
+    static codeKey(text) {
+        return text.toUpperCase().replaceAll('.', '').trim();
+    }
+
+    static words(text) {
+        return text.toLowerCase().match(/[\p{L}\p{N}_]+/gu) || [];
+    }
+
+    // Sort key of a [code, description, system] row for a term, or null if it
+    // does not match. Mirrors CodeIndex.suggest in utils/code_index.py: code
+    // prefix matches, then descriptions starting with the term, then
+    // descriptions with a word starting with it.
+    static rankKey(row, term) {
+        const [code, description] = row;
+        const key = HTQLSuggestions.codeKey(code);
+        const termKey = HTQLSuggestions.codeKey(term);
+        if (termKey && key.startsWith(termKey)) {
+            return [0, key.length, key];
+        }
+        const words = HTQLSuggestions.words(term);
+        const descriptionWords = HTQLSuggestions.words(description);
+        if (!words.length || !words.every(word => descriptionWords.some(d => d.startsWith(word)))) {
+            return null;
+        }
+        return [descriptionWords[0].startsWith(words[0]) ? 1 : 2, [...description].length, key.length, key];
+    }
+
+    static compareKeys(a, b) {
+        for (let i = 0; i < Math.min(a.length, b.length); i++) {
+            if (a[i] !== b[i]) {
+                return a[i] < b[i] ? -1 : 1;
+            }
+        }
+        return a.length - b.length;
+    }
+
+    // Top suggestions for term from candidates fetched for a prefix of it, or
+    // null if they cannot be trusted to match the server. Extending a term only
+    // removes matches or raises their keys, so an incomplete set still holds
+    // the true top results when they all rank before its last candidate.
+    narrowCandidates(entry, term) {
+        const ranked = [];
+        for (const row of entry.rows) {
+            const key = HTQLSuggestions.rankKey(row, term);
+            if (key) {
+                ranked.push({ row, key });
+            }
+        }
+        ranked.sort((a, b) => HTQLSuggestions.compareKeys(a.key, b.key));
+        const top = ranked.slice(0, this.suggestionLimit);
+        if (entry.complete ||
+            (top.length === this.suggestionLimit &&
+             HTQLSuggestions.compareKeys(top[top.length - 1].key, entry.boundary) < 0)) {
+            return top.map(({ row: [code, description, system] }) => ({ code, description, system }));
+        }
+        return null;
+    }
+
+    localCodeSuggestions(searchTerm) {
+        const term = HTQLSuggestions.normalizeTerm(searchTerm);
+        for (let length = term.length; length > 0; length--) {
+            const entry = this.suggestionCache.get(`code:${term.slice(0, length)}`);
+            if (!entry) {
+                continue;
+            }
+            if (Date.now() - entry.timestamp >= this.cacheExpiry) {
+                this.suggestionCache.delete(`code:${entry.term}`);
+                continue;
+            }
+            const suggestions = this.narrowCandidates(entry, term);
+            if (suggestions) {
+                return suggestions;
+            }
+        }
+        return null;
+    }
+
     async getCodeSuggestions(searchTerm) {
-        const cacheKey = `code:${searchTerm}`;
-        const cached = this.suggestionCache.get(cacheKey);
-        
-        if (cached && Date.now() - cached.timestamp < this.cacheExpiry) {
-            return cached.data;
+        const local = this.localCodeSuggestions(searchTerm);
+        if (local) {
+            return local;
         }
 
+        // Only the latest request matters; drop any still in flight
+        if (this.pendingRequest) {
+            this.pendingRequest.abort();
+        }
+        const controller = new AbortController();
+        this.pendingRequest = controller;
+        const term = HTQLSuggestions.normalizeTerm(searchTerm);
+
         try {
-            const response = await fetch(`/api/code-suggestions?q=${encodeURIComponent(searchTerm)}`);
-            if (response.ok) {
-                const suggestions = await response.json();
-                this.suggestionCache.set(cacheKey, {
-                    data: suggestions,
-                    timestamp: Date.now()
-                });
-                return suggestions;
+            const params = new URLSearchParams({ q: term, limit: this.candidateLimit, format: 'compact' });
+            const response = await fetch(`/api/code-suggestions?${params}`, { signal: controller.signal });
+            if (!response.ok) {
+                return [];
             }
-            return [];
+            const data = await response.json();
+            const rows = data.results.map(([code, description, system]) => [code, description, data.systems[system]]);
+            const entry = {
+                term,
+                rows,
+                complete: data.complete,
+                boundary: rows.length ? HTQLSuggestions.rankKey(rows[rows.length - 1], term) : null,
+                timestamp: Date.now()
+            };
+            this.suggestionCache.set(`code:${term}`, entry);
+            return this.narrowCandidates(entry, term) || [];
         } catch (error) {
+            if (error.name === 'AbortError') {
+                return null;
+            }
             console.error('Error fetching code suggestions:', error);
             return [];
+        } finally {
+            if (this.pendingRequest === controller) {
+                this.pendingRequest = null;
+            }
         }
     }
 
-    async handleInput() {
+    codeSearchTerm(inputValue) {
+        return inputValue.includes('condition.code:') ? inputValue.split('condition.code:')[1].trim() : '';
+    }
+
+    showCodeSuggestions(suggestions) {
+        this.updateSuggestions(suggestions.map(s => ({
+            text: `condition.code:${s.code}`,
+            displayText: `${s.code} - ${s.description}`,
+            details: `(${s.system})`
+        })));
+    }
+
+    handleInput() {
         clearTimeout(this.debounceTimer);
+
+        // Narrowing what is already here needs no round trip, so it skips the debounce
+        const searchTerm = this.codeSearchTerm(this.input.value);
+        const local = searchTerm ? this.localCodeSuggestions(searchTerm) : null;
+        if (local) {
+            if (this.pendingRequest) {
+                this.pendingRequest.abort();
+            }
+            this.validateSyntax(this.input.value);
+            this.showCodeSuggestions(local);
+            return;
+        }
         
         this.debounceTimer = setTimeout(async () => {
             const inputValue = this.input.value;
@@ -117,15 +247,14 @@ class HTQLSuggestions {
             
             try {
                 if (inputValue.includes('condition.code:')) {
-                    const searchTerm = inputValue.split('condition.code:')[1].trim();
+                    const searchTerm = this.codeSearchTerm(inputValue);
                     if (searchTerm) {
                         this.showLoading();
                         const suggestions = await this.getCodeSuggestions(searchTerm);
-                        this.updateSuggestions(suggestions.map(s => ({
-                            text: `condition.code:${s.code}`,
-                            displayText: `${s.code} - ${s.description}`,
-                            details: `(${s.system})`
-                        })));
+                        // Aborted, or the user has typed on since
+                        if (suggestions && this.codeSearchTerm(this.input.value) === searchTerm) {
+                            this.showCodeSuggestions(suggestions);
+                        }
                     } else {
                         this.generateFieldSuggestions(inputValue);
                     }
@@ -284,7 +413,7 @@ class HTQLSuggestions {
             const [category, field] = query.split('.');
             const fields = {
                 'patient': ['name', 'id', 'gender', 'city', 'state'],
-                'document': ['title', 'content', 'transcription'],
+                'document': ['title', 'content', 'transcription', 'text'],
                 'condition': ['code', 'status', 'severity']
             };
             
@@ -302,3 +431,7 @@ class HTQLSuggestions {
         this.updateSuggestions(suggestions);
     }
 }
+
+if (typeof module !== 'undefined') {
+    module.exports = HTQLSuggestions;
+}
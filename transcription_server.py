@@ -0,0 +1,13 @@
+import argparse
+import os
+from utils.transcription import serve
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the shared local Whisper transcription process')
+    parser.add_argument('--address', default=os.environ.get('TRANSCRIPTION_SERVER', '/tmp/bh-transcription.sock'),
+                        help='Unix socket path the web workers submit files to')
+    args = parser.parse_args()
+    serve(args.address)
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,40 @@
 import os
-import openai
 import json
+import time
 import logging
 from typing import Dict, Any
 import docx
 import wave
 import contextlib
-import speech_recognition as sr
-from pydub import AudioSegment
 from flask import current_app
+from utils.llm import chat_completion, DEFAULT_MODEL
+from utils.analysis_cache import cached_analysis
+from utils.transcription import transcribe_chunked
+from utils.metrics import record_text_extraction
+
+# Bump a version whenever its prompt changes so cached results are not reused
+MEAT_PROMPT_VERSION = '1'
+CONDITIONS_PROMPT_VERSION = '1'
+PRAPARE_PROMPT_VERSION = '1'
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# File types with their own extraction time series; anything else is "other"
+EXTRACTION_FILE_TYPES = ('.wav', '.mp3', '.docx', '.txt', '.pdf')
+
 def extract_text_from_document(file_path: str) -> str:
     """Extract text content from various document formats"""
     file_ext = os.path.splitext(file_path)[1].lower()
-    
+    start = time.perf_counter()
+    try:
+        return _extract_text(file_path, file_ext)
+    finally:
+        record_text_extraction(file_ext[1:] if file_ext in EXTRACTION_FILE_TYPES else 'other',
+                               time.perf_counter() - start)
+
+def _extract_text(file_path: str, file_ext: str) -> str:
     if file_ext in ['.wav', '.mp3']:
         return extract_text_from_audio(file_path)
     elif file_ext == '.docx':
@@ -43,26 +60,123 @@ def extract_text_from_docx(file_path: str) -> str:
 def extract_text_from_audio(file_path: str) -> str:
     """Extract text from audio file using speech recognition"""
     try:
-        # Convert MP3 to WAV if needed
-        if file_path.lower().endswith('.mp3'):
-            audio = AudioSegment.from_mp3(file_path)
-            wav_path = file_path.rsplit('.', 1)[0] + '.wav'
-            audio.export(wav_path, format='wav')
-            file_path = wav_path
-
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(file_path) as source:
-            audio = recognizer.record(source)
-            return recognizer.recognize_google(audio)
+        # MP3s are decoded straight to PCM frames; nothing is transcoded to disk
+        return transcribe_chunked(file_path, backend='google')
     except Exception as e:
         logger.error(f"Error extracting text from audio: {str(e)}")
         return ""
 
-def extract_prapare_data(text: str) -> Dict[int, str]:
-    """Extract PRAPARE assessment data from text"""
+@cached_analysis('meat_analysis', MEAT_PROMPT_VERSION, DEFAULT_MODEL)
+def analyze_meat_criteria(text):
+    prompt = '''Analyze the following medical transcription and categorize the content into MEAT criteria.
+    
+    Transcription:
+    {text}
+    
+    Please categorize the content into these sections:
+    1. Monitoring: Vital signs, physical findings, symptoms, behaviors
+    2. Assessment: Current clinical assessment, diagnosis updates
+    3. Evaluation: Test results, responses to treatment
+    4. Treatment: Medications, therapies, procedures, changes in treatment
+
+    Return the response in this exact format with these exact section headers:
+    Monitoring:
+    <monitoring content>
+    
+    Assessment:
+    <assessment content>
+    
+    Evaluation:
+    <evaluation content>
+    
+    Treatment:
+    <treatment content>'''
+
+    try:
+        response_text = chat_completion([
+            {"role": "system", "content": "You are a medical documentation assistant analyzing clinical notes for MEAT criteria."},
+            {"role": "user", "content": prompt.format(text=text)}
+        ], prompt='analyze_meat_criteria')
+        
+        # Parse the response text into sections
+        sections = {}
+        current_section = None
+        current_content = []
+        
+        for line in response_text.split('\n'):
+            line = line.strip()
+            if line.endswith(':'):
+                if current_section and current_content:
+                    sections[current_section] = '\n'.join(current_content).strip()
+                current_section = line[:-1].lower()
+                current_content = []
+            elif line and current_section:
+                current_content.append(line)
+        
+        # Add the last section
+        if current_section and current_content:
+            sections[current_section] = '\n'.join(current_content).strip()
+        
+        return {
+            'monitoring': sections.get('monitoring', ''),
+            'assessment': sections.get('assessment', ''),
+            'evaluation': sections.get('evaluation', ''),
+            'treatment': sections.get('treatment', '')
+        }
+    except Exception as e:
+        logger.error(f'MEAT analysis error: {str(e)}')
+        return None
+
+@cached_analysis('conditions', CONDITIONS_PROMPT_VERSION, DEFAULT_MODEL)
+def extract_conditions(text):
+    prompt = '''Extract medical conditions from the following transcription.
+    For each condition, provide:
+    1. ICD-10 or SNOMED CT code
+    2. Clinical description
+    3. Body site (if applicable)
+    4. Severity (mild/moderate/severe if mentioned)
+
+    Transcription:
+    {text}
+
+    Return the response in JSON format with an array of conditions:
+    [
+        {{
+            "code": "ICD-10 or SNOMED code",
+            "code_system": "ICD-10" or "SNOMED-CT",
+            "description": "condition description",
+            "body_site": "affected body part",
+            "severity": "mild/moderate/severe"
+        }},
+        ...
+    ]'''
+
     try:
-        client = openai.OpenAI()
+        response_text = chat_completion([
+            {"role": "system", "content": "You are a medical coding specialist extracting and coding conditions from clinical notes."},
+            {"role": "user", "content": prompt.format(text=text)}
+        ], prompt='extract_conditions')
         
+        # Parse the response text as JSON
+        conditions = json.loads(response_text)
+        return conditions
+    except Exception as e:
+        logger.error(f'Condition extraction error: {str(e)}')
+        return None
+
+def extract_prapare_data(text: str, force_refresh: bool = False) -> Dict[int, str]:
+    """Extract PRAPARE assessment data from text"""
+    try:
+        result = _request_prapare_responses(text, force_refresh=force_refresh)
+        return {int(k): v for k, v in result.items()}
+    except Exception as e:
+        logger.error(f"Error in PRAPARE data extraction: {str(e)}")
+        return {}
+
+@cached_analysis('prapare', PRAPARE_PROMPT_VERSION, DEFAULT_MODEL, cache_empty=False)
+def _request_prapare_responses(text: str) -> Dict[str, str]:
+    """Ask the LLM for PRAPARE responses, keyed by question ID as a string"""
+    try:
         system_prompt = """You are a medical assessment analyzer specializing in PRAPARE assessments. 
         The Protocol for Responding to and Assessing Patient Assets, Risks, and Experiences (PRAPARE) 
         is a national effort to help health centers collect and apply data on social determinants 
@@ -88,26 +202,23 @@ def extract_prapare_data(text: str) -> Dict[int, str]:
         Return the responses in a JSON format where keys are question IDs (1-13) and values are 
         the appropriate response values based on the PRAPARE assessment options."""
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
+        content = chat_completion(
+            [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             response_format={"type": "json_object"},
-            temperature=0.3
+            temperature=0.3,
+            prompt='extract_prapare_data'
         )
-
-        content = response.choices[0].message.content
         if isinstance(content, str):
-            result = json.loads(content)
-            return {int(k): v for k, v in result.items()}
+            return json.loads(content)
         return {}
     except Exception as e:
         logger.error(f"Error in PRAPARE data extraction: {str(e)}")
         return {}
 
-def extract_assessment_data(filepath: str, tool_type: str) -> Dict[int, str]:
+def extract_assessment_data(filepath: str, tool_type: str, force_refresh: bool = False) -> Dict[int, str]:
     """Extract assessment data from document based on tool type"""
     try:
         # Get transcription from audio or text content from document
@@ -124,7 +235,7 @@ def extract_assessment_data(filepath: str, tool_type: str) -> Dict[int, str]:
 
         # Extract responses based on tool type
         if tool_type.upper() == 'PRAPARE':
-            responses = extract_prapare_data(text_content)
+            responses = extract_prapare_data(text_content, force_refresh=force_refresh)
         else:
             # Default extraction for other assessment types
             responses = {}
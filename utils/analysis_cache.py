@@ -0,0 +1,140 @@
+import os
+import re
+import hashlib
+import threading
+import unicodedata
+import logging
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Dict, Optional
+from flask import has_app_context
+from sqlalchemy.orm import Session
+from models import db, AnalysisCache
+from utils.metrics import record_cache_lookup
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_TTL = timedelta(days=int(os.environ.get('ANALYSIS_CACHE_TTL_DAYS', 30)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 10000))
+
+_stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0, 'evictions': 0, 'errors': 0}
+_stats_lock = threading.Lock()
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += amount
+
+def normalize_text(text: str) -> str:
+    """Normalize a transcript so trivially different copies share a cache key"""
+    text = unicodedata.normalize('NFC', text or '')
+    return re.sub(r'\s+', ' ', text).strip()
+
+def cache_key(analysis: str, text: str, prompt_version: str, model: str) -> str:
+    digest = hashlib.sha256()
+    for part in (analysis, prompt_version, model, normalize_text(text)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def get_cached(key: str) -> Optional[Any]:
+    # A separate session keeps cache traffic out of the caller's transaction
+    with Session(db.engine) as session:
+        entry = session.query(AnalysisCache).filter_by(cache_key=key).first()
+        if entry is None:
+            return None
+        now = datetime.utcnow()
+        if entry.expires_at <= now:
+            session.delete(entry)
+            session.commit()
+            return None
+        entry.hit_count += 1
+        entry.last_accessed_at = now
+        value = entry.value
+        session.commit()
+        return value
+
+def store(key: str, analysis: str, model: str, prompt_version: str, value: Any) -> None:
+    now = datetime.utcnow()
+    with Session(db.engine) as session:
+        entry = session.query(AnalysisCache).filter_by(cache_key=key).first()
+        if entry is None:
+            entry = AnalysisCache(cache_key=key, analysis=analysis, model=model,
+                                  prompt_version=prompt_version, hit_count=0, created_at=now)
+            session.add(entry)
+        entry.value = value
+        entry.last_accessed_at = now
+        entry.expires_at = now + ANALYSIS_CACHE_TTL
+        session.commit()
+        _count('stores')
+        _evict(session)
+
+def _evict(session: Session) -> None:
+    """Drop expired rows, then the least recently used rows above the size bound"""
+    removed = session.query(AnalysisCache).filter(
+        AnalysisCache.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+
+    overflow = session.query(AnalysisCache).count() - ANALYSIS_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale_ids = [row.id for row in session.query(AnalysisCache.id)
+                     .order_by(AnalysisCache.last_accessed_at.asc())
+                     .limit(overflow)]
+        removed += session.query(AnalysisCache).filter(
+            AnalysisCache.id.in_(stale_ids)
+        ).delete(synchronize_session=False)
+
+    session.commit()
+    if removed:
+        _count('evictions', removed)
+
+def cached_analysis(analysis: str, prompt_version: str, model: str, cache_empty: bool = True):
+    """Cache an LLM analysis of a transcript by content hash.
+
+    The wrapped function takes the transcript as its first argument. Pass
+    force_refresh=True to skip the lookup and overwrite the cached value.
+    None results (and empty ones when cache_empty is False) are never stored.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(text, *args, force_refresh=False, **kwargs):
+            if not has_app_context() or not text:
+                return f(text, *args, **kwargs)
+
+            key = cache_key(analysis, text, prompt_version, model)
+            if force_refresh:
+                _count('bypassed')
+            else:
+                try:
+                    value = get_cached(key)
+                except Exception as e:
+                    _count('errors')
+                    logger.error(f'Analysis cache lookup failed: {str(e)}')
+                    value = None
+                if value is not None:
+                    _count('hits')
+                    record_cache_lookup(analysis, 'hit')
+                    return value
+                _count('misses')
+                record_cache_lookup(analysis, 'miss')
+
+            result = f(text, *args, **kwargs)
+            if result is not None and (cache_empty or result):
+                try:
+                    store(key, analysis, model, prompt_version, result)
+                except Exception as e:
+                    _count('errors')
+                    logger.error(f'Analysis cache store failed: {str(e)}')
+            return result
+        return decorated_function
+    return decorator
+
+def cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    if has_app_context():
+        stats['entries'] = AnalysisCache.query.count()
+    return stats
@@ -0,0 +1,333 @@
+import io
+import os
+import re
+import time
+import math
+import wave
+import array
+import hashlib
+import logging
+import tempfile
+import subprocess
+import threading
+from collections import namedtuple
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BLOCK_SECONDS = 0.1  # granularity of silence detection
+SILENCE_SEARCH_SECONDS = 5  # look for a pause in the last seconds of a window
+SILENCE_RATIO = 0.02  # RMS below this fraction of full scale counts as silence
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+# All audio is normalized to mono 16-bit PCM at the rate speech models expect
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+FOLLOW_POLL_SECONDS = 0.5
+FOLLOW_IDLE_TIMEOUT = int(os.environ.get('UPLOAD_IDLE_TIMEOUT', 600))  # seconds without new data
+READ_SIZE = 64 * 1024
+# Normalized copies of compressed uploads, so retries and re-analysis skip decoding
+AUDIO_CACHE_DIR = os.environ.get('AUDIO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'bh-audio-cache'))
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get('AUDIO_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # 0 disables
+
+AudioParams = namedtuple('AudioParams', ['channels', 'sample_width', 'frame_rate', 'duration'])
+# audio is the window as an in-memory WAV file
+AudioWindow = namedtuple('AudioWindow', ['index', 'audio', 'start', 'end', 'overlap'])
+
+NORMALIZED_PARAMS = AudioParams(1, SAMPLE_WIDTH, SAMPLE_RATE, None)
+
+def cached_audio_path(file_path: str) -> Optional[str]:
+    """Location of the normalized artifact for a source file, or None if caching is off.
+
+    The key includes size and mtime, so a replaced file is decoded again.
+    """
+    if AUDIO_CACHE_MAX_BYTES <= 0:
+        return None
+    stat = os.stat(file_path)
+    key = f'{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return os.path.join(AUDIO_CACHE_DIR, f'{digest}.wav')
+
+def prune_audio_cache(max_bytes: int = AUDIO_CACHE_MAX_BYTES) -> int:
+    """Delete least recently used artifacts until the cache fits max_bytes"""
+    try:
+        entries = [entry for entry in os.scandir(AUDIO_CACHE_DIR)
+                   if entry.is_file() and entry.name.endswith('.wav')]
+    except FileNotFoundError:
+        return 0
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    total = sum(entry.stat().st_size for entry in entries)
+    removed = 0
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+        total -= entry.stat().st_size
+        removed += 1
+    return removed
+
+class _CacheArtifact:
+    """Normalized PCM written beside a decode, published only once it is complete"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self.wav = wave.open(self.tmp_path, 'wb')
+        self.wav.setnchannels(1)
+        self.wav.setsampwidth(SAMPLE_WIDTH)
+        self.wav.setframerate(SAMPLE_RATE)
+
+    def write(self, data: bytes) -> None:
+        self.wav.writeframesraw(data)
+
+    def close(self, complete: bool) -> None:
+        self.wav.close()
+        if complete:
+            os.replace(self.tmp_path, self.path)
+            prune_audio_cache()
+        else:
+            os.remove(self.tmp_path)
+
+def _read_wav_blocks(file_path: str, block_seconds: float) -> Tuple[AudioParams, Iterator[bytes]]:
+    """Stream a WAV file that is already in the normalized format.
+
+    Any other sample format, channel count or rate raises wave.Error so the
+    file goes through ffmpeg, which resamples and downmixes it.
+    """
+    wav = wave.open(file_path, 'rb')
+    channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+    if (channels, width, rate) != (1, SAMPLE_WIDTH, SAMPLE_RATE):
+        wav.close()
+        raise wave.Error(f'{channels}-channel {width * 8}-bit {rate} Hz audio is decoded with ffmpeg')
+    params = NORMALIZED_PARAMS._replace(duration=wav.getnframes() / float(rate))
+    frames_per_block = max(1, int(rate * block_seconds))
+
+    def blocks():
+        with wav:
+            while True:
+                data = wav.readframes(frames_per_block)
+                if not data:
+                    return
+                yield data
+    return params, blocks()
+
+def _ffmpeg_blocks(source: str, block_seconds: float, feed: Optional[Iterator[bytes]] = None,
+                   cache_path: Optional[str] = None) -> Iterator[bytes]:
+    """Decode with ffmpeg to normalized PCM blocks.
+
+    feed supplies the input on stdin instead of ffmpeg reading source itself;
+    cache_path tees the decoded frames into a cache artifact. The process is
+    only started once iteration begins, and is killed if iteration stops early.
+    """
+    args = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error']
+    if feed is None:
+        args.append('-nostdin')
+    args += ['-i', source, '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1']
+    process = subprocess.Popen(args, stdin=subprocess.PIPE if feed is not None else None,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    feed_errors = []
+
+    def pump():
+        try:
+            for data in feed:
+                process.stdin.write(data)
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    feeder = None
+    if feed is not None:
+        feeder = threading.Thread(target=pump, daemon=True)
+        feeder.start()
+
+    block_bytes = max(1, int(SAMPLE_RATE * block_seconds)) * SAMPLE_WIDTH
+    artifact = _CacheArtifact(cache_path) if cache_path else None
+    complete = False
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            if artifact:
+                artifact.write(data)
+            yield data
+        if feeder:
+            feeder.join()
+        stderr = process.stderr.read().decode('utf-8', 'replace').strip()
+        if feed_errors:
+            raise feed_errors[0]
+        if process.wait() != 0:
+            raise RuntimeError(f'ffmpeg failed: {stderr}')
+        complete = True
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        if artifact:
+            artifact.close(complete)
+
+def read_pcm_blocks(file_path: str, block_seconds: float = BLOCK_SECONDS) -> Tuple[AudioParams, Iterator[bytes]]:
+    """Return audio parameters and an iterator of normalized PCM blocks.
+
+    16 kHz mono 16-bit WAV files are read incrementally with the wave module.
+    Everything else is piped through ffmpeg as raw frames, so nothing is
+    transcoded to disk first; the decoded frames are kept as a cached
+    artifact for the next read.
+    """
+    if file_path.lower().endswith('.wav'):
+        try:
+            return _read_wav_blocks(file_path, block_seconds)
+        except wave.Error:
+            pass  # e.g. stereo, 44.1 kHz, float or compressed WAV
+
+    cached = cached_audio_path(file_path)
+    if cached and os.path.exists(cached):
+        # Touch for least-recently-used pruning
+        os.utime(cached)
+        return _read_wav_blocks(cached, block_seconds)
+
+    return NORMALIZED_PARAMS, _ffmpeg_blocks(file_path, block_seconds, cache_path=cached)
+
+def follow_file(file_path: str, is_finished: Callable[[], bool],
+                poll_interval: float = FOLLOW_POLL_SECONDS,
+                idle_timeout: float = FOLLOW_IDLE_TIMEOUT) -> Iterator[bytes]:
+    """Yield data as it is appended to a file until is_finished() and EOF.
+
+    Raises TimeoutError if the file stops growing for idle_timeout seconds
+    while it is still unfinished, e.g. when a client abandons an upload.
+    """
+    last_data = time.monotonic()
+    with open(file_path, 'rb') as f:
+        while True:
+            # Check before reading so data appended just before finishing is not lost
+            finished = is_finished()
+            data = f.read(READ_SIZE)
+            if data:
+                last_data = time.monotonic()
+                yield data
+                continue
+            if finished:
+                return
+            if time.monotonic() - last_data > idle_timeout:
+                raise TimeoutError(f'No audio received for {idle_timeout}s')
+            time.sleep(poll_interval)
+
+def read_growing_pcm_blocks(file_path: str, is_finished: Callable[[], bool],
+                            block_seconds: float = BLOCK_SECONDS) -> Tuple[AudioParams, Iterator[bytes]]:
+    """Decode a file that is still being written, e.g. an in-progress upload.
+
+    The bytes are piped through ffmpeg as they arrive, so decoding keeps pace
+    with the upload. The duration is unknown and reported as None.
+    """
+    return NORMALIZED_PARAMS, _ffmpeg_blocks('pipe:0', block_seconds, feed=follow_file(file_path, is_finished))
+
+def encode_wav(pcm: bytes) -> bytes:
+    """Wrap normalized PCM in a WAV header, in memory"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+def _rms(block: bytes) -> int:
+    """Root mean square of a block of normalized 16-bit samples"""
+    samples = array.array('h', block[:len(block) - len(block) % SAMPLE_WIDTH])
+    if not samples:
+        return 0
+    return int(math.sqrt(sum(sample * sample for sample in samples) / len(samples)))
+
+def _quietest_block(blocks: List[bytes], search_blocks: int) -> Tuple[int, int]:
+    start = max(0, len(blocks) - search_blocks)
+    levels = [(_rms(blocks[i]), i) for i in range(start, len(blocks))]
+    return min(levels)
+
+def iter_audio_windows(file_path: str, window_seconds: float = 30, overlap_seconds: float = 2,
+                       is_finished: Optional[Callable[[], bool]] = None) -> Iterator[AudioWindow]:
+    """Split a recording into in-memory WAV windows.
+
+    Each window is cut at the quietest point near its end when that point is
+    silent. Otherwise it is cut at the window length and the next window
+    repeats the last overlap_seconds, so words on the boundary are not lost.
+    Only the current window is held in memory.
+
+    Pass is_finished to window a file that is still being written; windows
+    are then produced as the data arrives.
+    """
+    if is_finished is not None:
+        params, blocks = read_growing_pcm_blocks(file_path, is_finished)
+    else:
+        params, blocks = read_pcm_blocks(file_path)
+    window_blocks = int(window_seconds / BLOCK_SECONDS)
+    overlap_blocks = int(overlap_seconds / BLOCK_SECONDS)
+    search_blocks = int(SILENCE_SEARCH_SECONDS / BLOCK_SECONDS)
+    silence = SILENCE_RATIO * (2 ** (8 * SAMPLE_WIDTH - 1))
+
+    index = 0
+    start_block = 0
+    overlap = 0.0
+    current = []
+
+    def emit(window_data, overlap):
+        start = start_block * BLOCK_SECONDS
+        return AudioWindow(index, encode_wav(b''.join(window_data)), start,
+                           start + len(window_data) * BLOCK_SECONDS, overlap)
+
+    for block in blocks:
+        current.append(block)
+        if len(current) < window_blocks:
+            continue
+
+        level, cut = _quietest_block(current, search_blocks)
+        if level <= silence:
+            window_data, carry, next_overlap = current[:cut + 1], current[cut + 1:], 0.0
+        else:
+            carry = current[-overlap_blocks:] if overlap_blocks else []
+            window_data, next_overlap = current, len(carry) * BLOCK_SECONDS
+
+        yield emit(window_data, overlap)
+        index += 1
+        start_block += len(window_data) - (len(carry) if next_overlap else 0)
+        overlap = next_overlap
+        current = list(carry)
+
+    # Skip a tail that only repeats the overlap from the previous window
+    if current and (index == 0 or len(current) * BLOCK_SECONDS > overlap):
+        yield emit(current, overlap)
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r'[^\w]', '', word.lower())
+
+def merge_transcripts(previous: str, addition: str, max_overlap_words: int = 20) -> str:
+    """Return the part of addition that does not repeat the end of previous"""
+    previous_words = previous.split()
+    addition_words = addition.split()
+    longest = min(max_overlap_words, len(previous_words), len(addition_words))
+    for size in range(longest, 0, -1):
+        tail = [_normalize_word(w) for w in previous_words[-size:]]
+        head = [_normalize_word(w) for w in addition_words[:size]]
+        if tail == head:
+            return ' '.join(addition_words[size:])
+    return ' '.join(addition_words)
+
+def join_transcript(transcript: str, chunk_text: str, overlap: Optional[float]) -> Tuple[str, str]:
+    """Append a chunk to the running transcript, de-duplicating overlapped words.
+
+    Returns (new_transcript, text_added).
+    """
+    chunk_text = (chunk_text or '').strip()
+    if overlap:
+        chunk_text = merge_transcripts(transcript, chunk_text)
+    if not chunk_text:
+        return transcript, ''
+    return (f'{transcript} {chunk_text}' if transcript else chunk_text), chunk_text
@@ -1,8 +1,238 @@
+import os
+import json
+import time
+import fcntl
+import atexit
+import socket
+import hashlib
+import logging
+import threading
+from datetime import datetime
 from functools import wraps
+from typing import Any, Dict, List, Optional
 from flask import request, current_app
 from flask_login import current_user
+from sqlalchemy import select
 from models import db, AuditLog, Patient, Document, Condition
-import json
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '1.0'))  # seconds
+# Spool segments live here until their events are committed; defaults to instance/audit_spool
+AUDIT_SPOOL_DIR = os.environ.get('AUDIT_SPOOL_DIR', '')
+# fsync every event: survives power loss as well as a crashed process, at a cost per request
+AUDIT_SPOOL_FSYNC = os.environ.get('AUDIT_SPOOL_FSYNC', '').lower() in ('1', 'true', 'yes')
+RETRY_BASE_DELAY = 5  # seconds, doubled while the database keeps failing
+RETRY_MAX_DELAY = 300
+RECOVER_INTERVAL = 60  # seconds between scans for segments left by dead processes
+SPOOL_SUFFIX = '.jsonl'
+
+class _Segment:
+    """A spool file this process appends to, locked for as long as it is open"""
+
+    def __init__(self, path: str, fd: int):
+        self.path = path
+        self.fd = fd
+
+    def read_events(self) -> List[Dict[str, Any]]:
+        events = []
+        with open(self.path, encoding='utf-8') as lines:
+            for number, line in enumerate(lines, 1):
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # The process died mid-append; the event never reached its request's response
+                    logger.warning(f"Skipping torn audit spool line {number} in {self.path}")
+        return events
+
+    def remove(self) -> None:
+        os.unlink(self.path)
+        os.close(self.fd)
+
+def _row(event: Dict[str, Any]) -> Dict[str, Any]:
+    return {**event, 'timestamp': datetime.fromisoformat(event['timestamp'])}
+
+def _identity(row) -> tuple:
+    return (row['timestamp'], row['user_id'], row['action'], row['resource_type'], row['resource_id'])
+
+class AuditWriter:
+    """Writes one database's audit events in batches from a background thread.
+
+    Each event is appended to this process's current spool segment before it
+    is queued, and a segment is deleted only after its events are committed.
+    Segments that fail to insert are retried from disk; segments left behind
+    by a dead process are found by their released lock and replayed. Replays
+    skip events already in audit_log, so a crash between commit and delete
+    does not duplicate them.
+    """
+
+    def __init__(self, engine, spool_dir: str):
+        self.engine = engine
+        self.spool_dir = spool_dir
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending: List[Dict[str, Any]] = []
+        self.segment: Optional[_Segment] = None
+        self.sequence = 0
+        self.failed: List[_Segment] = []
+        self.retry_delay = RETRY_BASE_DELAY
+        self.retry_at = 0.0
+        os.makedirs(spool_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self.thread.start()
+
+    def enqueue(self, event: Dict[str, Any]) -> None:
+        line = (json.dumps(event, separators=(',', ':')) + '\n').encode('utf-8')
+        with self.lock:
+            if self.segment is None:
+                self.segment = self._open_segment()
+            os.write(self.segment.fd, line)
+            if AUDIT_SPOOL_FSYNC:
+                os.fsync(self.segment.fd)
+            self.pending.append(event)
+            full = len(self.pending) >= AUDIT_BATCH_SIZE
+        if full:
+            self.wakeup.set()
+
+    def _open_segment(self) -> _Segment:
+        self.sequence += 1
+        path = os.path.join(self.spool_dir, f"{socket.gethostname()}-{self.pid}-"
+                                            f"{time.time_ns()}-{self.sequence}{SPOOL_SUFFIX}")
+        # Locked before it gets a name recovery looks at
+        fd = os.open(path + '.new', os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(path + '.new', path)
+        return _Segment(path, fd)
+
+    def flush(self) -> None:
+        """Write everything queued so far, and retry failed segments that are due"""
+        with self.flush_lock:
+            with self.lock:
+                events, self.pending = self.pending, []
+                segment, self.segment = self.segment, None
+            if segment is not None:
+                self._write(segment, events)
+            if self.failed and time.monotonic() >= self.retry_at:
+                failed, self.failed = self.failed, []
+                for segment in failed:
+                    self._write(segment, segment.read_events(), replay=True)
+
+    def _write(self, segment: _Segment, events: List[Dict[str, Any]], replay: bool = False) -> None:
+        rows = [_row(event) for event in events]
+        try:
+            with self.engine.begin() as conn:
+                if replay and rows:
+                    rows = self._unwritten(conn, rows)
+                for start in range(0, len(rows), AUDIT_BATCH_SIZE):
+                    conn.execute(AuditLog.__table__.insert(), rows[start:start + AUDIT_BATCH_SIZE])
+            segment.remove()
+            self.retry_delay = RETRY_BASE_DELAY
+        except Exception as e:
+            logger.error(f"Audit batch of {len(rows)} event(s) failed, keeping {segment.path}: {str(e)}")
+            self.failed.append(segment)
+            self.retry_at = time.monotonic() + self.retry_delay
+            self.retry_delay = min(self.retry_delay * 2, RETRY_MAX_DELAY)
+
+    @staticmethod
+    def _unwritten(conn, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Rows not already committed, looked up by their timestamp range"""
+        table = AuditLog.__table__
+        timestamps = [row['timestamp'] for row in rows]
+        existing = {_identity(row) for row in conn.execute(
+            select(table.c.timestamp, table.c.user_id, table.c.action, table.c.resource_type,
+                   table.c.resource_id)
+            .where(table.c.timestamp.between(min(timestamps), max(timestamps)))).mappings()}
+        return [row for row in rows if _identity(row) not in existing]
+
+    def recover(self) -> int:
+        """Replay segments whose process has died; returns the number of events found"""
+        found = 0
+        with self.flush_lock:
+            own = {segment.path for segment in self.failed}
+            for name in sorted(os.listdir(self.spool_dir)):
+                path = os.path.join(self.spool_dir, name)
+                if not name.endswith(SPOOL_SUFFIX) or path in own:
+                    continue
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                except FileNotFoundError:
+                    continue
+                try:
+                    # Held by a live writer until its events are committed
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    continue
+                if not os.path.exists(path):
+                    # Committed and removed while we were waiting to open it
+                    os.close(fd)
+                    continue
+                segment = _Segment(path, fd)
+                events = segment.read_events()
+                found += len(events)
+                logger.warning(f"Recovering {len(events)} audit event(s) from {path}")
+                self._write(segment, events, replay=True)
+        return found
+
+    def _run(self) -> None:
+        try:
+            self.recover()
+        except Exception as e:
+            logger.error(f"Audit spool recovery failed: {str(e)}")
+        recovered_at = time.monotonic()
+        while True:
+            self.wakeup.wait(AUDIT_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.flush()
+                if time.monotonic() - recovered_at >= RECOVER_INTERVAL:
+                    self.recover()
+                    recovered_at = time.monotonic()
+            except Exception as e:
+                logger.error(f"Audit writer error: {str(e)}")
+
+    def abandon(self) -> None:
+        """Release inherited segments in a forked child; the parent still owns them"""
+        for segment in ([self.segment] if self.segment else []) + self.failed:
+            os.close(segment.fd)
+        self.pending, self.segment, self.failed = [], None, []
+
+_writers: Dict[Any, AuditWriter] = {}
+_writers_lock = threading.Lock()
+
+def _writer() -> AuditWriter:
+    engine = db.engine
+    writer = _writers.get(engine)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(engine)
+            if writer is None:
+                # One spool per database, so segments are never replayed into another
+                namespace = hashlib.sha1(str(engine.url).encode()).hexdigest()[:12]
+                spool_dir = AUDIT_SPOOL_DIR or os.path.join(current_app.instance_path, 'audit_spool')
+                writer = _writers[engine] = AuditWriter(engine, os.path.join(spool_dir, namespace))
+    return writer
+
+def flush_audit_log() -> None:
+    """Commit every audit event this process has queued"""
+    for writer in list(_writers.values()):
+        try:
+            writer.flush()
+        except Exception as e:
+            logger.error(f"Audit flush failed: {str(e)}")
+
+def _after_fork_in_child() -> None:
+    for writer in _writers.values():
+        writer.abandon()
+    _writers.clear()
+
+atexit.register(flush_audit_log)
+os.register_at_fork(after_in_child=_after_fork_in_child)
 
 def audit_log(action, resource_type):
     def decorator(f):
@@ -10,38 +240,13 @@ def audit_log(action, resource_type):
         def decorated_function(*args, **kwargs):
             try:
                 resource_id = kwargs.get('id')
+                user_id = current_user.id
                 before_value = None
                 after_value = None
 
-                if action == 'view':
+                if action == 'edit' and request.method == 'POST':
                     if resource_type == 'patient':
-                        patient = Patient.query.get(resource_id)
-                        after_value = {
-                            'action': 'View patient details',
-                            'patient_name': f'{patient.family_name}, {patient.given_name}',
-                            'id': patient.identifier,
-                            'type': 'Patient record view'
-                        }
-                    elif resource_type == 'document':
-                        document = Document.query.get(resource_id)
-                        after_value = {
-                            'action': 'View document',
-                            'title': document.title,
-                            'patient': f'{document.patient.family_name}, {document.patient.given_name}' if document.patient else 'No patient',
-                            'type': 'Document view'
-                        }
-                    elif resource_type == 'condition':
-                        condition = Condition.query.get(resource_id)
-                        after_value = {
-                            'action': 'View condition',
-                            'code': condition.code,
-                            'description': condition.notes,
-                            'patient': f'{condition.patient.family_name}, {condition.patient.given_name}',
-                            'type': 'Condition view'
-                        }
-                elif action == 'edit' and request.method == 'POST':
-                    if resource_type == 'patient':
-                        original = Patient.query.get(resource_id)
+                        original = db.session.get(Patient, resource_id)
                         before_value = {
                             'name': f'{original.family_name}, {original.given_name}',
                             'gender': original.gender,
@@ -50,14 +255,14 @@ def audit_log(action, resource_type):
                             'address': original.address_line
                         }
                     elif resource_type == 'document':
-                        original = Document.query.get(resource_id)
+                        original = db.session.get(Document, resource_id)
                         before_value = {
                             'title': original.title,
                             'content': original.content,
                             'transcription': original.transcription
                         }
                     elif resource_type == 'condition':
-                        original = Condition.query.get(resource_id)
+                        original = db.session.get(Condition, resource_id)
                         before_value = {
                             'code': original.code,
                             'status': original.clinical_status,
@@ -73,22 +278,50 @@ def audit_log(action, resource_type):
                     }
 
                 result = f(*args, **kwargs)
-                
-                # Create audit log entry
-                log = AuditLog(
-                    user_id=current_user.id,
-                    action=action,
-                    resource_type=resource_type,
-                    resource_id=resource_id,
-                    details=str(request.form if request.form else request.args),
-                    before_value=json.dumps(before_value) if before_value else None,
-                    after_value=json.dumps(after_value) if after_value else None,
-                    ip_address=request.remote_addr,
-                    user_agent=request.user_agent.string
-                )
-                db.session.add(log)
-                db.session.commit()
-                
+
+                if action == 'view':
+                    # The view has just loaded the record, so this is an identity map hit
+                    if resource_type == 'patient':
+                        patient = db.session.get(Patient, resource_id)
+                        after_value = {
+                            'action': 'View patient details',
+                            'patient_name': f'{patient.family_name}, {patient.given_name}',
+                            'id': patient.identifier,
+                            'type': 'Patient record view'
+                        }
+                    elif resource_type == 'document':
+                        document = db.session.get(Document, resource_id)
+                        after_value = {
+                            'action': 'View document',
+                            'title': document.title,
+                            'patient': f'{document.patient.family_name}, {document.patient.given_name}' if document.patient else 'No patient',
+                            'type': 'Document view'
+                        }
+                    elif resource_type == 'condition':
+                        condition = db.session.get(Condition, resource_id)
+                        after_value = {
+                            'action': 'View condition',
+                            'code': condition.code,
+                            'description': condition.notes,
+                            'patient': f'{condition.patient.family_name}, {condition.patient.given_name}',
+                            'type': 'Condition view'
+                        }
+
+                # Spooled and queued; the background writer inserts it with the rest of its batch
+                _writer().enqueue({
+                    'timestamp': datetime.utcnow().isoformat(),
+                    'user_id': user_id,
+                    'action': action,
+                    'resource_type': resource_type,
+                    'resource_id': resource_id,
+                    'details': str(request.form if request.form else request.args),
+                    'before_value': json.dumps(before_value) if before_value else None,
+                    'after_value': json.dumps(after_value) if after_value else None,
+                    'ip_address': request.remote_addr,
+                    # One oversized value would fail the whole batch on PostgreSQL
+                    'user_agent': request.user_agent.string[:200]
+                })
+
                 return result
             except Exception as e:
                 current_app.logger.error(f'Error in audit log: {str(e)}')
@@ -0,0 +1,234 @@
+import os
+import re
+import json
+import gzip
+import time
+import logging
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import bindparam, text, DateTime
+from models import db, AuditLog
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Months kept in audit_log, counting the current one; older months go to the archive
+AUDIT_ONLINE_MONTHS = int(os.environ.get('AUDIT_ONLINE_MONTHS', '13'))
+# Monthly partitions created ahead of time so inserts never land in the default partition
+AUDIT_PREMAKE_MONTHS = int(os.environ.get('AUDIT_PREMAKE_MONTHS', '3'))
+# Gzipped JSONL files of archived months; defaults to instance/audit_archive
+AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR', '')
+ARCHIVE_FETCH_SIZE = 10000
+# Days shown by the admin audit log page when no dates are given
+AUDIT_QUERY_DAYS = int(os.environ.get('AUDIT_QUERY_DAYS', '30'))
+
+PARENT_TABLE = 'audit_log'
+DEFAULT_PARTITION = 'audit_log_default'
+PARTITION_NAME = re.compile(r'^audit_log_y(\d{4})m(\d{2})$')
+
+Partition = namedtuple('Partition', ['name', 'start', 'end', 'rows'])
+ArchiveStats = namedtuple('ArchiveStats', ['month', 'rows', 'path', 'seconds'])
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f'{PARENT_TABLE}_y{month.year:04d}m{month.month:02d}'
+
+def archive_dir() -> str:
+    return AUDIT_ARCHIVE_DIR or os.path.join(current_app.instance_path, 'audit_archive')
+
+def archive_path(month: date, directory: Optional[str] = None) -> str:
+    """A new archive file for the month: months archived again (late rows) get numbered files"""
+    directory = directory or archive_dir()
+    path = os.path.join(directory, f'{PARENT_TABLE}_{month:%Y-%m}.jsonl.gz')
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = os.path.join(directory, f'{PARENT_TABLE}_{month:%Y-%m}.{number}.jsonl.gz')
+    return path
+
+def query_window(start: str = '', end: str = '', today: Optional[date] = None) -> Tuple[datetime, datetime]:
+    """[since, until) datetimes for optional YYYY-MM-DD start and end dates, both inclusive.
+
+    Defaults to the last AUDIT_QUERY_DAYS days. Audit log queries are always
+    bounded this way, so PostgreSQL only scans the partitions they overlap.
+    Raises ValueError for a date that does not parse.
+    """
+    today = today or datetime.utcnow().date()
+    last = date.fromisoformat(end) if end else today
+    first = date.fromisoformat(start) if start else last - timedelta(days=AUDIT_QUERY_DAYS - 1)
+    if first > last:
+        first, last = last, first
+    return datetime.combine(first, datetime.min.time()), datetime.combine(last + timedelta(days=1), datetime.min.time())
+
+def is_partitioned(conn) -> bool:
+    """Whether audit_log is a partitioned table (PostgreSQL after the migration)"""
+    if conn.dialect.name != 'postgresql':
+        return False
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"), {'name': PARENT_TABLE}).scalar())
+
+def _month_range(sql: str):
+    # Bound as DateTime so SQLite compares them in its stored timestamp format
+    return text(sql).bindparams(bindparam('start', type_=DateTime), bindparam('end', type_=DateTime))
+
+def _bounds(month: date) -> dict:
+    end = add_months(month, 1)
+    return {'start': datetime(month.year, month.month, 1), 'end': datetime(end.year, end.month, 1)}
+
+def _partitions(conn) -> List[Partition]:
+    if not is_partitioned(conn):
+        return []
+    rows = conn.execute(text(
+        "SELECT c.relname, c.reltuples FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name AND pg_table_is_visible(p.oid)"), {'name': PARENT_TABLE}).all()
+    partitions = []
+    for name, estimate in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            start = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append(Partition(name, start, add_months(start, 1), max(int(estimate), 0)))
+    return sorted(partitions, key=lambda partition: partition.start)
+
+def list_partitions(engine=None) -> List[Partition]:
+    """Monthly partitions in date order, with the planner's row estimate"""
+    with (engine or db.engine).connect() as conn:
+        return _partitions(conn)
+
+def ensure_partitions(months_ahead: int = AUDIT_PREMAKE_MONTHS, engine=None,
+                      today: Optional[date] = None) -> List[str]:
+    """Create monthly partitions from the current month to months_ahead ahead.
+
+    Rows already in the default partition for a new month are moved into it.
+    Returns the names created; a no-op on databases without partitioning.
+    """
+    engine = engine or db.engine
+    current = month_start(today or datetime.utcnow())
+    created = []
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return created
+        existing = {partition.name for partition in _partitions(conn)}
+        for offset in range(months_ahead + 1):
+            start = add_months(current, offset)
+            name = partition_name(start)
+            if name in existing:
+                continue
+            bounds = _bounds(start)
+            # Attaching next to a default partition holding rows for the range
+            # fails, so build the table, move those rows in, then attach it
+            conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)"))
+            conn.execute(_month_range(f"""
+                WITH moved AS (
+                    DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end RETURNING *)
+                INSERT INTO {name} SELECT * FROM moved"""), bounds)
+            conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+                              f"FOR VALUES FROM ('{start}') TO ('{add_months(start, 1)}')"))
+            created.append(name)
+    for name in created:
+        logger.info(f"Created audit log partition {name}")
+    return created
+
+def _export(conn, source: str, month: date, path: str) -> int:
+    """Write the month's rows to a gzipped JSONL file, synced to disk; returns the row count"""
+    columns = [column.name for column in AuditLog.__table__.columns]
+    result = conn.execution_options(stream_results=True, yield_per=ARCHIVE_FETCH_SIZE).execute(_month_range(
+        f"SELECT {', '.join(columns)} FROM {source} "
+        f"WHERE timestamp >= :start AND timestamp < :end ORDER BY timestamp, id"), _bounds(month))
+    rows = 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.partial', 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+            for row in result:
+                record = dict(zip(columns, row))
+                if isinstance(record['timestamp'], datetime):
+                    record['timestamp'] = record['timestamp'].isoformat()
+                archive.write((json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8'))
+                rows += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(path + '.partial', path)
+    return rows
+
+def archive_month(month: date, engine=None, directory: Optional[str] = None) -> ArchiveStats:
+    """Move one month of audit_log into a gzipped JSONL archive file.
+
+    The month is locked against inserts while it is exported, and the file is
+    on disk before the partition is dropped (or, without partitioning, the
+    rows deleted) in the same transaction. If that transaction fails the file
+    is removed; a crash between the two can leave rows in both, told apart by
+    their id.
+    """
+    engine = engine or db.engine
+    start_time = time.perf_counter()
+    start = month_start(month)
+    path = archive_path(start, directory)
+    try:
+        with engine.begin() as conn:
+            partitioned = is_partitioned(conn)
+            name = partition_name(start)
+            if partitioned and name in {partition.name for partition in _partitions(conn)}:
+                conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+                rows = _export(conn, name, start, path)
+                conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+            else:
+                # No partition for the month: rows are in the default partition or a plain table
+                source = DEFAULT_PARTITION if partitioned else PARENT_TABLE
+                if conn.dialect.name == 'postgresql':
+                    conn.execute(text(f"LOCK TABLE {source} IN SHARE MODE"))
+                rows = _export(conn, source, start, path)
+                if rows:
+                    conn.execute(_month_range(
+                        f"DELETE FROM {source} WHERE timestamp >= :start AND timestamp < :end"), _bounds(start))
+    except Exception:
+        for leftover in (path, path + '.partial'):
+            if os.path.exists(leftover):
+                os.unlink(leftover)
+        raise
+    if not rows:
+        os.unlink(path)
+        path = None
+    stats = ArchiveStats(start, rows, path, time.perf_counter() - start_time)
+    if rows:
+        logger.info(f"Archived {stats.rows} audit log row(s) for {start:%Y-%m} to {path} in {stats.seconds:.2f}s")
+    return stats
+
+def archive_old_months(online_months: int = AUDIT_ONLINE_MONTHS, engine=None,
+                       directory: Optional[str] = None, today: Optional[date] = None) -> List[ArchiveStats]:
+    """Archive every month before the last online_months, oldest first"""
+    engine = engine or db.engine
+    cutoff = add_months(month_start(today or datetime.utcnow()), 1 - online_months)
+    with engine.connect() as conn:
+        months = {partition.start for partition in _partitions(conn) if partition.start < cutoff}
+        # Rows outside any partition (or every row, without partitioning)
+        source = DEFAULT_PARTITION if is_partitioned(conn) else PARENT_TABLE
+        oldest = conn.execute(text(f"SELECT min(timestamp) FROM {source} WHERE timestamp < :cutoff")
+                              .bindparams(bindparam('cutoff', type_=DateTime)),
+                              {'cutoff': datetime(cutoff.year, cutoff.month, 1)}).scalar()
+    if isinstance(oldest, str):
+        oldest = datetime.fromisoformat(oldest)
+    if oldest is not None:
+        month = month_start(oldest)
+        while month < cutoff:
+            months.add(month)
+            month = add_months(month, 1)
+    return [archive_month(month, engine=engine, directory=directory) for month in sorted(months)]
+
+def read_archive(path: str):
+    """Rows of an archive file, for restores and audits of archived months"""
+    with gzip.open(path, 'rt', encoding='utf-8') as lines:
+        for line in lines:
+            record = json.loads(line)
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+            yield record
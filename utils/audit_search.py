@@ -0,0 +1,71 @@
+import re
+import logging
+from collections import namedtuple
+from typing import Optional
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.orm import joinedload
+from models import db, AuditLog, User
+from utils.pagination import Page, decode_cursor, estimate_count, keyset_filter
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AUDIT_PAGE_SIZE = 50
+
+# Newest first; every audit index ends in (timestamp, id), so each filter
+# below is an index range read in this order
+AUDIT_ORDER = (AuditLog.timestamp, AuditLog.id)
+
+# The same expression as idx_audit_details_fts, so PostgreSQL can use it
+DETAILS_VECTOR = func.to_tsvector(literal_column("'simple'"),
+                                  func.coalesce(AuditLog.details, literal_column("''")))
+
+AuditFilters = namedtuple('AuditFilters', ['since', 'until', 'username', 'action', 'resource_type',
+                                           'resource_id', 'text'])
+
+def _details_match(text: str):
+    if db.engine.dialect.name == 'postgresql':
+        # Every word, each as a prefix: "ohi anx" finds "...Ohio ... anxiety..."
+        words = re.findall(r'\w+', text.lower())
+        if words:
+            return DETAILS_VECTOR.op('@@')(func.to_tsquery(literal_column("'simple'"),
+                                                           ' & '.join(f'{word}:*' for word in words)))
+    return AuditLog.details.contains(text, autoescape=True)
+
+def filtered_audit_logs(filters: AuditFilters, query=None):
+    """Audit log rows matching the filters, unordered"""
+    query = (query or AuditLog.query).filter(AuditLog.timestamp >= filters.since,
+                                             AuditLog.timestamp < filters.until)
+    if filters.username:
+        query = query.filter(AuditLog.user_id == select(User.id).where(
+            User.username == filters.username).scalar_subquery())
+    if filters.action:
+        query = query.filter(AuditLog.action == filters.action)
+    if filters.resource_type:
+        query = query.filter(AuditLog.resource_type == filters.resource_type)
+    if filters.resource_id is not None:
+        query = query.filter(AuditLog.resource_id == filters.resource_id)
+    if filters.text:
+        query = query.filter(_details_match(filters.text))
+    return query
+
+def search_audit_logs(filters: AuditFilters, cursor: Optional[str] = None,
+                      limit: int = AUDIT_PAGE_SIZE) -> Page:
+    """One page of audit log entries, newest first.
+
+    The cursor is checked immediately (InvalidCursorError); rows and the
+    capped count are only fetched when the page is used.
+    """
+    matches = filtered_audit_logs(filters)
+    after = decode_cursor(cursor)
+    # The cursor goes first: SQLite bounds the index scan with the first of
+    # several upper bounds on timestamp, and the cursor's is the tighter one
+    page = filtered_audit_logs(filters, AuditLog.query.filter(
+        keyset_filter(AUDIT_ORDER, after, descending=True))) if after else matches
+
+    def fetch(count):
+        return page.options(joinedload(AuditLog.user)).order_by(
+            *(column.desc() for column in AUDIT_ORDER)).limit(count).all()
+
+    return Page(fetch, limit, key=lambda log: [log.timestamp, log.id], count=lambda: estimate_count(matches))
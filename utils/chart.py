@@ -0,0 +1,44 @@
+import logging
+from collections import namedtuple
+from typing import List, Optional
+from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy.orm.attributes import set_committed_value
+from models import db, Patient, AssessmentResult, Condition, Document
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+Chart = namedtuple('Chart', ['patient', 'assessments', 'draft_count', 'conditions', 'documents'])
+
+def load_assessments(patient_id: int) -> List[AssessmentResult]:
+    """A patient's assessment results, newest first, with tool and assessor in the same query"""
+    return (AssessmentResult.query.filter_by(patient_id=patient_id)
+            .options(joinedload(AssessmentResult.tool), joinedload(AssessmentResult.assessor))
+            .order_by(AssessmentResult.assessment_date.desc(), AssessmentResult.id.desc())
+            .all())
+
+def load_chart(patient_id: int) -> Optional[Chart]:
+    """Everything the patient chart page shows, in four queries.
+
+    Each list is sorted by the database and also set as the patient's
+    collection, so templates touching patient.conditions and friends do not
+    lazy-load them again. Returns None for an unknown patient.
+    """
+    patient = db.session.get(Patient, patient_id)
+    if patient is None:
+        return None
+
+    assessments = load_assessments(patient_id)
+    conditions = Condition.query.filter_by(patient_id=patient_id).order_by(Condition.id).all()
+    # The chart only links to documents, so their text is never read
+    documents = (Document.query.filter_by(patient_id=patient_id)
+                 .options(load_only(Document.id, Document.title, Document.updated_at, Document.patient_id))
+                 .order_by(Document.updated_at.desc(), Document.id.desc())
+                 .all())
+
+    set_committed_value(patient, 'assessment_results', assessments)
+    set_committed_value(patient, 'conditions', conditions)
+    set_committed_value(patient, 'documents', documents)
+    draft_count = sum(1 for result in assessments if result.status == 'draft')
+    return Chart(patient, assessments, draft_count, conditions, documents)
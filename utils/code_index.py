@@ -0,0 +1,377 @@
+import os
+import re
+import time
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from typing import Dict, List, Optional
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, object_session
+from models import db, ICD10Code
+from utils import suggestion_cache
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CODE_SUGGESTION_LIMIT = 10
+# Most suggestions one request may ask for; clients narrow these locally as the user types
+MAX_CODE_CANDIDATES = 100
+# Seconds between checks for ICD-10 changes made by other processes
+CODE_INDEX_TTL = int(os.environ.get('CODE_INDEX_TTL', '60'))
+
+CodeEntry = namedtuple('CodeEntry', ['code', 'description', 'system', 'category'])
+
+# Ranking tiers, best first
+CODE_PREFIX, DESCRIPTION_START, DESCRIPTION_WORD = range(3)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _code_key(code: str) -> str:
+    # "f41.1", "F41.1" and "F411" find the same code
+    return code.upper().replace('.', '').strip()
+
+def _words(text: str) -> List[str]:
+    return re.findall(r'\w+', text.lower())
+
+class _PrefixTrie:
+    """Character trie keeping, at every node, the `limit` smallest ids stored below it.
+
+    Ids are ranks, so each node's list is already its top-k and a lookup is
+    a walk down the prefix.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.root = ({}, [])
+
+    def insert(self, key: str, items: List[int]) -> None:
+        """Store key with its ids, which must be in ascending order"""
+        items = items[:self.limit]
+        node = self.root
+        self._keep(node, items)
+        for char in key:
+            child = node[0].get(char)
+            if child is None:
+                child = node[0][char] = ({}, [])
+            node = child
+            self._keep(node, items)
+
+    def _keep(self, node, items: List[int]) -> None:
+        top = node[1]
+        if not top:
+            top.extend(items)
+        elif len(top) < self.limit or items[0] < top[-1]:
+            top[:] = sorted(set(top).union(items))[:self.limit]
+
+    def top(self, prefix: str) -> List[int]:
+        node = self.root
+        for char in prefix:
+            node = node[0].get(char)
+            if node is None:
+                return []
+        return node[1]
+
+class CodeIndex:
+    """Immutable suggestion index over the codes of one coding system.
+
+    Codes are ranked shortest first, so a code prefix trie holds the best
+    code matches at each node. Descriptions are ranked shortest first too and
+    indexed by word prefix: tries of top-k ids for single-word input, and a
+    sorted vocabulary with full postings for multi-word input.
+    """
+
+    def __init__(self, entries, limit: int = MAX_CODE_CANDIDATES + 1):
+        self.limit = limit
+        keyed = sorted((len(key), key, entry) for key, entry in
+                       ((_code_key(entry.code), entry) for entry in entries))
+        by_code = [entry for _, _, entry in keyed]
+        by_description = sorted(range(len(by_code)), key=lambda i: (len(by_code[i].description), i))
+        self.entries = by_code
+        self.description_order = by_description  # rank -> entry position
+
+        self.codes = _PrefixTrie(limit)
+        for position, (_, key, _) in enumerate(keyed):
+            self.codes.insert(key, [position])
+
+        self.description_words = []
+        postings = defaultdict(list)
+        first_postings = defaultdict(list)
+        for rank, position in enumerate(by_description):
+            words = _words(by_code[position].description)
+            self.description_words.append(tuple(words))
+            if words:
+                first_postings[words[0]].append(rank)
+            for word in dict.fromkeys(words):
+                postings[word].append(rank)
+        self.vocabulary = sorted(postings)
+        self.postings = [postings[word] for word in self.vocabulary]
+
+        # Each distinct word once, with its postings, rather than every occurrence
+        self.first_words = _PrefixTrie(limit)
+        for word, ranks in first_postings.items():
+            self.first_words.insert(word, ranks)
+        self.words = _PrefixTrie(limit)
+        for word, ranks in zip(self.vocabulary, self.postings):
+            self.words.insert(word, ranks)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _word_ranks(self, prefix: str):
+        """Description ranks with a word starting with prefix"""
+        start = bisect_left(self.vocabulary, prefix)
+        stop = bisect_left(self.vocabulary, prefix + '\uffff', start)
+        if stop - start == 1:
+            return self.postings[start]
+        return set().union(*self.postings[start:stop])
+
+    def _description_matches(self, words: List[str], limit: int):
+        """(tier, rank) pairs for descriptions matching every typed word prefix"""
+        if len(words) == 1:
+            starts = self.first_words.top(words[0])[:limit]
+            seen = set(starts)
+            anywhere = (rank for rank in self.words.top(words[0]) if rank not in seen)
+            return ([(DESCRIPTION_START, rank) for rank in starts] +
+                    [(DESCRIPTION_WORD, rank) for rank in anywhere])[:limit]
+        ranks = sorted((self._word_ranks(word) for word in dict.fromkeys(words)), key=len)
+        candidates = set(ranks[0]).intersection(*ranks[1:])
+        return heapq.nsmallest(limit, (
+            (DESCRIPTION_START if self.description_words[rank][0].startswith(words[0]) else DESCRIPTION_WORD, rank)
+            for rank in candidates))
+
+    def suggest(self, query: str, limit: Optional[int] = None) -> List[tuple]:
+        """Best (sort key, entry) pairs for typed text, best first.
+
+        Code prefix matches come first, then descriptions starting with the
+        text, then descriptions with a word starting with it. Sort keys are
+        unique and only grow as the text is extended, which lets
+        static/js/htql-suggestions.js rank and narrow them the same way.
+        """
+        limit = min(limit or self.limit, self.limit)
+        results = []
+        seen = set()
+        query_key = _code_key(query)
+        if query_key:
+            for position in self.codes.top(query_key)[:limit]:
+                key = _code_key(self.entries[position].code)
+                results.append(((CODE_PREFIX, len(key), key), self.entries[position]))
+                seen.add(position)
+        words = _words(query)
+        if words and len(results) < limit:
+            # Code matches found again by description are skipped, so ask for that many more
+            for tier, rank in self._description_matches(words, min(limit + len(seen), self.limit)):
+                position = self.description_order[rank]
+                if position not in seen:
+                    entry = self.entries[position]
+                    key = _code_key(entry.code)
+                    results.append(((tier, len(entry.description), len(key), key), entry))
+                    seen.add(position)
+        return results[:limit]
+
+@lru_cache(maxsize=1)
+def load_medical_codes():
+    """Load ICD-10 and SNOMED CT codes from static dictionary"""
+    codes = {
+        'ICD-10': {
+            'E11': 'Type 2 diabetes mellitus',
+            'E11.0': 'Type 2 diabetes with hyperosmolarity',
+            'E11.1': 'Type 2 diabetes with ketoacidosis',
+            'E11.2': 'Type 2 diabetes with kidney complications',
+            'E11.21': 'Type 2 diabetes with diabetic nephropathy',
+            'E11.22': 'Type 2 diabetes with diabetic chronic kidney disease',
+            'E11.3': 'Type 2 diabetes with ophthalmic complications',
+            'E11.31': 'Type 2 diabetes with background retinopathy',
+            'E11.32': 'Type 2 diabetes with proliferative retinopathy',
+            'E11.4': 'Type 2 diabetes with neurological complications',
+            'I10': 'Essential (primary) hypertension',
+            'I11': 'Hypertensive heart disease',
+            'I11.0': 'Hypertensive heart disease with heart failure',
+            'I11.9': 'Hypertensive heart disease without heart failure',
+            'J45': 'Asthma',
+            'J45.0': 'Predominantly allergic asthma',
+            'J45.1': 'Nonallergic asthma',
+            'J45.2': 'Mixed asthma',
+            'F32': 'Major depressive disorder, single episode',
+            'F41': 'Other anxiety disorders',
+            'F41.0': 'Panic disorder without agoraphobia',
+            'F41.1': 'Generalized anxiety disorder'
+        },
+        'SNOMED-CT': {
+            '44054006': 'Type 2 diabetes mellitus (disorder)',
+            '38341003': 'Hypertensive disorder, systemic arterial (disorder)',
+            '195967001': 'Asthma (disorder)',
+            '370143000': 'Major depression, single episode (disorder)',
+            '197480006': 'Anxiety disorder (disorder)',
+            '371631005': 'Panic disorder (disorder)',
+            '73211009': 'Diabetes mellitus (disorder)',
+            '59621000': 'Essential hypertension (disorder)',
+            '35489007': 'Depressive disorder (disorder)',
+            '69479009': 'Allergic asthma (disorder)'
+        }
+    }
+    return codes
+
+def _fingerprint(conn):
+    """Changes whenever ICD-10 rows are added, removed or updated"""
+    table = ICD10Code.__table__
+    return tuple(conn.execute(select(func.count(), func.max(table.c.id), func.max(table.c.updated_at))).one())
+
+class _Indexes:
+    def __init__(self, systems: Dict[str, CodeIndex], fingerprint, version: int):
+        self.systems = systems
+        self.fingerprint = fingerprint
+        self.version = version  # shared code set version the index was built from
+        self.checked_at = time.monotonic()
+        self.refreshing = False
+
+def _load_indexes(engine) -> _Indexes:
+    start = time.perf_counter()
+    # Read before the rows, so a bump during the build leaves this index stale rather than mislabelled
+    version = suggestion_cache.current_version(suggestion_cache.namespace_for(engine.url))
+    table = ICD10Code.__table__
+    with engine.connect() as conn:
+        fingerprint = _fingerprint(conn)
+        rows = conn.execute(select(table.c.code, table.c.description, table.c.category)).all()
+    icd10 = {code: CodeEntry(code, description, 'ICD-10', category) for code, description, category in rows}
+    static = load_medical_codes()
+    for code, description in static['ICD-10'].items():
+        icd10.setdefault(code, CodeEntry(code, description, 'ICD-10', code.split('.')[0]))
+    systems = {'ICD-10': CodeIndex(icd10.values())}
+    for system, codes in static.items():
+        if system not in systems:
+            systems[system] = CodeIndex(CodeEntry(code, description, system, code.split('.')[0])
+                                        for code, description in codes.items())
+    logger.info(f"Built code suggestion index for {sum(map(len, systems.values()))} codes "
+                f"in {time.perf_counter() - start:.2f}s")
+    return _Indexes(systems, fingerprint, version)
+
+def _refresh(engine, key: str, check: bool) -> None:
+    try:
+        if check:
+            with engine.connect() as conn:
+                unchanged = _fingerprint(conn) == _indexes[key].fingerprint
+            if unchanged:
+                _indexes[key].checked_at = time.monotonic()
+                _indexes[key].refreshing = False
+                return
+            # Changed outside this app's ORM and importer: cached suggestions are stale too
+            suggestion_cache.bump_version(suggestion_cache.namespace_for(engine.url))
+        indexes = _load_indexes(engine)
+        with _indexes_lock:
+            _indexes[key] = indexes
+    except Exception as e:
+        logger.error(f"Error rebuilding code suggestion index: {str(e)}")
+        with _indexes_lock:
+            if key in _indexes:
+                _indexes[key].checked_at = time.monotonic()
+                _indexes[key].refreshing = False
+
+def _current_indexes(version: Optional[int] = None) -> _Indexes:
+    engine = db.engine
+    key = str(engine.url)
+    if version is None:
+        version = suggestion_cache.current_version(suggestion_cache.namespace_for(engine.url))
+    with _indexes_lock:
+        indexes = _indexes.get(key)
+        if indexes is not None and not indexes.refreshing:
+            stale = indexes.version != version
+            if stale or time.monotonic() - indexes.checked_at > CODE_INDEX_TTL:
+                indexes.refreshing = True  # one refresh at a time
+                threading.Thread(target=_refresh, args=(engine, key, not stale), daemon=True).start()
+    if indexes is None:
+        indexes = _load_indexes(engine)
+        with _indexes_lock:
+            indexes = _indexes.setdefault(key, indexes)
+    return indexes
+
+def code_indexes() -> Dict[str, CodeIndex]:
+    """Suggestion index per coding system for the current database, built on first use.
+
+    A rebuilt index replaces the old one once it is ready; until then the old
+    one keeps serving. Another process bumping the code set version, or the
+    periodic check finding changed rows, triggers the rebuild.
+    """
+    return _current_indexes().systems
+
+def invalidate_code_index(engine=None) -> None:
+    """Invalidate cached suggestions in every process and rebuild this one's index,
+    e.g. after a bulk ICD-10 import"""
+    engine = engine or db.engine
+    key = str(engine.url)
+    suggestion_cache.bump_version(suggestion_cache.namespace_for(engine.url))
+    with _indexes_lock:
+        indexes = _indexes.get(key)
+        if indexes is None or indexes.refreshing:
+            # A refresh already running may have read the old rows; the version check reruns it
+            return
+        indexes.refreshing = True
+    threading.Thread(target=_refresh, args=(engine, key, False), daemon=True).start()
+
+@event.listens_for(ICD10Code, 'after_insert')
+@event.listens_for(ICD10Code, 'after_update')
+@event.listens_for(ICD10Code, 'after_delete')
+def _mark_codes_changed(mapper, connection, target):
+    object_session(target).info['icd10_changed'] = connection.engine
+
+@event.listens_for(Session, 'after_commit')
+def _rebuild_after_commit(session):
+    engine = session.info.pop('icd10_changed', None)
+    if engine is not None:
+        invalidate_code_index(engine)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('icd10_changed', None)
+
+def _ranked(systems: Dict[str, CodeIndex], query: str, system: Optional[str], limit: int) -> List[dict]:
+    if system:
+        systems = {system: systems[system]} if system in systems else {}
+    ranked = heapq.nsmallest(limit, (match for index in systems.values()
+                                     for match in index.suggest(query, limit)),
+                             key=lambda match: match[0])
+    return [{
+        'code': entry.code,
+        'description': entry.description,
+        'system': entry.system,
+        'category': entry.category,
+    } for _, entry in ranked]
+
+def suggest_codes(query: str, system: Optional[str] = None,
+                  limit: int = CODE_SUGGESTION_LIMIT) -> List[dict]:
+    """Ranked code suggestions for typed text across ICD-10 and SNOMED CT, or one system"""
+    query = query.strip()
+    if not query:
+        return []
+    return _ranked(code_indexes(), query, system, limit)
+
+def cached_suggest_codes(query: str, system: Optional[str] = None,
+                         limit: int = CODE_SUGGESTION_LIMIT) -> List[dict]:
+    """suggest_codes through the cache shared by every worker.
+
+    Entries are stamped with the code set version, so an ICD-10 change
+    anywhere invalidates them. A worker whose index is still being built can
+    answer from other workers' entries without waiting for it.
+    """
+    query = ' '.join(query.split())
+    if not query:
+        return []
+    namespace = suggestion_cache.namespace_for(db.engine.url)
+    version = suggestion_cache.current_version(namespace)
+    # Matching ignores case, so "f41" and "F41" share an entry
+    key = f"{namespace}|{system or '*'}|{limit}|{query.lower()}"
+    results = suggestion_cache.get(key, version)
+    if results is not None:
+        return results
+    indexes = _current_indexes(version)
+    results = _ranked(indexes.systems, query, system, limit)
+    if indexes.version == version:
+        suggestion_cache.put(key, version, results)
+    else:
+        # Built from older codes; serve it while the rebuild runs but do not share it
+        suggestion_cache.skip_stale()
+    return results
@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import case, event, func, inspect, select
+from sqlalchemy.orm import Session, object_session
+from models import db, AssessmentResult, AssessmentTool, Patient
+from utils.metrics import record_cache_lookup
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds a user's assessment panel is reused. Writes through this process's
+# ORM drop it at once; other processes' writes show up within this time. 0 disables.
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', '60'))
+RECENT_ASSESSMENTS = 5
+
+AssessmentStats = namedtuple('AssessmentStats', ['total', 'this_month', 'drafts'])
+RecentAssessment = namedtuple('RecentAssessment', ['id', 'patient_id', 'tool_name', 'family_name', 'given_name',
+                                                   'assessment_date', 'total_score', 'status'])
+ToolChoice = namedtuple('ToolChoice', ['id', 'name'])
+AssessmentPanel = namedtuple('AssessmentPanel', ['month_start', 'stats', 'recent', 'tools'])
+
+_panels = {}  # (database url, user id) -> (expires at, AssessmentPanel)
+_panels_lock = threading.Lock()
+# Bumped by every invalidation, so a panel read before a write is not stored after it
+_generation = 0
+
+def month_start(today: Optional[date] = None) -> datetime:
+    today = today or datetime.utcnow().date()
+    return datetime.combine(today.replace(day=1), datetime.min.time())
+
+def assessment_stats(user_id: int, since: datetime) -> AssessmentStats:
+    """The user's total, since-`since` and draft assessment counts in one query.
+
+    assessment_date is compared as stored, not through func.date(), so the
+    (assessor_id, assessment_date, status) index answers it on its own.
+    """
+    total, this_month, drafts = db.session.execute(
+        select(func.count(AssessmentResult.id),
+               func.count(case((AssessmentResult.assessment_date >= since, 1))),
+               func.count(case((AssessmentResult.status == 'draft', 1))))
+        .where(AssessmentResult.assessor_id == user_id)
+    ).one()
+    return AssessmentStats(total, this_month, drafts)
+
+def _recent_assessments(user_id: int) -> List[RecentAssessment]:
+    rows = db.session.execute(
+        select(AssessmentResult.id, AssessmentResult.patient_id, AssessmentTool.name, Patient.family_name,
+               Patient.given_name, AssessmentResult.assessment_date, AssessmentResult.total_score,
+               AssessmentResult.status)
+        .join(AssessmentTool, AssessmentTool.id == AssessmentResult.tool_id)
+        .join(Patient, Patient.id == AssessmentResult.patient_id)
+        .where(AssessmentResult.assessor_id == user_id)
+        .order_by(AssessmentResult.assessment_date.desc())
+        .limit(RECENT_ASSESSMENTS)
+    )
+    return [RecentAssessment(*row) for row in rows]
+
+def _active_tools() -> List[ToolChoice]:
+    rows = db.session.execute(select(AssessmentTool.id, AssessmentTool.name)
+                              .where(AssessmentTool.active.is_(True)).order_by(AssessmentTool.name))
+    return [ToolChoice(*row) for row in rows]
+
+def assessment_panel(user_id: int) -> AssessmentPanel:
+    """The dashboard's assessment counts, recent assessments and tool menu for a user.
+
+    Plain tuples, so a cached panel never touches the database or a session.
+    """
+    key = (str(db.engine.url), user_id)
+    since = month_start()
+    if DASHBOARD_CACHE_TTL > 0:
+        with _panels_lock:
+            entry = _panels.get(key)
+            generation = _generation
+        if entry is not None and entry[0] > time.monotonic() and entry[1].month_start == since:
+            record_cache_lookup('dashboard', 'hit')
+            return entry[1]
+        record_cache_lookup('dashboard', 'miss')
+
+    panel = AssessmentPanel(since, assessment_stats(user_id, since), _recent_assessments(user_id), _active_tools())
+    if DASHBOARD_CACHE_TTL > 0:
+        with _panels_lock:
+            if generation == _generation:
+                _panels[key] = (time.monotonic() + DASHBOARD_CACHE_TTL, panel)
+    return panel
+
+def invalidate_dashboard(changed: Iterable[Tuple[str, Optional[int]]]) -> None:
+    """Drop cached panels; a user id of None drops every panel for that database"""
+    global _generation
+    with _panels_lock:
+        _generation += 1
+        for url, user_id in changed:
+            if user_id is None:
+                for key in [key for key in _panels if key[0] == url]:
+                    del _panels[key]
+            else:
+                _panels.pop((url, user_id), None)
+
+def _mark_changed(target, connection, user_id: Optional[int]) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('dashboard_changed', set()).add((str(connection.engine.url), user_id))
+
+@event.listens_for(AssessmentResult, 'after_insert')
+@event.listens_for(AssessmentResult, 'after_update')
+@event.listens_for(AssessmentResult, 'after_delete')
+def _mark_assessment_changed(mapper, connection, target):
+    _mark_changed(target, connection, target.assessor_id)
+    # Reassigned: the previous assessor's counts changed too
+    for previous in inspect(target).attrs.assessor_id.history.deleted:
+        _mark_changed(target, connection, previous)
+
+# Tool names and patient names are shown in every user's panel
+@event.listens_for(AssessmentTool, 'after_insert')
+@event.listens_for(AssessmentTool, 'after_update')
+@event.listens_for(AssessmentTool, 'after_delete')
+@event.listens_for(Patient, 'after_update')
+def _mark_all_changed(mapper, connection, target):
+    _mark_changed(target, connection, None)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    changed = session.info.pop('dashboard_changed', None)
+    if changed:
+        invalidate_dashboard(changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('dashboard_changed', None)
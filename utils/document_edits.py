@@ -0,0 +1,127 @@
+import hashlib
+import logging
+from collections import namedtuple
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from sqlalchemy import insert, update
+from models import db, Document, DocumentBody
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# What the editor may change; transcription and audio_file belong to the audio pipeline
+EDITABLE_FIELDS = ('title', 'content', 'meat_monitoring', 'meat_assessment', 'meat_evaluation', 'meat_treatment')
+# Stored in document_body rather than the document row
+BODY_FIELDS = ('content', 'meat_monitoring', 'meat_assessment', 'meat_evaluation', 'meat_treatment')
+TITLE_MAX_LENGTH = 200
+
+SavedEdit = namedtuple('SavedEdit', ['version', 'updated_at', 'fields'])
+
+class InvalidEditError(ValueError):
+    """Raised for an unknown field, a non-text value or an unusable title"""
+
+class EditConflictError(Exception):
+    """Raised when the document changed since the version the edit was based on.
+
+    Carries the current version and editable fields so the editor can merge
+    without fetching the document again.
+    """
+
+    def __init__(self, version: int, fields: Dict[str, Any]):
+        super().__init__(f'Document is at version {version}')
+        self.version = version
+        self.fields = fields
+
+def validate_changes(changes: Mapping[str, Any]) -> Dict[str, str]:
+    """The changed fields, checked; raises InvalidEditError"""
+    if not isinstance(changes, Mapping):
+        raise InvalidEditError('changes must be an object')
+    unknown = sorted(set(changes) - set(EDITABLE_FIELDS))
+    if unknown:
+        raise InvalidEditError(f"Fields cannot be edited: {', '.join(unknown)}")
+    for field, value in changes.items():
+        if not isinstance(value, str):
+            raise InvalidEditError(f'{field} must be text')
+    if 'title' in changes:
+        if not changes['title'].strip():
+            raise InvalidEditError('Title is required')
+        if len(changes['title']) > TITLE_MAX_LENGTH:
+            raise InvalidEditError(f'Title must be at most {TITLE_MAX_LENGTH} characters')
+    return dict(changes)
+
+def changed_fields(document: Document, values: Mapping[str, Any]) -> Dict[str, Any]:
+    """The editable fields in values that differ from the document"""
+    return {field: values[field] for field in EDITABLE_FIELDS
+            if field in values and values[field] != (getattr(document, field) or '')}
+
+def field_digest(value: Optional[str]) -> str:
+    """Short fingerprint of a field as the edit form showed it.
+
+    The form posts one per field, so a post against an old version can be
+    merged without sending the old text back.
+    """
+    return hashlib.sha256((value or '').replace('\r\n', '\n').encode('utf-8')).hexdigest()[:16]
+
+def merge_stale_edits(current: Mapping[str, Any], submitted: Mapping[str, Any],
+                      base_digests: Mapping[str, Any]) -> Tuple[Dict[str, str], List[str]]:
+    """Merge a form posted against an old version the way the editor's autosave does.
+
+    current holds the document's fields now and base_digests the field_digest
+    of each field as the form was rendered. Fields only they changed take
+    their value, fields only the user changed keep the submitted one, and
+    fields both changed differently keep the submitted one and are returned
+    as conflicting.
+    """
+    values, conflicting = {}, []
+    for field in EDITABLE_FIELDS:
+        theirs = (current.get(field) or '').replace('\r\n', '\n')
+        if field not in submitted:
+            values[field] = theirs
+            continue
+        mine = (submitted.get(field) or '').replace('\r\n', '\n')
+        base = base_digests.get(field)
+        if mine == theirs or base == field_digest(theirs):
+            values[field] = mine
+        elif base == field_digest(mine):
+            values[field] = theirs
+        else:
+            values[field] = mine
+            conflicting.append(field)
+    return values, conflicting
+
+def _conflict(document_id: int) -> EditConflictError:
+    document = db.session.get(Document, document_id)
+    return EditConflictError(document.version, {field: getattr(document, field) or '' for field in EDITABLE_FIELDS})
+
+def save_edits(document_id: int, base_version: int, changes: Mapping[str, Any]) -> SavedEdit:
+    """Write only the changed fields, if the document is still at base_version.
+
+    The document row's UPDATE is conditional on the version and bumps it, so
+    two editors (or an editor and the audio pipeline) cannot overwrite each
+    other; the loser gets EditConflictError. Body fields are then written to
+    document_body in the same transaction. An empty change set writes nothing.
+    """
+    changes = validate_changes(changes)
+    if not changes:
+        return SavedEdit(base_version, None, ())
+
+    header = {field: value for field, value in changes.items() if field not in BODY_FIELDS}
+    body = {field: value for field, value in changes.items() if field in BODY_FIELDS}
+    now = datetime.utcnow()
+    statement = (update(Document)
+                 .where(Document.id == document_id, Document.version == base_version)
+                 .values(**header, version=Document.version + 1, updated_at=now)
+                 .returning(Document.version)
+                 .execution_options(synchronize_session=False))
+    version = db.session.execute(statement).scalar()
+    if version is None:
+        db.session.rollback()
+        raise _conflict(document_id)
+    if body:
+        updated = db.session.execute(update(DocumentBody).where(DocumentBody.document_id == document_id)
+                                     .values(**body).execution_options(synchronize_session=False))
+        if not updated.rowcount:
+            db.session.execute(insert(DocumentBody).values(document_id=document_id, **body))
+    db.session.commit()
+    return SavedEdit(version, now, tuple(changes))
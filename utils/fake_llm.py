@@ -0,0 +1,61 @@
+import json
+import time
+import os
+from types import SimpleNamespace
+
+FAKE_LLM_LATENCY = float(os.environ.get('FAKE_LLM_LATENCY', 1.0))  # seconds per call
+
+MEAT_RESPONSE = """Monitoring:
+Patient reports improved sleep and reduced cravings.
+
+Assessment:
+Opioid use disorder, moderate, in early remission.
+
+Evaluation:
+COWS score 4, urine drug screen negative.
+
+Treatment:
+Continue buprenorphine 8mg daily, weekly counseling."""
+
+CONDITIONS_RESPONSE = json.dumps([
+    {
+        "code": "F11.20",
+        "code_system": "ICD-10",
+        "description": "Opioid dependence, uncomplicated",
+        "body_site": "",
+        "severity": "moderate"
+    }
+])
+
+PRAPARE_RESPONSE = json.dumps({"1": "No", "4": "No", "5": "English", "6": "3"})
+
+def _message(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+class _FakeCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create(self, model=None, messages=None, timeout=None, **kwargs):
+        time.sleep(self.latency)
+        system_prompt = messages[0]['content'] if messages else ''
+        if 'MEAT' in system_prompt:
+            return _message(MEAT_RESPONSE)
+        if 'PRAPARE' in system_prompt:
+            return _message(PRAPARE_RESPONSE)
+        return _message(CONDITIONS_RESPONSE)
+
+class _FakeTranscriptions:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create(self, model=None, file=None, response_format=None, timeout=None, **kwargs):
+        time.sleep(self.latency)
+        return "Patient reports improved sleep and reduced cravings on buprenorphine."
+
+class FakeLLMClient:
+    """Offline stand-in for openai.OpenAI with a fixed per-call latency"""
+
+    def __init__(self, latency=FAKE_LLM_LATENCY):
+        self.chat = SimpleNamespace(completions=_FakeCompletions(latency))
+        self.audio = SimpleNamespace(transcriptions=_FakeTranscriptions(latency))
@@ -0,0 +1,261 @@
+import os
+import re
+import logging
+from typing import List, Optional
+from sqlalchemy import Double, cast, func, literal_column, select, table, text, false
+from models import db, Document
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Set FULLTEXT_SEARCH=0 to fall back to substring (ILIKE) matching
+FULLTEXT_SEARCH_ENABLED = os.environ.get('FULLTEXT_SEARCH', '1') != '0'
+FULLTEXT_CONFIG = 'english'
+FTS_TABLE = 'document_fts'
+
+# Indexed document fields and their Postgres weights / SQLite bm25 weights
+FIELD_WEIGHTS = {'title': 'A', 'content': 'B', 'transcription': 'C'}
+BM25_WEIGHTS = (4.0, 2.0, 1.0)
+
+# title is on document and content/transcription on document_body, so the
+# index is kept up to date by triggers on both tables rather than generated
+# from one row
+POSTGRES_DDL = [
+    "ALTER TABLE document ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""CREATE OR REPLACE FUNCTION document_search_vector(title text, content text, transcription text)
+        RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+            SELECT setweight(to_tsvector('{FULLTEXT_CONFIG}', coalesce(title, '')), 'A') ||
+                   setweight(to_tsvector('{FULLTEXT_CONFIG}', coalesce(content, '')), 'B') ||
+                   setweight(to_tsvector('{FULLTEXT_CONFIG}', coalesce(transcription, '')), 'C')
+        $$""",
+    """CREATE OR REPLACE FUNCTION document_search_vector_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_vector := document_search_vector(NEW.title,
+                (SELECT content FROM document_body WHERE document_id = NEW.id),
+                (SELECT transcription FROM document_body WHERE document_id = NEW.id));
+            RETURN NEW;
+        END $$""",
+    """CREATE OR REPLACE FUNCTION document_body_search_vector_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            body document_body%ROWTYPE;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                body := OLD;
+                body.content := NULL;
+                body.transcription := NULL;
+            ELSE
+                body := NEW;
+            END IF;
+            UPDATE document SET search_vector = document_search_vector(title, body.content, body.transcription)
+            WHERE id = body.document_id;
+            RETURN NULL;
+        END $$""",
+    "DROP TRIGGER IF EXISTS document_search_vector_update ON document",
+    """CREATE TRIGGER document_search_vector_update BEFORE INSERT OR UPDATE OF title ON document
+        FOR EACH ROW EXECUTE FUNCTION document_search_vector_trigger()""",
+    "DROP TRIGGER IF EXISTS document_body_search_vector_update ON document_body",
+    """CREATE TRIGGER document_body_search_vector_update
+        AFTER INSERT OR UPDATE OF content, transcription OR DELETE ON document_body
+        FOR EACH ROW EXECUTE FUNCTION document_body_search_vector_trigger()""",
+    """UPDATE document SET search_vector = document_search_vector(title,
+        (SELECT content FROM document_body WHERE document_id = document.id),
+        (SELECT transcription FROM document_body WHERE document_id = document.id))
+        WHERE search_vector IS NULL""",
+    "CREATE INDEX IF NOT EXISTS idx_document_search_vector ON document USING gin (search_vector)",
+]
+
+# document_fts indexes the document_text view. Every trigger keeps its row
+# equal to the document's current title, content and transcription, which is
+# what an external-content 'delete' has to be given.
+SQLITE_DDL = [
+    """CREATE VIEW IF NOT EXISTS document_text AS
+        SELECT document.id AS id, document.title AS title,
+               document_body.content AS content, document_body.transcription AS transcription
+        FROM document LEFT JOIN document_body ON document_body.document_id = document.id""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content, transcription,
+        content='document_text', content_rowid='id', tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS document_fts_insert AFTER INSERT ON document BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content, transcription)
+        SELECT id, title, content, transcription FROM document_text WHERE id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS document_fts_delete AFTER DELETE ON document BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content, transcription)
+        VALUES ('delete', old.id, old.title,
+                (SELECT content FROM document_body WHERE document_id = old.id),
+                (SELECT transcription FROM document_body WHERE document_id = old.id));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS document_fts_update AFTER UPDATE OF title ON document BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content, transcription)
+        SELECT 'delete', old.id, old.title, content, transcription FROM document_text WHERE id = new.id;
+        INSERT INTO {FTS_TABLE}(rowid, title, content, transcription)
+        SELECT id, title, content, transcription FROM document_text WHERE id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS document_body_fts_insert AFTER INSERT ON document_body BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content, transcription)
+        SELECT 'delete', id, title, NULL, NULL FROM document WHERE id = new.document_id;
+        INSERT INTO {FTS_TABLE}(rowid, title, content, transcription)
+        SELECT id, title, new.content, new.transcription FROM document WHERE id = new.document_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS document_body_fts_update AFTER UPDATE OF content, transcription ON document_body BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content, transcription)
+        SELECT 'delete', id, title, old.content, old.transcription FROM document WHERE id = old.document_id;
+        INSERT INTO {FTS_TABLE}(rowid, title, content, transcription)
+        SELECT id, title, new.content, new.transcription FROM document WHERE id = new.document_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS document_body_fts_delete AFTER DELETE ON document_body BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content, transcription)
+        SELECT 'delete', id, title, old.content, old.transcription FROM document WHERE id = old.document_id;
+        INSERT INTO {FTS_TABLE}(rowid, title, content, transcription)
+        SELECT id, title, NULL, NULL FROM document WHERE id = old.document_id;
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+# drop_all() drops the tables but leaves these behind, and a document_fts
+# without its triggers would keep answering searches from stale rows
+POSTGRES_DROP_DDL = [
+    "DROP FUNCTION IF EXISTS document_body_search_vector_trigger() CASCADE",
+    "DROP FUNCTION IF EXISTS document_search_vector_trigger() CASCADE",
+    "DROP FUNCTION IF EXISTS document_search_vector(text, text, text)",
+    "DROP INDEX IF EXISTS idx_document_search_vector",
+    "ALTER TABLE IF EXISTS document DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_DROP_DDL = [
+    "DROP TRIGGER IF EXISTS document_body_fts_delete",
+    "DROP TRIGGER IF EXISTS document_body_fts_update",
+    "DROP TRIGGER IF EXISTS document_body_fts_insert",
+    "DROP TRIGGER IF EXISTS document_fts_update",
+    "DROP TRIGGER IF EXISTS document_fts_delete",
+    "DROP TRIGGER IF EXISTS document_fts_insert",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+    "DROP VIEW IF EXISTS document_text",
+]
+
+_fts = table(FTS_TABLE)
+_backends = {}
+
+def _execute_ddl(engine, statements) -> None:
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+    _backends.pop(str(engine.url), None)
+
+def ensure_fulltext_index(engine=None) -> None:
+    """Create the full-text index for databases built with db.create_all().
+
+    Migrated databases get the same objects from the add_document_fulltext
+    migration; running this again is harmless.
+    """
+    engine = engine or db.engine
+    _execute_ddl(engine, POSTGRES_DDL if engine.dialect.name == 'postgresql' else SQLITE_DDL)
+
+def drop_fulltext_index(engine=None) -> None:
+    """Drop the full-text index; call before db.drop_all()"""
+    engine = engine or db.engine
+    _execute_ddl(engine, POSTGRES_DROP_DDL if engine.dialect.name == 'postgresql' else SQLITE_DROP_DDL)
+
+def fulltext_backend() -> Optional[str]:
+    """'postgresql' or 'sqlite' when the index exists, otherwise None"""
+    if not FULLTEXT_SEARCH_ENABLED:
+        return None
+    engine = db.engine
+    key = str(engine.url)
+    if key not in _backends:
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                found = conn.execute(text(
+                    "SELECT 1 FROM information_schema.columns "
+                    "WHERE table_name = 'document' AND column_name = 'search_vector'"
+                )).first()
+            elif engine.dialect.name == 'sqlite':
+                found = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+                ), {'name': FTS_TABLE}).first()
+            else:
+                found = None
+        _backends[key] = engine.dialect.name if found else None
+        if not found:
+            logger.warning("Full-text index not found; document search falls back to ILIKE")
+    return _backends[key]
+
+def _words(value: str) -> List[str]:
+    return re.findall(r'\w+', value.lower())
+
+def _tsquery(value: str, field: Optional[str]) -> Optional[str]:
+    """Words become a phrase; a trailing * makes the last one a prefix"""
+    words = _words(value)
+    if not words:
+        return None
+    weight = FIELD_WEIGHTS[field] if field else ''
+    lexemes = [f'{word}:{weight}' if weight else word for word in words]
+    if value.rstrip().endswith('*'):
+        lexemes[-1] = f'{words[-1]}:*{weight}'
+    return ' <-> '.join(lexemes)
+
+def _fts5_query(value: str, field: Optional[str]) -> Optional[str]:
+    words = _words(value)
+    if not words:
+        return None
+    phrase = '"' + ' '.join(words) + '"'
+    if value.rstrip().endswith('*'):
+        phrase += ' *'
+    return f"{field} : {phrase}" if field else phrase
+
+def _pg_tsquery(query: str):
+    return func.to_tsquery(literal_column(f"'{FULLTEXT_CONFIG}'::regconfig"), query)
+
+def fulltext_match(value: str, field: Optional[str] = None):
+    """Filter clause matching documents whose field (or any indexed field) has the words.
+
+    Returns None when no full-text index is available, so callers can fall
+    back to substring matching.
+    """
+    backend = fulltext_backend()
+    if backend == 'postgresql':
+        query = _tsquery(value, field)
+        if query is None:
+            return false()
+        return literal_column('document.search_vector').op('@@')(_pg_tsquery(query))
+    if backend == 'sqlite':
+        query = _fts5_query(value, field)
+        if query is None:
+            return false()
+        matches = select(literal_column('rowid')).select_from(_fts).where(
+            literal_column(FTS_TABLE).op('MATCH')(query))
+        return Document.id.in_(matches)
+    return None
+
+def relevance_order(query, terms: List[tuple]):
+    """(query, score) to order a Document query by relevance to the (value, field) terms.
+
+    score is a column, higher is better and 0 for documents no term matched,
+    so the database sorts and pages the matches itself. Returns None when no
+    full-text index is available or the terms have no words.
+    """
+    backend = fulltext_backend()
+    if backend == 'postgresql':
+        parts = [f'({part})' for part in (_tsquery(v, f) for v, f in terms) if part]
+        if not parts:
+            return None
+        vector = literal_column('document.search_vector')
+        # ts_rank_cd is a real; as a double the score survives a JSON cursor unchanged
+        return query, cast(func.ts_rank_cd(vector, _pg_tsquery(' | '.join(parts))), Double)
+    if backend == 'sqlite':
+        parts = [f'({part})' for part in (_fts5_query(v, f) for v, f in terms) if part]
+        if not parts:
+            return None
+        # bm25 only exists inside a MATCH query, so the matches are scored once
+        # in a materialized CTE: joined as a plain subquery, SQLite reran it for
+        # every document row. bm25 is negative with lower meaning better.
+        scores = (select(literal_column('rowid').label('document_id'),
+                         (-func.bm25(literal_column(FTS_TABLE), *BM25_WEIGHTS)).label('score'))
+                  .select_from(_fts)
+                  .where(literal_column(FTS_TABLE).op('MATCH')(' OR '.join(parts)))
+                  .cte('document_scores')
+                  .prefix_with('MATERIALIZED'))
+        return (query.outerjoin(scores, scores.c.document_id == Document.id),
+                func.coalesce(scores.c.score, 0.0))
+    return None
@@ -0,0 +1,194 @@
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Compiled queries kept per process; dashboards re-run the same few searches
+HTQL_CACHE_SIZE = int(os.environ.get('HTQL_CACHE_SIZE', '512'))
+
+# Searchable fields per entity. "patient:John" means patient.name:John.
+FIELDS = {
+    'patient': ('name', 'id', 'gender', 'city', 'state'),
+    'document': ('title', 'content', 'transcription', 'text'),
+    'condition': ('code', 'status', 'severity'),
+}
+DEFAULT_FIELD = 'name'
+
+# A bare term searches every field except the document body fields, which it
+# reaches through document.text (title, content and transcription at once)
+BARE_TERM_FIELDS = tuple(
+    (entity, field) for entity, fields in FIELDS.items() for field in fields
+    if (entity, field) not in {('document', 'content'), ('document', 'transcription')}
+)
+# Document fields matched with the full-text index: field -> indexed column (None = all)
+TEXT_FIELDS = {'content': 'content', 'transcription': 'transcription', 'text': None}
+
+# AST nodes. entity and field are None for a bare term; op is 'AND' or 'OR'.
+Term = namedtuple('Term', ['entity', 'field', 'value'])
+Not = namedtuple('Not', ['operand'])
+BoolOp = namedtuple('BoolOp', ['op', 'operands'])
+
+# A parsed query plus what the planner needs to know about it
+CompiledQuery = namedtuple('CompiledQuery', ['ast', 'entities', 'text_terms'])
+
+OPERATORS = ('AND', 'OR', 'NOT')
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|((?:[^\s()"]+|"[^"]*"?)+))')
+FIELD_PATTERN = re.compile(r'([A-Za-z_]+(?:\.[A-Za-z_]+)?):(.*)', re.S)
+
+class HTQLSyntaxError(ValueError):
+    """Raised for queries that cannot be parsed, e.g. unbalanced parentheses"""
+
+def tokenize(query: str) -> List[Tuple[str, str]]:
+    """Split a query into ('(' | ')' | 'op' | 'term', text) tokens"""
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = TOKEN_PATTERN.match(query, position)
+        if not match:
+            raise HTQLSyntaxError(f'Unexpected character at {position + 1}')
+        lparen, rparen, term = match.groups()
+        if lparen:
+            tokens.append(('(', lparen))
+        elif rparen:
+            tokens.append((')', rparen))
+        elif term in OPERATORS:
+            tokens.append(('op', term))
+        else:
+            tokens.append(('term', term))
+        position = match.end()
+    return tokens
+
+def _term(text: str) -> Optional[Term]:
+    match = FIELD_PATTERN.fullmatch(text)
+    if not match:
+        return Term(None, None, text.replace('"', ''))
+    entity, _, field = match.group(1).lower().partition('.')
+    value = match.group(2).replace('"', '')
+    if not value.strip():
+        raise HTQLSyntaxError(f'Missing value for {match.group(1)}')
+    field = field or DEFAULT_FIELD
+    if field not in FIELDS.get(entity, ()):
+        # Unknown fields have always been ignored rather than rejected
+        return None
+    return Term(entity, field, value)
+
+def _combine(op: str, operands: list):
+    flat = []
+    for operand in operands:
+        if isinstance(operand, BoolOp) and operand.op == op:
+            flat.extend(operand.operands)
+        elif operand is not None:
+            flat.append(operand)
+    if not flat:
+        return None
+    return flat[0] if len(flat) == 1 else BoolOp(op, tuple(flat))
+
+class _Parser:
+    """Recursive descent over the grammar
+
+        query   := or
+        or      := and ("OR" and)*
+        and     := not (["AND"] not)*      adjacent terms are ANDed
+        not     := "NOT" not | primary
+        primary := "(" or ")" | term
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise HTQLSyntaxError('Query ends after an operator')
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            return None
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise HTQLSyntaxError(f'Unexpected "{self.peek()[1]}"')
+        return node
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.peek() == ('op', 'OR'):
+            self.position += 1
+            operands.append(self.parse_and())
+        return _combine('OR', operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while True:
+            token = self.peek()
+            if token == ('op', 'AND'):
+                self.position += 1
+            elif token is None or token[0] == ')' or token == ('op', 'OR'):
+                break
+            operands.append(self.parse_not())
+        return _combine('AND', operands)
+
+    def parse_not(self):
+        if self.peek() == ('op', 'NOT'):
+            self.position += 1
+            operand = self.parse_not()
+            return Not(operand) if operand is not None else None
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, text = self.take()
+        if kind == '(':
+            node = self.parse_or()
+            if self.peek() is None or self.take()[0] != ')':
+                raise HTQLSyntaxError('Missing closing parenthesis')
+            return node
+        if kind == 'term':
+            return _term(text)
+        raise HTQLSyntaxError(f'Unexpected "{text}"')
+
+def referenced_entities(node) -> frozenset:
+    """Entities whose fields a node filters on (a bare term touches them all)"""
+    if isinstance(node, Term):
+        return frozenset([node.entity]) if node.entity else frozenset(FIELDS)
+    if isinstance(node, Not):
+        return referenced_entities(node.operand)
+    return frozenset().union(*(referenced_entities(operand) for operand in node.operands))
+
+def _text_terms(node, negated=False) -> List[tuple]:
+    """(value, column) of the full-text terms a matching document should rank by"""
+    if isinstance(node, Term):
+        if negated:
+            return []
+        if node.entity is None:
+            return [(node.value, None)]
+        if node.entity == 'document' and node.field in TEXT_FIELDS:
+            return [(node.value, TEXT_FIELDS[node.field])]
+        return []
+    if isinstance(node, Not):
+        return _text_terms(node.operand, not negated)
+    return [term for operand in node.operands for term in _text_terms(operand, negated)]
+
+def normalize(query: str) -> str:
+    return ' '.join(query.split())
+
+@lru_cache(maxsize=HTQL_CACHE_SIZE)
+def _compile(query: str) -> Optional[CompiledQuery]:
+    ast = _Parser(tokenize(query)).parse()
+    if ast is None:
+        return None
+    return CompiledQuery(ast, referenced_entities(ast), tuple(_text_terms(ast)))
+
+def compile_query(query: str) -> Optional[CompiledQuery]:
+    """Parse an HTQL query, reusing the result for repeats of the same text.
+
+    Returns None for a query with no usable terms. AND binds tighter than
+    OR, parentheses group, and NOT applies to the term or group after it.
+    """
+    return _compile(normalize(query))
@@ -0,0 +1,154 @@
+import io
+import re
+import time
+import logging
+import zipfile
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator
+from sqlalchemy import text
+from models import db
+from utils.code_index import invalidate_code_index
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 10000
+STAGING_TABLE = 'icd10_staging'
+
+CodeRow = namedtuple('CodeRow', ['code', 'description', 'category'])
+ImportStats = namedtuple('ImportStats', ['rows', 'inserted', 'updated', 'deleted', 'load_seconds', 'seconds'])
+
+# CMS order file: order number, code, billable flag, short and long description
+ORDER_LINE = re.compile(r'^(\d{5}) (\S{3,7})\s+([01]) (.{60}) (.*)$')
+# CMS codes file: code and long description
+CODES_LINE = re.compile(r'^([A-Z]\w{2,6})\s+(.+)$')
+
+class ICD10ImportError(ValueError):
+    """Raised for a line that is not in a CMS ICD-10-CM file format"""
+
+def format_code(code: str) -> str:
+    """CMS files leave out the dot: E1121 -> E11.21"""
+    return f'{code[:3]}.{code[3:]}' if len(code) > 3 else code
+
+@contextmanager
+def open_icd10_file(path: str):
+    """Lines of a CMS release file: the order or codes .txt, or the release .zip"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = [name for name in archive.namelist() if name.lower().endswith('.txt')]
+            # Prefer the order file, which also lists the non-billable headers (F41, E11.2...)
+            name = next((name for name in names if 'order' in name.lower()),
+                        next((name for name in names if 'codes' in name.lower()), None))
+            if name is None:
+                raise ICD10ImportError(f'No ICD-10-CM order or codes file in {path}')
+            with archive.open(name) as raw:
+                yield io.TextIOWrapper(raw, encoding='utf-8', errors='replace')
+    else:
+        with open(path, encoding='utf-8', errors='replace') as lines:
+            yield lines
+
+def parse_icd10_lines(lines: Iterable[str]) -> Iterator[CodeRow]:
+    """Code rows from CMS order or codes file lines, one at a time"""
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+        match = ORDER_LINE.match(line)
+        if match:
+            code, description = match.group(2), match.group(5).strip() or match.group(4).strip()
+        else:
+            match = CODES_LINE.match(line)
+            if not match:
+                raise ICD10ImportError(f'Line {number} is not an ICD-10-CM order or codes line: {line[:40]!r}')
+            code, description = match.group(1), match.group(2).strip()
+        yield CodeRow(format_code(code), description, code[:3])
+
+def _batches(rows: Iterable, size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def _copy_text(batch) -> io.StringIO:
+    # COPY text format: tab separated, backslash escapes
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return io.StringIO(''.join(f"{escape(row.code)}\t{escape(row.description)}\t{escape(row.category)}\n"
+                               for row in batch))
+
+def _stage(conn, rows: Iterable[CodeRow], batch_size: int) -> int:
+    """Bulk load rows into the staging table: COPY on PostgreSQL, executemany elsewhere"""
+    staged = 0
+    if conn.dialect.name == 'postgresql':
+        cursor = conn.connection.cursor()
+        try:
+            for batch in _batches(rows, batch_size):
+                cursor.copy_expert(f"COPY {STAGING_TABLE} (code, description, category) FROM STDIN",
+                                   _copy_text(batch))
+                staged += len(batch)
+        finally:
+            cursor.close()
+    else:
+        for batch in _batches(rows, batch_size):
+            conn.exec_driver_sql(f"INSERT INTO {STAGING_TABLE} (code, description, category) VALUES (?, ?, ?)",
+                                 [tuple(row) for row in batch])
+            staged += len(batch)
+    return staged
+
+def import_icd10_codes(rows: Iterable[CodeRow], replace: bool = False, prune: bool = False,
+                       batch_size: int = IMPORT_BATCH_SIZE, engine=None) -> ImportStats:
+    """Load ICD-10 codes in one transaction without going through the ORM.
+
+    Rows are bulk loaded into a temporary staging table and applied with
+    set-based statements. By default only new and changed codes are written
+    and codes missing from rows are kept (prune=True deletes them);
+    replace=True empties icd10_code first.
+    """
+    engine = engine or db.engine
+    distinct = 'IS DISTINCT FROM' if engine.dialect.name == 'postgresql' else 'IS NOT'
+    now = {'now': datetime.utcnow()}
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TEMPORARY TABLE {STAGING_TABLE} ("
+                          f"code VARCHAR(10) PRIMARY KEY, description TEXT NOT NULL, category VARCHAR(100))"))
+        staged = _stage(conn, rows, batch_size)
+        loaded = time.perf_counter()
+        deleted = updated = 0
+        if replace:
+            deleted = conn.execute(text("DELETE FROM icd10_code")).rowcount
+        else:
+            updated = conn.execute(text(f"""
+                UPDATE icd10_code SET description = s.description, category = s.category, updated_at = :now
+                FROM {STAGING_TABLE} s
+                WHERE icd10_code.code = s.code
+                  AND (icd10_code.description {distinct} s.description
+                       OR icd10_code.category {distinct} s.category)"""), now).rowcount
+            if prune:
+                deleted = conn.execute(text(f"""
+                    DELETE FROM icd10_code
+                    WHERE NOT EXISTS (SELECT 1 FROM {STAGING_TABLE} s WHERE s.code = icd10_code.code)""")).rowcount
+        inserted = conn.execute(text(f"""
+            INSERT INTO icd10_code (code, description, category, created_at, updated_at)
+            SELECT s.code, s.description, s.category, :now, :now FROM {STAGING_TABLE} s
+            WHERE NOT EXISTS (SELECT 1 FROM icd10_code c WHERE c.code = s.code)"""), now).rowcount
+        # A failed import rolls back the staging table with everything else
+        conn.execute(text(f"DROP TABLE {STAGING_TABLE}"))
+    # Bulk statements bypass the ORM events that keep code suggestions current
+    invalidate_code_index(engine)
+    stats = ImportStats(staged, inserted, updated, deleted, loaded - start, time.perf_counter() - start)
+    logger.info(f"Imported {stats.rows} ICD-10 codes in {stats.seconds:.2f}s: {stats.inserted} new, "
+                f"{stats.updated} changed, {stats.deleted} deleted")
+    return stats
+
+def import_icd10_file(path: str, replace: bool = False, prune: bool = False,
+                      batch_size: int = IMPORT_BATCH_SIZE, engine=None) -> ImportStats:
+    """Stream a CMS ICD-10-CM release file (order/codes .txt or .zip) into icd10_code"""
+    with open_icd10_file(path) as lines:
+        return import_icd10_codes(parse_icd10_lines(lines), replace=replace, prune=prune,
+                                  batch_size=batch_size, engine=engine)
@@ -0,0 +1,328 @@
+import os
+import socket
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from flask import current_app
+from models import db, ProcessingJob, Document, Condition
+from utils.ai_analysis import analyze_meat_criteria, extract_conditions
+from utils.llm import run_concurrently
+from utils.transcription import stream_transcription, audio_duration
+from utils.uploads import upload_complete
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AUDIO_PIPELINE = 'audio_pipeline'
+
+# Pipeline stages in execution order. Required stages fail the whole job once
+# their retries are exhausted; optional stages are recorded and skipped.
+PIPELINE_STAGES = [
+    ('transcribe', True),
+    ('analysis', False),
+]
+STAGE_DONE = 'done'
+
+RETRY_BASE_DELAY = 5  # seconds, doubled on every retry of a stage
+RETRY_MAX_DELAY = 300
+LOCK_TIMEOUT = timedelta(minutes=30)
+# Every worker sweeps for stale jobs this often, so a dead worker's jobs
+# are picked up while the others keep running
+REQUEUE_INTERVAL = LOCK_TIMEOUT / 2
+
+class StageError(Exception):
+    """Raised by a pipeline stage when it should be retried"""
+
+def enqueue_audio_job(document: Document, audio_path: str, user_id: int,
+                      force_reanalysis: bool = False,
+                      upload_id: Optional[int] = None) -> ProcessingJob:
+    """Queue the transcription -> MEAT -> condition pipeline for a saved recording.
+
+    force_reanalysis bypasses the analysis cache so the LLM is asked again.
+    With upload_id the recording may still be uploading; transcription
+    follows the file until the upload is complete.
+    """
+    job = ProcessingJob(
+        job_type=AUDIO_PIPELINE,
+        document_id=document.id,
+        user_id=user_id,
+        status='queued',
+        stage=PIPELINE_STAGES[0][0],
+        payload={'audio_path': audio_path, 'force_reanalysis': force_reanalysis,
+                 'upload_id': upload_id},
+        result={},
+        run_after=datetime.utcnow()
+    )
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"Queued {AUDIO_PIPELINE} job {job.id} for document {document.id}")
+    return job
+
+def job_status(job: ProcessingJob) -> Dict[str, Any]:
+    """Serialize a job for the polling endpoint"""
+    return {
+        'job_id': job.id,
+        'document_id': job.document_id,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': job.progress,
+        'attempts': job.attempts,
+        'error': job.error,
+        'result': job.result or {},
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None
+    }
+
+def worker_identity() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def requeue_stale_jobs() -> int:
+    """Return jobs whose worker died mid-stage to the queue"""
+    cutoff = datetime.utcnow() - LOCK_TIMEOUT
+    count = ProcessingJob.query.filter(
+        ProcessingJob.status == 'running',
+        ProcessingJob.locked_at < cutoff
+    ).update({
+        'status': 'queued',
+        'locked_by': None,
+        'locked_at': None,
+        'run_after': datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    if count:
+        logger.warning(f"Requeued {count} stale job(s)")
+    return count
+
+def claim_next_job(worker_id: str) -> Optional[ProcessingJob]:
+    """Atomically claim the oldest runnable job.
+
+    The conditional UPDATE only succeeds for one worker, so several workers can
+    poll the same table (PostgreSQL or SQLite) without double-processing.
+    """
+    now = datetime.utcnow()
+    candidates = ProcessingJob.query.with_entities(ProcessingJob.id).filter(
+        ProcessingJob.status == 'queued',
+        ProcessingJob.run_after <= now
+    ).order_by(ProcessingJob.id).limit(5).all()
+
+    for (job_id,) in candidates:
+        claimed = ProcessingJob.query.filter_by(id=job_id, status='queued').update({
+            'status': 'running',
+            'locked_by': worker_id,
+            'locked_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(ProcessingJob, job_id)
+    return None
+
+def _transcribe(job: ProcessingJob, document: Document) -> Dict[str, Any]:
+    """Transcribe window by window, publishing the partial transcript as it grows"""
+    audio_path = job.payload['audio_path']
+    upload_id = job.payload.get('upload_id')
+    is_finished = None
+    if upload_id and not upload_complete(upload_id):
+        app = current_app._get_current_object()
+
+        # Polled from the decoder's feeder thread
+        def is_finished():
+            with app.app_context():
+                return upload_complete(upload_id)
+
+    duration = None if is_finished else audio_duration(audio_path)
+    stage_share = _stage_progress(_next_stage(job.stage)) - _stage_progress(job.stage)
+    transcript = ''
+    for update in stream_transcription(audio_path, is_finished=is_finished):
+        transcript = update['transcript']
+        job.result = {**(job.result or {}), 'partial_transcript': transcript}
+        # Following a live upload can outlast LOCK_TIMEOUT, so keep the lock fresh
+        job.locked_at = datetime.utcnow()
+        if duration:
+            job.progress = _stage_progress(job.stage) + int(stage_share * min(update['end'] / duration, 1.0))
+        db.session.commit()
+    document.transcription = transcript
+    return {'transcription': transcript, 'partial_transcript': None}
+
+def _apply_meat_analysis(document: Document, meat_analysis: Dict[str, str]) -> None:
+    document.meat_monitoring = meat_analysis.get('monitoring', '')
+    document.meat_assessment = meat_analysis.get('assessment', '')
+    document.meat_evaluation = meat_analysis.get('evaluation', '')
+    document.meat_treatment = meat_analysis.get('treatment', '')
+    # An open editor's next autosave then sees the new values instead of overwriting them
+    document.version = Document.version + 1
+
+def _create_conditions(document: Document, conditions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    conditions_created = []
+    for condition_data in conditions:
+        condition = Condition(
+            identifier=Condition.generate_identifier(),
+            clinical_status='active',
+            category='encounter-diagnosis',
+            code=condition_data.get('code'),
+            code_system=condition_data.get('code_system'),
+            body_site=condition_data.get('body_site'),
+            severity=condition_data.get('severity'),
+            patient_id=document.patient_id,
+            onset_date=datetime.utcnow().date(),
+            notes=condition_data.get('description')
+        )
+        db.session.add(condition)
+        # Flush so the next generated identifier sees this row
+        db.session.flush()
+        conditions_created.append({
+            'code': condition.code,
+            'description': condition.notes,
+            'severity': condition.severity
+        })
+    return conditions_created
+
+def _analysis(job: ProcessingJob, document: Document) -> Dict[str, Any]:
+    """Run MEAT analysis and condition extraction concurrently.
+
+    Analyses that already succeeded on an earlier attempt are not repeated;
+    successful results are committed before failed ones are retried.
+    """
+    done = job.result or {}
+    text = document.transcription
+    force = bool((job.payload or {}).get('force_reanalysis'))
+    tasks = {}
+    if 'meat_analysis' not in done:
+        tasks['meat_analysis'] = lambda: analyze_meat_criteria(text, force_refresh=force)
+    if 'conditions_created' not in done:
+        if document.patient_id:
+            tasks['conditions'] = lambda: extract_conditions(text, force_refresh=force)
+        else:
+            done = {**done, 'conditions_created': []}
+
+    results, errors = run_concurrently(tasks)
+
+    output = {}
+    if 'meat_analysis' in results:
+        _apply_meat_analysis(document, results['meat_analysis'])
+        output['meat_analysis'] = results['meat_analysis']
+    if 'conditions' in results:
+        output['conditions_created'] = _create_conditions(document, results['conditions'])
+
+    if errors:
+        job.result = {**done, **output}
+        db.session.commit()
+        raise StageError('; '.join(f'{name}: {error}' for name, error in errors.items()))
+    return {**done, **output}
+
+STAGE_HANDLERS = {
+    'transcribe': _transcribe,
+    'analysis': _analysis,
+}
+
+def _next_stage(stage: str) -> str:
+    names = [name for name, _ in PIPELINE_STAGES]
+    index = names.index(stage)
+    return names[index + 1] if index + 1 < len(names) else STAGE_DONE
+
+def _stage_progress(stage: str) -> int:
+    if stage == STAGE_DONE:
+        return 100
+    names = [name for name, _ in PIPELINE_STAGES]
+    return int(100 * names.index(stage) / len(names))
+
+def _advance(job: ProcessingJob, output: Dict[str, Any]) -> None:
+    # Reassign the JSON column so SQLAlchemy detects the change
+    job.result = {**(job.result or {}), **output}
+    job.stage = _next_stage(job.stage)
+    job.progress = _stage_progress(job.stage)
+    job.attempts = 0
+
+def _handle_stage_failure(job: ProcessingJob, error: Exception) -> bool:
+    """Schedule a retry or give up on the current stage.
+
+    Returns True when the pipeline should continue with the next stage.
+    """
+    required = dict(PIPELINE_STAGES)[job.stage]
+    logger.error(f"Job {job.id} stage {job.stage} attempt {job.attempts} failed: {str(error)}")
+    job.error = f'{job.stage}: {str(error)}'
+
+    if job.attempts < job.max_attempts:
+        delay = min(RETRY_BASE_DELAY * 2 ** (job.attempts - 1), RETRY_MAX_DELAY)
+        job.status = 'queued'
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        job.locked_by = None
+        job.locked_at = None
+        db.session.commit()
+        logger.info(f"Job {job.id} stage {job.stage} retrying in {delay}s")
+        return False
+
+    if required:
+        job.status = 'failed'
+        job.locked_by = None
+        job.locked_at = None
+        db.session.commit()
+        return False
+
+    errors = dict((job.result or {}).get('errors', {}))
+    errors[job.stage] = str(error)
+    _advance(job, {'errors': errors})
+    db.session.commit()
+    return True
+
+def run_job(job: ProcessingJob) -> ProcessingJob:
+    """Run the remaining stages of a claimed job, committing after each one"""
+    document = db.session.get(Document, job.document_id)
+    if document is None:
+        job.status = 'failed'
+        job.error = 'Document no longer exists'
+        db.session.commit()
+        return job
+
+    while job.stage != STAGE_DONE:
+        job.attempts += 1
+        job.locked_at = datetime.utcnow()
+        db.session.commit()
+
+        try:
+            output = STAGE_HANDLERS[job.stage](job, document)
+        except Exception as e:
+            db.session.rollback()
+            if not _handle_stage_failure(job, e):
+                return job
+            continue
+
+        _advance(job, output)
+        db.session.commit()
+        logger.info(f"Job {job.id} advanced to {job.stage}")
+
+    job.status = 'completed'
+    job.error = None
+    job.locked_by = None
+    job.locked_at = None
+    db.session.commit()
+    return job
+
+def run_worker(poll_interval: float = 2.0, once: bool = False) -> None:
+    """Poll the queue and process jobs. Must be called inside an app context."""
+    worker_id = worker_identity()
+    logger.info(f"Job worker {worker_id} started")
+    requeue_stale_jobs()
+    next_requeue = time.monotonic() + REQUEUE_INTERVAL.total_seconds()
+
+    while True:
+        if time.monotonic() >= next_requeue:
+            requeue_stale_jobs()
+            next_requeue = time.monotonic() + REQUEUE_INTERVAL.total_seconds()
+
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                return
+            db.session.remove()
+            time.sleep(poll_interval)
+            continue
+
+        logger.info(f"Worker {worker_id} processing job {job.id} ({job.stage})")
+        try:
+            run_job(job)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Unexpected error processing job {job.id}: {str(e)}")
+        finally:
+            db.session.remove()
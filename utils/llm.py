@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import openai
+from flask import current_app, has_app_context
+from utils.metrics import record_llm_call
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4"
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))  # seconds per call
+LLM_MAX_WORKERS = int(os.environ.get('LLM_MAX_WORKERS', 8))
+
+_client = None
+_client_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_client():
+    """Return the process-wide LLM client.
+
+    One client is shared by every request and worker thread so its HTTP
+    connection pool is reused. Set LLM_BACKEND=fake to use the offline stub.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if os.environ.get('LLM_BACKEND') == 'fake':
+                    from utils.fake_llm import FakeLLMClient
+                    _client = FakeLLMClient()
+                else:
+                    _client = openai.OpenAI(timeout=LLM_TIMEOUT, max_retries=2)
+    return _client
+
+def set_client(client) -> None:
+    """Replace the shared client (used by benchmarks and offline runs)"""
+    global _client
+    with _client_lock:
+        _client = client
+
+def chat_completion(messages: List[Dict[str, str]], model: str = DEFAULT_MODEL,
+                    timeout: Optional[float] = None, prompt: str = 'other', **kwargs) -> str:
+    """Run one chat completion on the shared client and return its text.
+
+    prompt names the caller in the LLM latency and token metrics.
+    """
+    start = time.perf_counter()
+    try:
+        response = get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=timeout or LLM_TIMEOUT,
+            **kwargs
+        )
+    except Exception:
+        record_llm_call(prompt, model, time.perf_counter() - start, 'error')
+        raise
+    record_llm_call(prompt, model, time.perf_counter() - start, 'ok', getattr(response, 'usage', None))
+    return response.choices[0].message.content
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix='llm')
+    return _executor
+
+def run_concurrently(tasks: Dict[str, Callable[[], Any]],
+                     timeout: Optional[float] = None) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Run independent analyses in parallel and collect whatever finishes.
+
+    Returns (results, errors) keyed by task name. A task that raises, returns
+    None or is still running when the timeout expires is reported in errors,
+    so callers can keep the analyses that did succeed.
+    """
+    timeout = timeout or LLM_TIMEOUT
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def call(func):
+        if app is None:
+            return func()
+        with app.app_context():
+            return func()
+
+    futures = {name: _get_executor().submit(call, func) for name, func in tasks.items()}
+    done, _ = wait(futures.values(), timeout=timeout)
+
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        if future not in done:
+            future.cancel()
+            errors[name] = f'Timed out after {timeout:.0f}s'
+            continue
+        try:
+            value = future.result()
+        except Exception as e:
+            errors[name] = str(e)
+            continue
+        if value is None:
+            errors[name] = 'No result returned'
+        else:
+            results[name] = value
+
+    for name, error in errors.items():
+        logger.error(f"Concurrent analysis '{name}' failed: {error}")
+    return results, errors
@@ -0,0 +1,104 @@
+import os
+import time
+import logging
+from typing import Any, Optional, Tuple
+from flask import g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A directory every process (web workers, worker.py, transcription pools)
+# writes its samples to, emptied before they start; /metrics sums them.
+# Unset, /metrics only shows the process that serves it.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', '')
+# /metrics requires "Authorization: Bearer <token>"; unset, it answers 404
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to handle a request, by route',
+    ['blueprint', 'endpoint', 'method', 'status'])
+LLM_LATENCY = Histogram(
+    'llm_request_duration_seconds', 'Time for one chat completion, by prompt',
+    ['prompt', 'model', 'outcome'], buckets=(0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120))
+LLM_TOKENS = Histogram(
+    'llm_request_tokens', 'Tokens in one chat completion, by prompt',
+    ['prompt', 'model', 'kind'], buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+TRANSCRIPTION_LATENCY = Histogram(
+    'transcription_duration_seconds', 'Time to transcribe one file or window',
+    ['backend'], buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600))
+TRANSCRIPTION_SPEED = Histogram(
+    'transcription_seconds_per_audio_second', 'Transcription time divided by audio length',
+    ['backend'], buckets=(0.02, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1, 1.5, 2, 4))
+TEXT_EXTRACTION_LATENCY = Histogram(
+    'document_text_extraction_duration_seconds', 'Time in extract_text_from_document, by file type',
+    ['file_type'], buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600))
+DB_POOL_CHECKOUTS = Counter('db_pool_checkouts_total', 'Connections checked out of the pool')
+DB_POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Connections checked out right now',
+                       multiprocess_mode='livesum')
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups, by cache and result', ['cache', 'result'])
+
+def _observe_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.labels(request.blueprint or '', endpoint, request.method,
+                               str(response.status_code)).observe(time.perf_counter() - started)
+    return response
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKOUTS.inc()
+    DB_POOL_IN_USE.inc()
+
+def _checkin(dbapi_connection, connection_record):
+    DB_POOL_IN_USE.dec()
+
+_listening = False
+
+def init_metrics(app) -> None:
+    """Time every request and count pool checkouts on every engine"""
+    global _listening
+    if not _listening:
+        event.listen(Pool, 'checkout', _checkout)
+        event.listen(Pool, 'checkin', _checkin)
+        _listening = True
+    app.before_request(_start_request)
+    app.after_request(_observe_request)
+
+def record_llm_call(prompt: str, model: str, seconds: float, outcome: str, usage: Any = None) -> None:
+    LLM_LATENCY.labels(prompt, model, outcome).observe(seconds)
+    for kind in ('prompt', 'completion'):
+        tokens = getattr(usage, f'{kind}_tokens', None)
+        if tokens is not None:
+            LLM_TOKENS.labels(prompt, model, kind).observe(tokens)
+
+def record_transcription(backend: str, seconds: float, audio_seconds: Optional[float]) -> None:
+    TRANSCRIPTION_LATENCY.labels(backend).observe(seconds)
+    if audio_seconds:
+        TRANSCRIPTION_SPEED.labels(backend).observe(seconds / audio_seconds)
+
+def record_text_extraction(file_type: str, seconds: float) -> None:
+    TEXT_EXTRACTION_LATENCY.labels(file_type or 'none').observe(seconds)
+
+def record_cache_lookup(cache: str, result: str) -> None:
+    CACHE_REQUESTS.labels(cache, result).inc()
+
+def render_metrics() -> Tuple[bytes, str]:
+    """The text exposition of every metric, summed across processes when possible"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid: int) -> None:
+    """Drop a dead worker's live gauges; call from gunicorn's child_exit hook"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
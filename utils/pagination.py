@@ -0,0 +1,151 @@
+import json
+import base64
+import logging
+from datetime import date, datetime
+from typing import Callable, List, Optional, Sequence
+from sqlalchemy import and_, func, text, tuple_, DateTime, Date
+from models import db
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Result counts are exact up to this many rows; larger ones are estimated
+COUNT_CAP = 1000
+
+class InvalidCursorError(ValueError):
+    """Raised for a page cursor that was not produced by encode_cursor"""
+
+def encode_cursor(values: Sequence) -> str:
+    """Opaque, URL-safe token for the sort key of the last row on a page"""
+    raw = json.dumps([value.isoformat() if isinstance(value, (date, datetime)) else value
+                      for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(token: Optional[str]) -> Optional[list]:
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidCursorError('Invalid page cursor')
+    if not isinstance(values, list):
+        raise InvalidCursorError('Invalid page cursor')
+    return values
+
+def _coerce(column, value):
+    """A cursor value as the column's type; raises InvalidCursorError for anything else"""
+    if value is not None and not isinstance(value, (str, int, float)):
+        raise InvalidCursorError('Invalid page cursor')
+    try:
+        if isinstance(column.type, DateTime):
+            return datetime.fromisoformat(value)
+        if isinstance(column.type, Date):
+            return date.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise InvalidCursorError('Invalid page cursor')
+    return value
+
+def keyset_filter(columns: Sequence, cursor: list, descending: bool = False):
+    """Rows after the cursor in (columns...) order, all ascending or all descending.
+
+    A row-value comparison, so an index on the same columns serves it. The
+    redundant bound on the first column lets planners that do not seek on
+    row values (SQLite next to another range on that column) start the
+    index scan at the cursor.
+    """
+    if len(cursor) != len(columns):
+        raise InvalidCursorError('Invalid page cursor')
+    coerced = [_coerce(column, value) for column, value in zip(columns, cursor)]
+    values = tuple_(*coerced)
+    keys = tuple_(*columns)
+    if descending:
+        return and_(columns[0] <= coerced[0], keys < values)
+    return and_(columns[0] >= coerced[0], keys > values)
+
+def estimate_count(query, cap: int = COUNT_CAP):
+    """(count, kind) for a query's rows without counting all of a huge result.
+
+    kind is 'exact' up to cap rows. Past that PostgreSQL reports the
+    planner's estimate ('estimate'); other databases report cap ('at_least').
+    """
+    limited = query.order_by(None).limit(cap + 1).subquery()
+    count = db.session.query(func.count()).select_from(limited).scalar()
+    if count <= cap:
+        return count, 'exact'
+    if db.engine.dialect.name == 'postgresql':
+        try:
+            statement = query.order_by(None).statement.compile(
+                dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+            plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {statement}')).scalar()
+            return max(int(plan[0]['Plan']['Plan Rows']), cap + 1), 'estimate'
+        except Exception as e:
+            logger.warning(f"Could not estimate result count: {str(e)}")
+    return cap, 'at_least'
+
+class Page:
+    """One keyset page of results.
+
+    Rows are fetched on first use, so a streamed template sends everything
+    above the results before the query runs. fetch(n) must return up to n
+    rows after the cursor in key order; one extra row is asked for to know
+    whether another page follows.
+    """
+
+    def __init__(self, fetch: Callable[[int], list], limit: int,
+                 key: Callable, count: Callable[[], tuple]):
+        self._fetch = fetch
+        self._key = key
+        self._count = count
+        self._items = None
+        self._next_cursor = None
+        self._total = None
+        self.limit = limit
+
+    @property
+    def items(self) -> List:
+        if self._items is None:
+            rows = list(self._fetch(self.limit + 1))
+            if len(rows) > self.limit:
+                rows = rows[:self.limit]
+                self._next_cursor = encode_cursor(self._key(rows[-1]))
+            self._items = rows
+        return self._items
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        """Cursor for the following page, None on the last one"""
+        self.items
+        return self._next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _counted(self) -> tuple:
+        if self._total is None:
+            self._total = self._count()
+        return self._total
+
+    @property
+    def total(self) -> int:
+        return self._counted()[0]
+
+    @property
+    def total_kind(self) -> str:
+        """'exact', 'estimate' or 'at_least'; see estimate_count"""
+        return self._counted()[1]
+
+    @property
+    def total_label(self) -> str:
+        total, kind = self._counted()
+        if kind == 'estimate':
+            return f'about {total:,}'
+        if kind == 'at_least':
+            return f'{total:,}+'
+        return f'{total:,}'
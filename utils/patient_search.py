@@ -0,0 +1,314 @@
+import os
+import re
+import time
+import heapq
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import and_, or_, event, func, literal, literal_column, select, text
+from models import db, Patient
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Minimum share of the typed trigrams a name must contain to be suggested
+PATIENT_NAME_SIMILARITY = float(os.environ.get('PATIENT_NAME_SIMILARITY', '0.5'))
+PATIENT_SUGGESTION_LIMIT = 10
+# Seconds before the in-process index is rebuilt to pick up other processes' writes
+PATIENT_INDEX_TTL = int(os.environ.get('PATIENT_INDEX_TTL', '300'))
+# Larger candidate sets are not selective; a plain scan is as good as an IN list
+MAX_CANDIDATE_IDS = 2000
+
+INDEXED_FIELDS = ('family_name', 'given_name', 'city', 'state')
+NAME_FIELDS = ('family_name', 'given_name')
+FIELD_COLUMNS = {'name': NAME_FIELDS, 'city': ('city',), 'state': ('state',)}
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    *(f"CREATE INDEX IF NOT EXISTS idx_patient_{field}_trgm ON patient "
+      f"USING gin ({field} gin_trgm_ops)" for field in INDEXED_FIELDS),
+    "CREATE INDEX IF NOT EXISTS idx_patient_full_name_trgm ON patient "
+    "USING gin ((given_name || ' ' || family_name) gin_trgm_ops)",
+]
+
+# Must match the idx_patient_full_name_trgm expression for the index to be used
+FULL_NAME = literal_column("(patient.given_name || ' ' || patient.family_name)")
+
+_backends = {}
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _word_trigrams(value: str, prefix: bool = False) -> Set[str]:
+    """pg_trgm style trigrams: lower-cased words padded with two leading spaces and one trailing.
+
+    With prefix=True the trailing-space trigram is dropped, as the last word
+    may still be being typed.
+    """
+    grams = set()
+    for word in re.findall(r'\w+', value.lower()):
+        padded = f'  {word} '
+        stop = len(padded) - 3 if prefix else len(padded) - 2
+        grams.update(padded[i:i + 3] for i in range(stop))
+    return grams
+
+class PatientNgramIndex:
+    """In-process trigram index over patient name, city and state values.
+
+    SQLite has no trigram index, so substring and similarity searches use this
+    instead of scanning the table. Postings point at distinct values rather
+    than patients, which keeps them short (a million patients share far fewer
+    names and cities).
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rows: Dict[int, Tuple] = {}  # id -> (active, family, given, city, state), lower-cased
+        self.value_ids = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        self.substrings = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        self.name_ids = defaultdict(set)  # family or given name -> ids
+        self.name_grams = defaultdict(set)  # word trigram -> names
+        self.built_at = time.monotonic()
+
+    def build(self, rows) -> 'PatientNgramIndex':
+        for patient_id, active, *values in rows:
+            self.add(patient_id, active, values)
+        return self
+
+    def add(self, patient_id: int, active: bool, values) -> None:
+        values = tuple((value or '').lower() for value in values)
+        with self.lock:
+            self.remove(patient_id)
+            self.rows[patient_id] = (active is not False, *values)
+            for field, value in zip(INDEXED_FIELDS, values):
+                ids = self.value_ids[field][value]
+                if not ids:
+                    for i in range(len(value) - 2):
+                        self.substrings[field][value[i:i + 3]].add(value)
+                ids.add(patient_id)
+            for value in values[:len(NAME_FIELDS)]:
+                ids = self.name_ids[value]
+                if not ids:
+                    for gram in _word_trigrams(value):
+                        self.name_grams[gram].add(value)
+                ids.add(patient_id)
+
+    def remove(self, patient_id: int) -> None:
+        # Emptied values stay in the gram postings; lookups skip them
+        with self.lock:
+            row = self.rows.pop(patient_id, None)
+            if row is None:
+                return
+            for field, value in zip(INDEXED_FIELDS, row[1:]):
+                self.value_ids[field][value].discard(patient_id)
+            for value in row[1:1 + len(NAME_FIELDS)]:
+                self.name_ids[value].discard(patient_id)
+
+    def contains(self, field: str, value: str, limit: Optional[int] = None) -> Optional[Set[int]]:
+        """Ids of patients whose field contains value, case-insensitively.
+
+        Returns None as soon as there are more than limit of them.
+        """
+        value = value.lower()
+        ids = set()
+        with self.lock:
+            grams = {value[i:i + 3] for i in range(len(value) - 2)}
+            if grams:
+                postings = sorted((self.substrings[field].get(gram, set()) for gram in grams), key=len)
+                candidates = set.intersection(*postings)
+            else:
+                candidates = self.value_ids[field].keys()
+            for candidate in candidates:
+                if value in candidate:
+                    ids.update(self.value_ids[field][candidate])
+                    if limit is not None and len(ids) > limit:
+                        return None
+        return ids
+
+    def _name_scores(self, grams: Set[str], threshold: float) -> Dict[str, float]:
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.name_grams.get(gram, ()))
+        return {name: count / len(grams) for name, count in counts.items()
+                if count / len(grams) >= threshold and self.name_ids[name]}
+
+    def similar(self, query: str, threshold: float, limit: int,
+                active_only: bool = True) -> List[Tuple[int, float]]:
+        """Best (id, score) pairs for a typed name, highest score first.
+
+        Every word of the query must match the patient's given or family name
+        with at least threshold of its trigrams; the score is the average.
+        """
+        words = [_word_trigrams(word, prefix=True) for word in re.findall(r'\w+', query)]
+        words = [grams for grams in words if grams]
+        if not words:
+            return []
+        with self.lock:
+            scored = [self._name_scores(grams, threshold) for grams in words]
+            if len(scored) == 1:
+                # Walk names best first and stop once the limit is filled
+                results = []
+                for name, score in sorted(scored[0].items(), key=lambda item: (-item[1], item[0])):
+                    ids = self.name_ids[name]
+                    if active_only:
+                        ids = (patient_id for patient_id in ids if self.rows[patient_id][0])
+                    results.extend((patient_id, score) for patient_id in
+                                   heapq.nsmallest(limit - len(results), ids))
+                    if len(results) >= limit:
+                        break
+                return results
+
+            # Patients matching every word, then score only those
+            candidates = None
+            for scores in sorted(scored, key=lambda scores: sum(len(self.name_ids[name]) for name in scores)):
+                ids = set().union(*(self.name_ids[name] for name in scores))
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+            results = []
+            for patient_id in candidates:
+                row = self.rows[patient_id]
+                if active_only and not row[0]:
+                    continue
+                names = row[1:1 + len(NAME_FIELDS)]
+                total = sum(max(scores.get(name, 0) for name in names) for scores in scored)
+                results.append((patient_id, total / len(scored)))
+            return heapq.nsmallest(limit, results, key=lambda item: (-item[1], item[0]))
+
+def _load_index(engine) -> PatientNgramIndex:
+    start = time.perf_counter()
+    columns = [Patient.__table__.c[field] for field in INDEXED_FIELDS]
+    with engine.connect() as conn:
+        rows = conn.execute(select(Patient.__table__.c.id, Patient.__table__.c.active, *columns))
+        index = PatientNgramIndex().build(rows)
+    logger.info(f"Built patient n-gram index for {len(index.rows)} patients "
+                f"in {time.perf_counter() - start:.2f}s")
+    return index
+
+def _refresh_index(engine, key) -> None:
+    try:
+        index = _load_index(engine)
+        with _indexes_lock:
+            _indexes[key] = index
+    except Exception as e:
+        logger.error(f"Error rebuilding patient n-gram index: {str(e)}")
+        with _indexes_lock:
+            # Try again after another TTL instead of on every search
+            if key in _indexes:
+                _indexes[key].built_at = time.monotonic()
+
+def patient_index() -> PatientNgramIndex:
+    """The n-gram index for the current database, built on first use.
+
+    Writes made through this process's ORM are applied immediately; a stale
+    index is rebuilt in the background while the old one keeps serving.
+    """
+    engine = db.engine
+    key = str(engine.url)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and time.monotonic() - index.built_at > PATIENT_INDEX_TTL:
+            index.built_at = float('inf')  # one rebuild at a time
+            threading.Thread(target=_refresh_index, args=(engine, key), daemon=True).start()
+    if index is None:
+        index = _load_index(engine)
+        with _indexes_lock:
+            index = _indexes.setdefault(key, index)
+    return index
+
+@event.listens_for(Patient, 'after_insert')
+@event.listens_for(Patient, 'after_update')
+def _index_patient(mapper, connection, target):
+    index = _indexes.get(str(connection.engine.url))
+    if index is not None:
+        index.add(target.id, target.active, [getattr(target, field) for field in INDEXED_FIELDS])
+
+@event.listens_for(Patient, 'after_delete')
+def _unindex_patient(mapper, connection, target):
+    index = _indexes.get(str(connection.engine.url))
+    if index is not None:
+        index.remove(target.id)
+
+def ensure_trigram_indexes(engine=None) -> None:
+    """Create the pg_trgm indexes for PostgreSQL databases built with db.create_all().
+
+    Migrated databases get them from the add_patient_trigram_indexes
+    migration. SQLite needs nothing; it uses the in-process index.
+    """
+    engine = engine or db.engine
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+    _backends.pop(str(engine.url), None)
+
+def trigram_backend() -> Optional[str]:
+    """'postgresql' when pg_trgm is installed, 'memory' on SQLite, otherwise None"""
+    engine = db.engine
+    key = str(engine.url)
+    if key not in _backends:
+        backend = None
+        if engine.dialect.name == 'postgresql':
+            with engine.connect() as conn:
+                if conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+                    backend = 'postgresql'
+        elif engine.dialect.name == 'sqlite':
+            backend = 'memory'
+        if backend is None:
+            logger.warning("pg_trgm is not installed; patient search falls back to scans")
+        _backends[key] = backend
+    return _backends[key]
+
+def patient_field_match(field: str, value: str):
+    """Case-insensitive substring filter on patient name ('name'), city or state.
+
+    PostgreSQL answers the ILIKE from the pg_trgm GIN indexes; on SQLite the
+    n-gram index narrows it to candidate ids first.
+    """
+    columns = [getattr(Patient, column) for column in FIELD_COLUMNS[field]]
+    condition = or_(*(column.ilike(f'%{value}%') for column in columns))
+    if trigram_backend() != 'memory':
+        return condition
+    index = patient_index()
+    ids = set()
+    for column in FIELD_COLUMNS[field]:
+        matches = index.contains(column, value, MAX_CANDIDATE_IDS - len(ids))
+        if matches is None:
+            return condition
+        ids |= matches
+    # Re-check against the table: the index may hold uncommitted or stale rows
+    return and_(Patient.id.in_(sorted(ids)), condition)
+
+def search_patient_names(query: str, limit: int = PATIENT_SUGGESTION_LIMIT,
+                         threshold: Optional[float] = None,
+                         active_only: bool = True) -> List[Patient]:
+    """Patients whose name is similar to what was typed, best match first.
+
+    Tolerates typos and partial words ("jon smi" finds John Smith); names
+    sharing less than threshold of the typed trigrams are left out.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    threshold = PATIENT_NAME_SIMILARITY if threshold is None else threshold
+    backend = trigram_backend()
+
+    if backend == 'memory':
+        ranked = patient_index().similar(query, threshold, limit, active_only)
+        patients = {patient.id: patient for patient in
+                    Patient.query.filter(Patient.id.in_([patient_id for patient_id, _ in ranked]))}
+        return [patients[patient_id] for patient_id, _ in ranked if patient_id in patients]
+
+    patients = Patient.query
+    if active_only:
+        patients = patients.filter(Patient.active.is_(True))
+    if backend == 'postgresql':
+        # <% uses the GIN index with this threshold; it only lasts for the transaction
+        db.session.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+                           {'threshold': str(threshold)})
+        score = func.word_similarity(query, FULL_NAME)
+        return patients.filter(literal(query).op('<%')(FULL_NAME)).order_by(
+            score.desc(), Patient.family_name, Patient.id).limit(limit).all()
+    return patients.filter(patient_field_match('name', query)).order_by(
+        Patient.family_name, Patient.given_name, Patient.id).limit(limit).all()
@@ -0,0 +1,47 @@
+import logging
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from models import db
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class QueryBudgetExceeded(ValueError):
+    """Raised when a block issues more SQL statements than it is allowed"""
+    def __init__(self, label, limit, statements):
+        self.label = label
+        self.limit = limit
+        self.statements = statements
+        listing = '\n'.join(f'  {statement}' for statement in statements)
+        super().__init__(f'{label} ran {len(statements)} queries, budget is {limit}:\n{listing}')
+
+@contextmanager
+def count_queries(engine=None):
+    """Collect the SQL statements this thread sends while the block runs.
+
+    Yields a list that fills in as statements execute. Other threads on
+    the same engine (the audit writer, job workers) are not counted.
+    """
+    engine = engine or db.engine
+    thread = threading.get_ident()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+@contextmanager
+def query_budget(limit, label='block', engine=None):
+    """Like count_queries, raising QueryBudgetExceeded if more than limit ran"""
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > limit:
+        raise QueryBudgetExceeded(label, limit, statements)
@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import time
+import heapq
+import atexit
+import logging
+import threading
+from collections import namedtuple
+from typing import Dict, List, Optional
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SQL_PROFILE = os.environ.get('SQL_PROFILE', '1').lower() in ('1', 'true', 'yes')
+# Statements slower than this are logged wherever they run
+SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', '100'))
+# How many of the slowest statements are kept per request and per endpoint
+SQL_PROFILE_TOP = int(os.environ.get('SQL_PROFILE_TOP', '5'))
+# X-Query-Count, X-DB-Time-Ms and Server-Timing on every response
+SQL_PROFILE_HEADERS = os.environ.get('SQL_PROFILE_HEADERS', '1').lower() in ('1', 'true', 'yes')
+# Per-endpoint totals are written here at exit; "{pid}" keeps gunicorn workers apart
+SQL_PROFILE_DUMP = os.environ.get('SQL_PROFILE_DUMP', '')
+MAX_STATEMENT_LENGTH = 500
+
+SlowQuery = namedtuple('SlowQuery', ['ms', 'statement'])
+EndpointStats = namedtuple('EndpointStats', ['endpoint', 'requests', 'queries', 'max_queries', 'db_ms',
+                                             'max_db_ms', 'request_ms', 'slowest'])
+
+class RequestProfile:
+    """What one request sent to the database"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.seconds = 0.0
+        self.slowest = []  # min-heap of SlowQuery, at most SQL_PROFILE_TOP
+
+    def record(self, seconds: float, statement: str) -> None:
+        self.queries += 1
+        self.seconds += seconds
+        _keep_slowest(self.slowest, SlowQuery(seconds * 1000, statement))
+
+def _keep_slowest(heap: List[SlowQuery], query: SlowQuery) -> None:
+    if len(heap) < SQL_PROFILE_TOP:
+        heapq.heappush(heap, query)
+    elif query.ms > heap[0].ms:
+        heapq.heapreplace(heap, query)
+
+def _normalize(statement: str) -> str:
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    return statement if len(statement) <= MAX_STATEMENT_LENGTH else statement[:MAX_STATEMENT_LENGTH] + '...'
+
+_totals: Dict[str, dict] = {}
+_totals_lock = threading.Lock()
+_listening = False
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    profile = g.get('query_profile') if has_request_context() else None
+    if profile is not None:
+        profile.record(seconds, _normalize(statement))
+    if seconds * 1000 >= SQL_SLOW_QUERY_MS:
+        where = request.endpoint if has_request_context() else 'background'
+        logger.warning(f"Slow query ({seconds * 1000:.0f} ms) in {where}: {_normalize(statement)}")
+
+def _handle_error(context):
+    # after_cursor_execute never runs for a failed statement
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+def _start_request():
+    g.query_profile = RequestProfile()
+
+def _finish_request(response):
+    # Streamed pages are measured up to their first chunk
+    profile = g.pop('query_profile', None)
+    if profile is None:
+        return response
+    db_ms = profile.seconds * 1000
+    request_ms = (time.perf_counter() - profile.started) * 1000
+    if SQL_PROFILE_HEADERS:
+        response.headers['X-Query-Count'] = str(profile.queries)
+        response.headers['X-DB-Time-Ms'] = f'{db_ms:.1f}'
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{profile.queries} queries"')
+
+    endpoint = request.endpoint or 'unmatched'
+    with _totals_lock:
+        totals = _totals.setdefault(endpoint, {'requests': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0,
+                                               'max_db_ms': 0.0, 'request_ms': 0.0, 'slowest': []})
+        totals['requests'] += 1
+        totals['queries'] += profile.queries
+        totals['max_queries'] = max(totals['max_queries'], profile.queries)
+        totals['db_ms'] += db_ms
+        totals['max_db_ms'] = max(totals['max_db_ms'], db_ms)
+        totals['request_ms'] += request_ms
+        for query in profile.slowest:
+            _keep_slowest(totals['slowest'], query)
+    return response
+
+def init_query_profiler(app) -> None:
+    """Count and time every statement each request sends (SQL_PROFILE=0 turns it off)"""
+    global _listening
+    if not SQL_PROFILE:
+        return
+    if not _listening:
+        # Every engine, so work done outside requests still gets slow-query logging
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+def endpoint_stats() -> List[EndpointStats]:
+    """This process's per-endpoint totals since start (or reset), most DB time first"""
+    with _totals_lock:
+        stats = [EndpointStats(endpoint, slowest=sorted(totals['slowest'], reverse=True),
+                               **{name: value for name, value in totals.items() if name != 'slowest'})
+                 for endpoint, totals in _totals.items()]
+    return sorted(stats, key=lambda stats: stats.db_ms, reverse=True)
+
+def reset_stats() -> None:
+    with _totals_lock:
+        _totals.clear()
+
+def stats_json() -> str:
+    return json.dumps({
+        'pid': os.getpid(),
+        'written_at': time.time(),
+        'endpoints': [{**stats._asdict(), 'slowest': [query._asdict() for query in stats.slowest]}
+                      for stats in endpoint_stats()],
+    }, indent=2)
+
+def dump_stats(path: Optional[str] = None) -> Optional[str]:
+    """Write the per-endpoint totals as JSON; returns the path written"""
+    path = (path or SQL_PROFILE_DUMP).replace('{pid}', str(os.getpid()))
+    if not path or not _totals:
+        return None
+    try:
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            out.write(stats_json())
+        os.replace(tmp_path, path)
+        return path
+    except OSError as e:
+        logger.error(f"Error writing SQL profile to {path}: {str(e)}")
+        return None
+
+atexit.register(dump_stats)
@@ -1,270 +1,194 @@
-from sqlalchemy import or_, and_, not_
-from models import Patient, Document, Condition, ICD10Code
-from functools import lru_cache
+from sqlalchemy import or_, and_, not_, exists
+from sqlalchemy.orm import joinedload, selectinload
+from models import Patient, Document, Condition
+from utils.fulltext import fulltext_match, relevance_order
+from utils.patient_search import patient_field_match
+from utils.htql import BARE_TERM_FIELDS, BoolOp, Not, Term, compile_query, referenced_entities
+from utils.pagination import InvalidCursorError, Page, decode_cursor, estimate_count, keyset_filter
 from flask import current_app
-import re
 
-class HTQLParser:
-    def __init__(self):
-        self.operators = {
-            'AND': and_,
-            'OR': or_,
-            'NOT': not_
-        }
-        
-        self.field_mappings = {
-            'patient': {
-                'name': lambda v: or_(
-                    Patient.family_name.ilike(f'%{v}%'),
-                    Patient.given_name.ilike(f'%{v}%')
-                ),
-                'id': lambda v: Patient.identifier == v,
-                'gender': lambda v: Patient.gender.ilike(f'%{v}%'),
-                'city': lambda v: Patient.city.ilike(f'%{v}%'),
-                'state': lambda v: Patient.state.ilike(f'%{v}%')
-            },
-            'document': {
-                'title': lambda v: Document.title.ilike(f'%{v}%'),
-                'content': lambda v: Document.content.ilike(f'%{v}%'),
-                'transcription': lambda v: Document.transcription.ilike(f'%{v}%')
-            },
-            'condition': {
-                'code': lambda v: Condition.code.ilike(f'%{v}%'),
-                'status': lambda v: Condition.clinical_status.ilike(f'%{v}%'),
-                'severity': lambda v: Condition.severity.ilike(f'%{v}%')
-            }
-        }
+def document_text_match(value, field=None):
+    """Full-text match on one document field, or on title, content and transcription.
 
-    def tokenize(self, query):
-        pattern = r'(?:[^\s"]+|"[^"]*")+|AND|OR|NOT'
-        return [token.strip('"') for token in re.findall(pattern, query)]
+    Multi-word values match as a phrase and a trailing * matches a prefix.
+    """
+    condition = fulltext_match(value, field)
+    if condition is not None:
+        return condition
+    # No full-text index: substring match as before
+    value = value.rstrip('*')
+    if field:
+        return getattr(Document, field).ilike(f'%{value}%')
+    return or_(*(getattr(Document, name).ilike(f'%{value}%')
+                 for name in ('title', 'content', 'transcription')))
 
-    def parse_field(self, field_expr):
-        if ':' not in field_expr:
-            return None, field_expr
-            
-        field, value = field_expr.split(':', 1)
-        field_parts = field.split('.')
-        return field_parts, value.strip('"')
+# SQL predicate for each HTQL field (see utils/htql.py for the field list)
+FIELD_PREDICATES = {
+    ('patient', 'name'): lambda v: patient_field_match('name', v),
+    ('patient', 'id'): lambda v: Patient.identifier == v,
+    ('patient', 'gender'): lambda v: Patient.gender.ilike(f'%{v}%'),
+    ('patient', 'city'): lambda v: patient_field_match('city', v),
+    ('patient', 'state'): lambda v: patient_field_match('state', v),
+    ('document', 'title'): lambda v: Document.title.ilike(f'%{v}%'),
+    ('document', 'content'): lambda v: document_text_match(v, 'content'),
+    ('document', 'transcription'): lambda v: document_text_match(v, 'transcription'),
+    ('document', 'text'): lambda v: document_text_match(v),
+    ('condition', 'code'): lambda v: Condition.code.ilike(f'%{v}%'),
+    ('condition', 'status'): lambda v: Condition.clinical_status.ilike(f'%{v}%'),
+    ('condition', 'severity'): lambda v: Condition.severity.ilike(f'%{v}%'),
+}
 
-    def build_filter(self, query):
-        tokens = self.tokenize(query)
-        filters = []
-        current_operator = 'AND'
-        negate_next = False
-        
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            
-            if token in self.operators:
-                current_operator = token
-                i += 1
-                continue
-                
-            if token == 'NOT':
-                negate_next = True
-                i += 1
-                continue
-            
-            field_parts, value = self.parse_field(token)
-            
-            if field_parts:
-                main_field, *sub_fields = field_parts
-                if main_field in self.field_mappings:
-                    field_mapping = self.field_mappings[main_field]
-                    sub_field = sub_fields[0] if sub_fields else 'name'
-                    
-                    if sub_field in field_mapping:
-                        condition = field_mapping[sub_field](value)
-                        if negate_next:
-                            condition = not_(condition)
-                            negate_next = False
-                            
-                        if filters and current_operator in self.operators:
-                            filters = [self.operators[current_operator](filters[0], condition)]
-                        else:
-                            filters = [condition]
-            else:
-                conditions = []
-                for field_type in self.field_mappings.values():
-                    for field_func in field_type.values():
-                        conditions.append(field_func(value))
-                
-                combined = or_(*conditions)
-                if negate_next:
-                    combined = not_(combined)
-                    negate_next = False
-                    
-                if filters and current_operator in self.operators:
-                    filters = [self.operators[current_operator](filters[0], combined)]
-                else:
-                    filters = [combined]
-            
-            i += 1
-            
-        return filters[0] if filters else None
+ENTITY_MODELS = {'patient': Patient, 'document': Document, 'condition': Condition}
 
-@lru_cache(maxsize=100)
-def get_code_suggestions(prefix, code_type=None):
-    """Get medical code suggestions based on prefix with improved caching"""
-    try:
-        current_app.logger.debug(f'Getting code suggestions for prefix: {prefix}, type: {code_type}')
-        suggestions = []
-        seen_codes = set()
-        
-        # Search the database for ICD-10 codes first with proper error handling
-        if not code_type or code_type.upper() == 'ICD-10':
-            try:
-                db_suggestions = ICD10Code.search_codes(prefix)
-                for code in db_suggestions:
-                    if code.code not in seen_codes:
-                        suggestions.append({
-                            'code': code.code,
-                            'description': code.description,
-                            'system': 'ICD-10',
-                            'category': code.category
-                        })
-                        seen_codes.add(code.code)
-            except Exception as e:
-                current_app.logger.error(f'Error fetching ICD-10 codes: {str(e)}')
-        
-        # Add hardcoded codes if they match the search criteria
-        codes = load_medical_codes()
-        if code_type and code_type.upper() in codes:
-            add_suggestions(code_type.upper(), codes[code_type.upper()], suggestions, seen_codes, prefix)
-        else:
-            for system, system_codes in codes.items():
-                add_suggestions(system, system_codes, suggestions, seen_codes, prefix)
-        
-        # Sort suggestions by relevance and limit results
-        suggestions.sort(key=lambda x: get_sort_key(x, prefix))
-        return suggestions[:10]
-        
-    except Exception as e:
-        current_app.logger.error(f'Error getting code suggestions: {str(e)}')
-        return []
+# How each searched entity reaches the others. Many-to-one relations are
+# joined, as they cannot repeat rows; one-to-many ones are EXISTS semi-joins
+# correlated on the given clause, so results never need DISTINCT.
+RELATIONS = {
+    'patient': {
+        'condition': ('exists', Condition.patient_id == Patient.id),
+        'document': ('exists', Document.patient_id == Patient.id),
+    },
+    'document': {
+        'patient': ('join', Document.patient_id == Patient.id),
+        'condition': ('exists', Condition.patient_id == Document.patient_id),
+    },
+}
 
-def add_suggestions(code_system, codes_dict, suggestions, seen_codes, prefix):
-    """Helper function to add suggestions with improved matching"""
-    prefix_lower = prefix.lower()
-    
-    for code, desc in codes_dict.items():
-        if code not in seen_codes and (
-            code.lower().startswith(prefix_lower) or 
-            desc.lower().find(prefix_lower) != -1 or
-            (len(prefix) >= 3 and any(
-                term.lower().startswith(prefix_lower) 
-                for term in desc.split()
-            ))
-        ):
-            suggestions.append({
-                'code': code,
-                'description': desc,
-                'system': code_system,
-                'category': code.split('.')[0] if '.' in code else code
-            })
-            seen_codes.add(code)
+def flat_condition(node):
+    """Filter for a node as if every table it names were joined in"""
+    if isinstance(node, Term):
+        if node.entity is None:
+            return or_(*(FIELD_PREDICATES[field](node.value) for field in BARE_TERM_FIELDS))
+        return FIELD_PREDICATES[(node.entity, node.field)](node.value)
+    if isinstance(node, Not):
+        return not_(flat_condition(node.operand))
+    combine = and_ if node.op == 'AND' else or_
+    return combine(*(flat_condition(operand) for operand in node.operands))
 
-def get_sort_key(suggestion, prefix):
-    """Enhanced sort key function for better relevance ranking"""
-    code = suggestion['code'].lower()
-    desc = suggestion['description'].lower()
-    prefix_lower = prefix.lower()
-    
-    # Exact code match gets highest priority
-    if code == prefix_lower:
-        return (0, len(code), code)
-    # Code starts with prefix
-    elif code.startswith(prefix_lower):
-        return (1, len(code), code)
-    # Description starts with prefix
-    elif desc.startswith(prefix_lower):
-        return (2, len(desc), code)
-    # Code contains prefix
-    elif code.find(prefix_lower) != -1:
-        return (3, len(code), code)
-    # Description contains prefix
-    else:
-        return (4, len(desc), code)
+def _semi_join(entity, other, condition):
+    kind, correlation = RELATIONS[entity].get(other, ('join', None))
+    if kind == 'exists':
+        return exists().where(correlation, condition)
+    return condition
 
-@lru_cache(maxsize=1)
-def load_medical_codes():
-    """Load ICD-10 and SNOMED CT codes from static dictionary"""
-    codes = {
-        'ICD-10': {
-            'E11': 'Type 2 diabetes mellitus',
-            'E11.0': 'Type 2 diabetes with hyperosmolarity',
-            'E11.1': 'Type 2 diabetes with ketoacidosis',
-            'E11.2': 'Type 2 diabetes with kidney complications',
-            'E11.21': 'Type 2 diabetes with diabetic nephropathy',
-            'E11.22': 'Type 2 diabetes with diabetic chronic kidney disease',
-            'E11.3': 'Type 2 diabetes with ophthalmic complications',
-            'E11.31': 'Type 2 diabetes with background retinopathy',
-            'E11.32': 'Type 2 diabetes with proliferative retinopathy',
-            'E11.4': 'Type 2 diabetes with neurological complications',
-            'I10': 'Essential (primary) hypertension',
-            'I11': 'Hypertensive heart disease',
-            'I11.0': 'Hypertensive heart disease with heart failure',
-            'I11.9': 'Hypertensive heart disease without heart failure',
-            'J45': 'Asthma',
-            'J45.0': 'Predominantly allergic asthma',
-            'J45.1': 'Nonallergic asthma',
-            'J45.2': 'Mixed asthma',
-            'F32': 'Major depressive disorder, single episode',
-            'F41': 'Other anxiety disorders',
-            'F41.0': 'Panic disorder without agoraphobia',
-            'F41.1': 'Generalized anxiety disorder'
-        },
-        'SNOMED-CT': {
-            '44054006': 'Type 2 diabetes mellitus (disorder)',
-            '38341003': 'Hypertensive disorder, systemic arterial (disorder)',
-            '195967001': 'Asthma (disorder)',
-            '370143000': 'Major depression, single episode (disorder)',
-            '197480006': 'Anxiety disorder (disorder)',
-            '371631005': 'Panic disorder (disorder)',
-            '73211009': 'Diabetes mellitus (disorder)',
-            '59621000': 'Essential hypertension (disorder)',
-            '35489007': 'Depressive disorder (disorder)',
-            '69479009': 'Allergic asthma (disorder)'
-        }
-    }
-    return codes
+def build_condition(node, entity):
+    """SQL filter for an HTQL AST node when searching entity.
 
-def search_patients(query):
-    """Search patients using HTQL query"""
-    try:
-        current_app.logger.debug(f'Searching patients with query: {query}')
-        parser = HTQLParser()
-        filter_condition = parser.build_filter(query)
-        if filter_condition is not None:
-            return Patient.query.join(
-                Condition, 
-                Patient.id == Condition.patient_id, 
-                isouter=True
-            ).filter(filter_condition).distinct().all()
-        return Patient.query.all()
-    except Exception as e:
-        current_app.logger.error(f'Error searching patients: {str(e)}')
-        return []
+    A subtree that only filters one child table becomes a single EXISTS, so
+    its terms hold for the same child row: condition.code:F32 AND
+    condition.status:active finds patients with an active F32 condition,
+    and NOT condition.code:F32 patients with no F32 condition at all.
+    """
+    entities = referenced_entities(node)
+    if len(entities) == 1 and not isinstance(node, Not):
+        return _semi_join(entity, next(iter(entities)), flat_condition(node))
+    if isinstance(node, Term):
+        # A bare term: one EXISTS per child table it searches
+        by_entity = {}
+        for field in BARE_TERM_FIELDS:
+            by_entity.setdefault(field[0], []).append(FIELD_PREDICATES[field](node.value))
+        return or_(*(_semi_join(entity, other, or_(*predicates))
+                     for other, predicates in by_entity.items()))
+    if isinstance(node, Not):
+        return not_(build_condition(node.operand, entity))
+    combine = and_ if node.op == 'AND' else or_
+    return combine(*(build_condition(operand, entity) for operand in node.operands))
 
-def search_documents(query):
-    """Search documents using HTQL query"""
-    try:
-        current_app.logger.debug(f'Searching documents with query: {query}')
-        parser = HTQLParser()
-        filter_condition = parser.build_filter(query)
-        if filter_condition is not None:
-            return Document.query.join(
-                Patient, 
-                Document.patient_id == Patient.id,
-                isouter=True
-            ).join(
-                Condition,
-                Patient.id == Condition.patient_id,
-                isouter=True
-            ).filter(filter_condition).distinct().all()
-        return Document.query.all()
-    except Exception as e:
-        current_app.logger.error(f'Error searching documents: {str(e)}')
-        return []
+def _required_entities(ast):
+    """Entities every match must have a row in: those constrained by a
+    positive top-level conjunct that touches no other entity"""
+    conjuncts = ast.operands if isinstance(ast, BoolOp) and ast.op == 'AND' else (ast,)
+    required = set()
+    for conjunct in conjuncts:
+        entities = referenced_entities(conjunct)
+        if len(entities) == 1 and not _has_not(conjunct):
+            required |= entities
+    return required
+
+def _has_not(node):
+    if isinstance(node, Term):
+        return False
+    if isinstance(node, Not):
+        return True
+    return any(_has_not(operand) for operand in node.operands)
+
+def plan_query(entity, compiled):
+    """Query for the searched entity touching only the tables the predicates use.
+
+    Joined tables a match must have a row in are inner joined so the database
+    can filter them first; the rest are outer joined. Child tables are only
+    probed through EXISTS.
+    """
+    model = ENTITY_MODELS[entity]
+    query = model.query
+    if compiled is None:
+        return query
+
+    required = _required_entities(compiled.ast)
+    for other, (kind, onclause) in RELATIONS[entity].items():
+        if kind == 'join' and other in compiled.entities:
+            query = query.join(ENTITY_MODELS[other], onclause, isouter=other not in required)
+    return query.filter(build_condition(compiled.ast, entity))
+
+SEARCH_PAGE_SIZE = 50
+MAX_SEARCH_PAGE_SIZE = 200
+
+# Keyset sort orders; idx_patient_name covers the patient one
+PATIENT_ORDER = (Patient.family_name, Patient.given_name, Patient.id)
+
+def search_patients(query, cursor=None, limit=SEARCH_PAGE_SIZE):
+    """One page of patients matching an HTQL query, ordered by name.
+
+    The query and cursor are checked immediately (HTQLSyntaxError,
+    InvalidCursorError); rows are only fetched when the page is used, and
+    database errors are raised then rather than shown as no results.
+    """
+    current_app.logger.debug(f'Searching patients with query: {query}')
+    matches = plan_query('patient', compile_query(query))
+    after = decode_cursor(cursor)
+    page = matches.filter(keyset_filter(PATIENT_ORDER, after)) if after else matches
+
+    def fetch(count):
+        return page.options(selectinload(Patient.conditions)).order_by(*PATIENT_ORDER).limit(count).all()
+
+    return Page(fetch, limit, key=lambda patient: [patient.family_name, patient.given_name, patient.id],
+                count=lambda: estimate_count(matches))
+
+def search_documents(query, cursor=None, limit=SEARCH_PAGE_SIZE):
+    """One page of documents matching an HTQL query.
+
+    Queries with full-text terms are ordered best match first, ties newest
+    first; the database scores, sorts and pages the matches, keyed on
+    (score, id). Other queries list the newest documents first.
+    """
+    current_app.logger.debug(f'Searching documents with query: {query}')
+    compiled = compile_query(query)
+    matches = plan_query('document', compiled)
+    after = decode_cursor(cursor)
+    ranked = relevance_order(matches, list(compiled.text_terms)) if compiled and compiled.text_terms else None
+
+    if ranked is None:
+        page = matches.filter(keyset_filter((Document.id,), after, descending=True)) if after else matches
+
+        def fetch(count):
+            return page.options(joinedload(Document.patient)).order_by(
+                Document.id.desc()).limit(count).all()
+
+        return Page(fetch, limit, key=lambda document: [document.id],
+                    count=lambda: estimate_count(matches))
+
+    ranked, score = ranked
+    if after is not None and not (len(after) == 2 and all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) for value in after)):
+        raise InvalidCursorError('Invalid page cursor')
+    page = ranked.filter(keyset_filter((score, Document.id), after, descending=True)) if after else ranked
+    scores = {}
+
+    def fetch(count):
+        rows = page.add_columns(score).options(joinedload(Document.patient)).order_by(
+            score.desc(), Document.id.desc()).limit(count).all()
+        scores.update((document.id, value) for document, value in rows)
+        return [document for document, _ in rows]
+
+    return Page(fetch, limit, key=lambda document: [scores[document.id], document.id],
+                count=lambda: estimate_count(matches))
@@ -0,0 +1,193 @@
+import os
+import json
+import atexit
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+from utils.metrics import record_cache_lookup
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One SQLite file shared by every worker on the host; empty disables the cache
+SUGGESTION_CACHE_PATH = os.environ.get('SUGGESTION_CACHE_PATH',
+                                       os.path.join(tempfile.gettempdir(), 'bh-suggestion-cache.db'))
+SUGGESTION_CACHE_TTL = int(os.environ.get('SUGGESTION_CACHE_TTL', '3600'))
+# Empty results expire sooner: a code may be imported before the version is bumped elsewhere
+SUGGESTION_NEGATIVE_TTL = int(os.environ.get('SUGGESTION_NEGATIVE_TTL', '300'))
+SUGGESTION_CACHE_MAX_ENTRIES = int(os.environ.get('SUGGESTION_CACHE_MAX_ENTRIES', '50000'))
+# Seconds between flushes of this process's counters into the shared totals
+STATS_FLUSH_INTERVAL = 10
+EVICT_EVERY_STORES = 500
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS entry (key TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+    "value TEXT NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_entry_expires ON entry (expires_at)",
+    "CREATE TABLE IF NOT EXISTS version (namespace TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS stat (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+]
+
+STAT_NAMES = ('hits', 'negative_hits', 'misses', 'stores', 'stale_skips', 'evictions', 'invalidations', 'errors')
+
+_local = threading.local()
+_stats = dict.fromkeys(STAT_NAMES, 0)
+_stats_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += amount
+
+def namespace_for(url) -> str:
+    """Cache namespace for a database, so two databases never share entries"""
+    return hashlib.sha1(str(url).encode()).hexdigest()[:12]
+
+def _connection() -> Optional[sqlite3.Connection]:
+    if not SUGGESTION_CACHE_PATH:
+        return None
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(SUGGESTION_CACHE_PATH, timeout=1, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            conn.execute(statement)
+        _local.conn = conn
+    return conn
+
+def current_version(namespace: str) -> int:
+    """The namespace's code set version; bumped whenever its codes change"""
+    try:
+        conn = _connection()
+        if conn is None:
+            return 0
+        row = conn.execute("SELECT value FROM version WHERE namespace = ?", (namespace,)).fetchone()
+        return row[0] if row else 0
+    except sqlite3.Error as e:
+        _count('errors')
+        logger.error(f"Suggestion cache version lookup failed: {str(e)}")
+        return 0
+
+def bump_version(namespace: str) -> None:
+    """Invalidate every process's cached suggestions for the namespace"""
+    try:
+        conn = _connection()
+        if conn is None:
+            return
+        conn.execute("INSERT INTO version (namespace, value) VALUES (?, 1) "
+                     "ON CONFLICT (namespace) DO UPDATE SET value = value + 1", (namespace,))
+        _count('invalidations')
+    except sqlite3.Error as e:
+        _count('errors')
+        logger.error(f"Suggestion cache invalidation failed: {str(e)}")
+
+def get(key: str, version: int) -> Optional[Any]:
+    """Cached value stored under this version, or None"""
+    try:
+        conn = _connection()
+        if conn is None:
+            return None
+        row = conn.execute("SELECT version, value, expires_at FROM entry WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        _count('errors')
+        logger.error(f"Suggestion cache lookup failed: {str(e)}")
+        return None
+    finally:
+        _maybe_flush()
+    if row is None or row[0] != version or row[2] <= time.time():
+        _count('misses')
+        record_cache_lookup('code_suggestions', 'miss')
+        return None
+    value = json.loads(row[1])
+    _count('hits' if value else 'negative_hits')
+    record_cache_lookup('code_suggestions', 'hit')
+    return value
+
+def put(key: str, version: int, value: Any) -> None:
+    ttl = SUGGESTION_CACHE_TTL if value else SUGGESTION_NEGATIVE_TTL
+    try:
+        conn = _connection()
+        if conn is None:
+            return
+        conn.execute("INSERT OR REPLACE INTO entry (key, version, value, expires_at) VALUES (?, ?, ?, ?)",
+                     (key, version, json.dumps(value, separators=(',', ':')), time.time() + ttl))
+    except sqlite3.Error as e:
+        _count('errors')
+        logger.error(f"Suggestion cache store failed: {str(e)}")
+        return
+    with _stats_lock:
+        _stats['stores'] += 1
+        evict = _stats['stores'] % EVICT_EVERY_STORES == 0
+    if evict:
+        _evict(conn)
+
+def skip_stale() -> None:
+    """Count a result not stored because it came from an index older than the version"""
+    _count('stale_skips')
+
+def _evict(conn: sqlite3.Connection) -> None:
+    """Drop expired entries, then the soonest to expire above the size bound"""
+    try:
+        removed = conn.execute("DELETE FROM entry WHERE expires_at <= ?", (time.time(),)).rowcount
+        overflow = conn.execute("SELECT count(*) FROM entry").fetchone()[0] - SUGGESTION_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            removed += conn.execute("DELETE FROM entry WHERE key IN (SELECT key FROM entry "
+                                    "ORDER BY expires_at LIMIT ?)", (overflow,)).rowcount
+        _count('evictions', removed)
+    except sqlite3.Error as e:
+        _count('errors')
+        logger.error(f"Suggestion cache eviction failed: {str(e)}")
+
+def _maybe_flush(force: bool = False) -> None:
+    """Add this process's counters to the shared totals every few seconds"""
+    global _flushed_at
+    if not SUGGESTION_CACHE_PATH:
+        return
+    if not force and time.monotonic() - _flushed_at < STATS_FLUSH_INTERVAL:
+        return
+    with _stats_lock:
+        pending = {name: count for name, count in _stats.items() if count}
+        for name in pending:
+            _stats[name] = 0
+        _flushed_at = time.monotonic()
+    if not pending:
+        return
+    try:
+        conn = _connection()
+        conn.executemany("INSERT INTO stat (name, value) VALUES (?, ?) "
+                         "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", pending.items())
+    except sqlite3.Error as e:
+        logger.error(f"Suggestion cache stats flush failed: {str(e)}")
+        with _stats_lock:
+            for name, count in pending.items():
+                _stats[name] += count
+
+# Short-lived processes (imports, scripts) still add to the totals
+atexit.register(_maybe_flush, True)
+
+def cache_stats() -> Dict[str, Any]:
+    """Counters summed over every process sharing the cache, with the hit rate"""
+    stats = dict.fromkeys(STAT_NAMES, 0)
+    stats['entries'] = 0
+    stats['enabled'] = bool(SUGGESTION_CACHE_PATH)
+    if SUGGESTION_CACHE_PATH:
+        _maybe_flush(force=True)
+        try:
+            conn = _connection()
+            stats.update(conn.execute("SELECT name, value FROM stat").fetchall())
+            stats['entries'] = conn.execute("SELECT count(*) FROM entry").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Suggestion cache stats lookup failed: {str(e)}")
+    with _stats_lock:
+        for name, count in _stats.items():
+            stats[name] += count
+    hits = stats['hits'] + stats['negative_hits']
+    lookups = hits + stats['misses']
+    stats['hit_rate'] = hits / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,292 @@
+import io
+import os
+import time
+import wave
+import threading
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+from utils.llm import get_client
+from utils.audio_chunks import iter_audio_windows, join_transcript, cached_audio_path
+from utils.metrics import record_transcription
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WHISPER_MODEL = os.environ.get('WHISPER_MODEL', 'base')
+# 'openai' uses the hosted whisper-1 API, 'local' the openai-whisper package
+TRANSCRIPTION_BACKEND = os.environ.get('TRANSCRIPTION_BACKEND', 'openai')
+# Address of a dedicated transcription process, e.g. /tmp/bh-transcription.sock
+TRANSCRIPTION_SERVER = os.environ.get('TRANSCRIPTION_SERVER')
+TRANSCRIPTION_TIMEOUT = 600  # seconds
+# Long recordings are transcribed as windows spread across a process pool
+# (hosted APIs) or a thread pool (the shared local model or the server)
+TRANSCRIPTION_WINDOW_SECONDS = float(os.environ.get('TRANSCRIPTION_WINDOW_SECONDS', 30))
+TRANSCRIPTION_OVERLAP_SECONDS = float(os.environ.get('TRANSCRIPTION_OVERLAP_SECONDS', 2))
+TRANSCRIPTION_PROCESSES = int(os.environ.get('TRANSCRIPTION_PROCESSES', 2))
+
+# A file path, or an in-memory WAV file such as an AudioWindow's audio
+AudioSource = Union[str, bytes]
+
+_model = None
+_model_lock = threading.Lock()
+# Whisper models are not safe to call from several threads at once
+_transcribe_lock = threading.Lock()
+# Window pools live as long as the process; see _window_pool
+_pools = {}
+_pools_lock = threading.Lock()
+# Backends that are a network call per window and hold no model
+API_BACKENDS = ('openai', 'google')
+
+class TranscriptionError(Exception):
+    """Raised when the transcription server reports a failure"""
+
+def _authkey() -> bytes:
+    authkey = os.environ.get('TRANSCRIPTION_AUTHKEY')
+    if not authkey:
+        raise ValueError('TRANSCRIPTION_AUTHKEY must be set to use the transcription server')
+    return authkey.encode('utf-8')
+
+def get_model():
+    """Load the local Whisper model on first use and share it across threads"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import whisper
+                start = time.perf_counter()
+                _model = whisper.load_model(WHISPER_MODEL)
+                logger.info(f"Loaded Whisper '{WHISPER_MODEL}' model in {time.perf_counter() - start:.1f}s")
+    return _model
+
+def model_loaded() -> bool:
+    return _model is not None
+
+def _wav_samples(audio: bytes):
+    """Whisper takes 16 kHz mono float samples directly, skipping its own ffmpeg decode"""
+    import numpy as np
+    with wave.open(io.BytesIO(audio), 'rb') as wav:
+        frames = wav.readframes(wav.getnframes())
+    return np.frombuffer(frames, np.int16).astype(np.float32) / 32768.0
+
+def transcribe_local(audio: AudioSource) -> str:
+    """Transcribe with the in-process Whisper model"""
+    model = get_model()
+    if isinstance(audio, bytes):
+        audio = _wav_samples(audio)
+    with _transcribe_lock:
+        result = model.transcribe(audio)
+    return result["text"]
+
+def transcribe_remote(audio: AudioSource, address: str) -> str:
+    """Submit audio to the dedicated transcription process"""
+    if isinstance(audio, bytes):
+        request = {'audio': audio}
+    else:
+        request = {'path': os.path.abspath(audio)}
+    with Client(address, authkey=_authkey()) as conn:
+        conn.send(request)
+        response = conn.recv()
+    if 'error' in response:
+        raise TranscriptionError(response['error'])
+    return response['text']
+
+def transcribe_openai(audio: AudioSource) -> str:
+    if isinstance(audio, bytes):
+        return get_client().audio.transcriptions.create(
+            model="whisper-1",
+            file=('audio.wav', audio),
+            response_format="text",
+            timeout=TRANSCRIPTION_TIMEOUT
+        )
+    with open(audio, 'rb') as audio_file:
+        return get_client().audio.transcriptions.create(
+            model="whisper-1",
+            file=audio_file,
+            response_format="text",
+            timeout=TRANSCRIPTION_TIMEOUT
+        )
+
+def transcribe_google(audio: AudioSource) -> str:
+    """Transcribe with the SpeechRecognition Google Web Speech backend"""
+    import speech_recognition as sr
+    recognizer = sr.Recognizer()
+    with sr.AudioFile(io.BytesIO(audio) if isinstance(audio, bytes) else audio) as source:
+        audio = recognizer.record(source)
+    try:
+        return recognizer.recognize_google(audio)
+    except sr.UnknownValueError:
+        # Nothing intelligible in this stretch, e.g. a silent window
+        return ''
+
+def transcribe_audio(audio: AudioSource, backend: Optional[str] = None) -> str:
+    """Transcribe an audio file or in-memory WAV with the configured engine"""
+    backend = backend or TRANSCRIPTION_BACKEND
+    start = time.perf_counter()
+    text = _transcribe(audio, backend)
+    record_transcription(backend, time.perf_counter() - start, _source_duration(audio))
+    return text
+
+def _source_duration(audio: AudioSource) -> Optional[float]:
+    if not isinstance(audio, bytes):
+        return audio_duration(audio)
+    try:
+        with wave.open(io.BytesIO(audio), 'rb') as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except wave.Error:
+        return None
+
+def _transcribe(audio: AudioSource, backend: str) -> str:
+    if backend == 'openai':
+        return transcribe_openai(audio)
+    if backend == 'google':
+        return transcribe_google(audio)
+    if TRANSCRIPTION_SERVER:
+        return transcribe_remote(audio, TRANSCRIPTION_SERVER)
+    return transcribe_local(audio)
+
+def _window_pool(backend: str) -> Executor:
+    """The long-lived pool windows for this backend are submitted to.
+
+    API backends get a spawn-context process pool whose workers hold only an
+    API client. Local windows go to threads instead, so every window shares
+    the one lazily loaded model, or the transcription server's, rather than
+    each pool process loading its own copy.
+    """
+    kind = 'process' if backend in API_BACKENDS else 'thread'
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            if kind == 'process':
+                pool = ProcessPoolExecutor(max_workers=TRANSCRIPTION_PROCESSES,
+                                           mp_context=multiprocessing.get_context('spawn'))
+            else:
+                pool = ThreadPoolExecutor(max_workers=TRANSCRIPTION_PROCESSES,
+                                          thread_name_prefix='transcription')
+            _pools[kind] = pool
+    return pool
+
+def _discard_pool(pool: Executor) -> None:
+    """Forget a pool whose worker died, so the next recording starts a new one"""
+    with _pools_lock:
+        for kind, current in list(_pools.items()):
+            if current is pool:
+                del _pools[kind]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def stream_transcription(file_path: str, backend: Optional[str] = None,
+                         is_finished: Optional[Callable[[], bool]] = None) -> Iterator[Dict[str, Any]]:
+    """Transcribe a recording window by window, yielding partial transcripts.
+
+    Windows are transcribed in parallel on a pool shared by every recording
+    in this process (see _window_pool) but yielded in order, each with the
+    de-duplicated text it added and the transcript so far. Windows are
+    decoded PCM held in memory and at most two per pool worker are in
+    flight, so nothing is written to disk and memory does not grow with
+    recording length.
+
+    is_finished lets transcription start on a file that is still being
+    uploaded; see iter_audio_windows.
+    """
+    backend = backend or TRANSCRIPTION_BACKEND
+    pool = _window_pool(backend)
+    transcript = ''
+    pending = deque()
+    windows = iter_audio_windows(file_path,
+                                 window_seconds=TRANSCRIPTION_WINDOW_SECONDS,
+                                 overlap_seconds=TRANSCRIPTION_OVERLAP_SECONDS,
+                                 is_finished=is_finished)
+
+    def collect():
+        nonlocal transcript
+        window, future = pending.popleft()
+        try:
+            text = future.result()
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+        transcript, added = join_transcript(transcript, text, window.overlap)
+        return {
+            'index': window.index,
+            'start': window.start,
+            'end': window.end,
+            'text': added,
+            'transcript': transcript
+        }
+
+    try:
+        for window in windows:
+            pending.append((window, pool.submit(transcribe_audio, window.audio, backend)))
+            while pending and (pending[0][1].done() or len(pending) >= TRANSCRIPTION_PROCESSES * 2):
+                yield collect()
+        while pending:
+            yield collect()
+    finally:
+        # The pool outlives this recording; drop what an abandoned stream queued
+        for _, future in pending:
+            future.cancel()
+
+def transcribe_chunked(file_path: str, backend: Optional[str] = None) -> str:
+    """Transcribe a recording of any length and return the stitched text"""
+    transcript = ''
+    for update in stream_transcription(file_path, backend):
+        transcript = update['transcript']
+    return transcript
+
+def audio_duration(file_path: str) -> Optional[float]:
+    """Duration in seconds when known without decoding, used for progress reporting"""
+    # Compressed uploads that were decoded before have a normalized copy
+    candidates = [file_path] if file_path.lower().endswith('.wav') else []
+    candidates.append(cached_audio_path(file_path))
+    for path in candidates:
+        if not path or not os.path.exists(path):
+            continue
+        try:
+            with wave.open(path, 'rb') as wav:
+                return wav.getnframes() / float(wav.getframerate())
+        except wave.Error:
+            continue
+    return None
+
+def _handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        audio = request['audio'] if 'audio' in request else request['path']
+        start = time.perf_counter()
+        text = transcribe_local(audio)
+        label = request.get('path', f"{len(audio)} bytes of audio")
+        logger.info(f"Transcribed {label} in {time.perf_counter() - start:.1f}s")
+        return {'text': text}
+    except Exception as e:
+        logger.error(f"Transcription request failed: {str(e)}")
+        return {'error': str(e)}
+
+def serve(address: str) -> None:
+    """Run the dedicated transcription process.
+
+    The model is loaded once here, so web workers can submit files over the
+    local socket instead of each holding their own copy in memory.
+    """
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)
+    get_model()
+    with Listener(address, authkey=_authkey()) as listener:
+        logger.info(f"Transcription server listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logger.error(f"Rejected transcription client: {str(e)}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn,), daemon=True).start()
+
+def _serve_connection(conn) -> None:
+    with conn:
+        try:
+            conn.send(_handle_request(conn.recv()))
+        except (EOFError, OSError) as e:
+            logger.error(f"Transcription client disconnected: {str(e)}")
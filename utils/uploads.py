@@ -0,0 +1,116 @@
+import os
+import fcntl
+import logging
+from datetime import datetime
+from typing import BinaryIO, Optional
+from sqlalchemy.orm import Session
+from models import db, AudioUpload, Document
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Total size of one resumable upload; each chunk request stays under MAX_CONTENT_LENGTH
+AUDIO_UPLOAD_MAX_BYTES = int(os.environ.get('AUDIO_UPLOAD_MAX_BYTES', 512 * 1024 * 1024))
+COPY_BUFFER_SIZE = 64 * 1024
+
+UPLOAD_EXTENSIONS = {
+    'audio/webm': 'webm',
+    'audio/ogg': 'ogg',
+    'audio/mp4': 'm4a',
+    'audio/mpeg': 'mp3',
+    'audio/wav': 'wav',
+    'audio/x-wav': 'wav',
+}
+
+class UploadOffsetError(Exception):
+    """Raised when a chunk does not start at the end of the data received so far"""
+
+    def __init__(self, offset: int):
+        super().__init__(f'Upload is at offset {offset}')
+        self.offset = offset
+
+class UploadTooLargeError(Exception):
+    """Raised when a chunk would take the upload past AUDIO_UPLOAD_MAX_BYTES"""
+
+def upload_path(upload: AudioUpload, upload_folder: str) -> str:
+    return os.path.join(upload_folder, upload.filename)
+
+def upload_offset(upload: AudioUpload, upload_folder: str) -> int:
+    """Bytes stored on disk, which is what a client resumes from"""
+    try:
+        return os.path.getsize(upload_path(upload, upload_folder))
+    except FileNotFoundError:
+        return 0
+
+def create_upload(document: Document, user_id: int, mime_type: Optional[str],
+                  upload_folder: str) -> AudioUpload:
+    """Start a resumable upload with an empty file in the uploads folder"""
+    base_type = (mime_type or 'audio/webm').split(';')[0].strip().lower()
+    extension = UPLOAD_EXTENSIONS.get(base_type, 'webm')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"doc_{document.id}_{timestamp}.{extension}"
+
+    os.makedirs(upload_folder, exist_ok=True)
+    open(os.path.join(upload_folder, filename), 'wb').close()
+
+    upload = AudioUpload(
+        document_id=document.id,
+        user_id=user_id,
+        filename=filename,
+        mime_type=base_type
+    )
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+def append_chunk(upload: AudioUpload, offset: int, stream: BinaryIO, upload_folder: str) -> int:
+    """Append a request body to the upload file and return the new offset.
+
+    The data is copied in small buffers and only ever appended. A per-file lock
+    serializes concurrent requests, and the file size is the source of truth
+    for the offset, so a chunk interrupted mid-transfer can be resumed from
+    wherever it stopped.
+    """
+    with open(upload_path(upload, upload_folder), 'ab') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        size = f.seek(0, os.SEEK_END)
+        if size != offset:
+            raise UploadOffsetError(size)
+        try:
+            while True:
+                data = stream.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                if size + len(data) > AUDIO_UPLOAD_MAX_BYTES:
+                    f.truncate(offset)
+                    size = offset
+                    raise UploadTooLargeError(f'Uploads are limited to {AUDIO_UPLOAD_MAX_BYTES} bytes')
+                f.write(data)
+                size += len(data)
+            f.flush()
+        finally:
+            upload.bytes_received = size
+            db.session.commit()
+    return size
+
+def complete_upload(upload: AudioUpload, size: int, upload_folder: str) -> None:
+    """Mark the upload finished once the client confirms its total size"""
+    offset = upload_offset(upload, upload_folder)
+    if offset != size:
+        raise UploadOffsetError(offset)
+    upload.bytes_received = offset
+    upload.status = 'complete'
+    upload.completed_at = datetime.utcnow()
+    db.session.commit()
+    logger.info(f"Audio upload {upload.id} complete ({offset} bytes)")
+
+def upload_complete(upload_id: int) -> bool:
+    """Check an upload's status outside the caller's transaction.
+
+    The worker polls this while transcribing, so it must see commits made by
+    the web process after the worker's own transaction started.
+    """
+    with Session(db.engine) as session:
+        status = session.query(AudioUpload.status).filter_by(id=upload_id).scalar()
+    return status != 'open'
@@ -0,0 +1,17 @@
+import argparse
+from app import app
+from utils.jobs import run_worker
+
+def main():
+    parser = argparse.ArgumentParser(description='Process queued audio transcription and analysis jobs')
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help='Seconds to wait between polls when the queue is empty')
+    parser.add_argument('--once', action='store_true',
+                        help='Exit once the queue is empty instead of polling forever')
+    args = parser.parse_args()
+
+    with app.app_context():
+        run_worker(poll_interval=args.poll_interval, once=args.once)
+
+if __name__ == '__main__':
+    main()